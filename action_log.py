@@ -0,0 +1,49 @@
+import json
+
+# Codes that start each action, followed by the player ids, territory indices and counts the action needs
+BATTLE, CLAIM, DRAW, MOVE, PLACE, REINFORCE, TURN = range(7)
+FORMAT_VERSION = 1
+
+
+class ActionLog:
+    """
+    Every action that changes a game, recorded as a tuple of integers: a code, then player ids, territory indices
+    and counts. Battles are logged with the armies they defeated and card draws with the card drawn, so a game can
+    be replayed exactly from its log without rolling any dice, whichever players made the decisions.
+
+    BATTLE       attacking territory, defending territory, attacking count, defending count, armies defeated
+    CLAIM        player, territory, armies
+    DRAW         player, card
+    MOVE         from territory, to territory, armies
+    PLACE        player, territory, armies (initial reinforcements, taken from the player's army count)
+    REINFORCE    territory, armies
+    TURN         player
+    """
+
+    def __init__(self, actions=None):
+        self.actions = actions if actions is not None else []
+
+    def __iter__(self):
+        return iter(self.actions)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def record(self, *action):
+        self.actions.append(action)
+
+    def save(self, path, title=''):
+        with open(path, 'w') as f:
+            json.dump({'version': FORMAT_VERSION, 'title': title, 'actions': self.actions}, f, separators=(',', ':'))
+
+    # Drops the actions recorded after the first length, as when moves are undone
+    def truncate(self, length):
+        del self.actions[length:]
+
+
+def load_action_log(path):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data['version'] != FORMAT_VERSION:
+        raise Exception('{} was saved with an unsupported format version'.format(path))
+    return ActionLog([tuple(action) for action in data['actions']])
@@ -0,0 +1,97 @@
+import asyncio
+from collections import namedtuple
+
+INVALID_NUMBER_MESSAGE = 'Oops, looks like that wasn\'t a valid number.'
+
+# Decision a human player has to make, answered with a whole number from 0 to limit, optionally by choosing from a
+# numbered list of territories
+NumberRequest = namedtuple('NumberRequest', ['player', 'query', 'limit', 'territories'], defaults=[None])
+
+
+class AsyncInputProvider:
+    """
+    Answers the decisions of human players in games played with play_async, so that games waiting on their
+    players interleave on one event loop instead of each blocking a thread. Subclasses read answers with read and
+    show messages with write, both for the player being asked. request_number lists the territories to choose
+    from, if any, and asks again until the answer is a valid number.
+    """
+
+    # Answer of the player to query, as the text they entered, which every provider has to supply
+    async def read(self, player, query):
+        raise NotImplementedError('{} does not read answers from players'.format(type(self).__name__))
+
+    async def request_number(self, request):
+        if request.territories is not None:
+            await self.write(request.player, '\n'.join(['\n'] + territory_lines(request.territories) + ['\n']))
+        while True:
+            number = parse_number(await self.read(request.player, request.query), request.limit)
+            if number is not None:
+                return number
+            await self.write(request.player, INVALID_NUMBER_MESSAGE)
+
+    # Shows message to the player
+    async def write(self, player, message):
+        pass
+
+
+class ConsoleInputProvider(AsyncInputProvider):
+    """
+    Reads answers from standard input on a worker thread of the event loop, which is shared by every game on the
+    loop since there is only one console.
+    """
+
+    async def read(self, player, query):
+        return await asyncio.get_running_loop().run_in_executor(None, input, query)
+
+    async def write(self, player, message):
+        print(message)
+
+
+class QueueInputProvider(AsyncInputProvider):
+    """
+    Answers are put in with answer, as they arrive from wherever players make their decisions, and wait in a
+    queue for each player until the game asks for them. Messages and queries for each player are collected in
+    messages.
+    """
+
+    def __init__(self):
+        self.answers = dict()
+        self.messages = dict()
+
+    def answer(self, player_name, text):
+        self.queue(player_name).put_nowait(text)
+
+    def queue(self, player_name):
+        if player_name not in self.answers:
+            self.answers[player_name] = asyncio.Queue()
+        return self.answers[player_name]
+
+    async def read(self, player, query):
+        self.messages.setdefault(player.name, []).append(query)
+        return await self.queue(player.name).get()
+
+    async def write(self, player, message):
+        self.messages.setdefault(player.name, []).append(message)
+
+
+# Whole number from 0 to limit written in text, or None if text is anything else
+def parse_number(text, limit):
+    text = text.strip()
+    if text.isnumeric() and 0 <= int(text) <= limit:
+        return int(text)
+    return None
+
+
+# Numbered list of territories for a player to choose from
+def territory_lines(territory_list):
+    lines = []
+    for i, territory in enumerate(territory_list):
+        occupant = territory.occupying_player.name if territory.occupying_player else 'unoccupied'
+        lines.append('[{}] {}, {} -- {}, {} armies'.format(
+            i,
+            territory.name,
+            territory.continent,
+            occupant,
+            territory.occupying_armies,
+        ))
+    return lines
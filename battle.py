@@ -0,0 +1,174 @@
+from functools import lru_cache
+from itertools import product
+
+import numpy
+
+ATTACK_DICE_MAX = 3
+DEFEND_DICE_MAX = 2
+DIE_FACES = 6
+
+
+class BattleOdds:
+    ARMY_LIMIT = 256
+    INITIAL_SIZE = 32
+
+    """
+    Exact odds of a battle fought to the end, where the attacker always rolls as many dice as the attacking
+    territory allows and the defender as many as the defending territory allows, as computer players do. The
+    attacking count is the number of armies in the attacking territory, one of which must always stay behind.
+
+    Odds are solved once with a Markov chain over the dice rules of compare_rolls and kept in a table that
+    grows on demand up to army_limit. Larger battles are scaled down proportionally to fit within the table.
+    """
+
+    def __init__(self, army_limit=ARMY_LIMIT):
+        self.army_limit = army_limit
+        self.size = 0
+        self.win_probabilities = None
+        self.expected_attackers = None
+        self.expected_defenders = None
+
+    # Odds of conquest for arrays of battles at once, scaled to fit the table the same way as single battles
+    def conquest_probabilities(self, attacking_counts, defending_counts):
+        attacking_counts = numpy.asarray(attacking_counts)
+        defending_counts = numpy.asarray(defending_counts)
+        # Battles already decided need no table, which may not have been solved yet
+        if ((defending_counts == 0) | (attacking_counts <= 1)).all():
+            return (defending_counts == 0).astype(float)
+        largest = numpy.maximum(attacking_counts, defending_counts)
+        oversized = largest > self.army_limit
+        scale = numpy.where(oversized, largest / self.army_limit, 1)
+        # Scaling never takes the last attacker able to attack or the last defender
+        attacking_counts = numpy.where(
+            oversized, numpy.maximum(numpy.rint(attacking_counts / scale), numpy.minimum(attacking_counts, 2)),
+            attacking_counts,
+        ).astype(numpy.int64)
+        defending_counts = numpy.where(
+            oversized, numpy.maximum(numpy.rint(defending_counts / scale), numpy.minimum(defending_counts, 1)),
+            defending_counts,
+        ).astype(numpy.int64)
+        self.grow(min(int(largest.max()), self.army_limit))
+        return self.win_probabilities[attacking_counts, defending_counts]
+
+    def conquest_probability(self, attacking_count, defending_count):
+        if defending_count == 0 or attacking_count <= 1:
+            return 1.0 if defending_count == 0 else 0.0
+        a, d, _ = self.table_index(attacking_count, defending_count)
+        return float(self.win_probabilities[a, d])
+
+    # Expected armies left in the attacking and defending territories once the battle is over
+    def expected_remaining(self, attacking_count, defending_count):
+        if defending_count == 0 or attacking_count <= 1:
+            return float(attacking_count), float(defending_count)
+        a, d, scale = self.table_index(attacking_count, defending_count)
+        return float(self.expected_attackers[a, d]) * scale, float(self.expected_defenders[a, d]) * scale
+
+    # Solves the table again, doubling its size until it holds battles of largest armies
+    def grow(self, largest):
+        if largest > self.size:
+            size = max(self.size, self.INITIAL_SIZE)
+            while size < largest:
+                size *= 2
+            self.solve(min(size, self.army_limit))
+
+    def solve(self, size):
+        win_probabilities = numpy.zeros((size + 1, size + 1))
+        expected_attackers = numpy.zeros((size + 1, size + 1))
+        expected_defenders = numpy.zeros((size + 1, size + 1))
+        for a in range(size + 1):
+            for d in range(size + 1):
+                if d == 0:
+                    win_probabilities[a, d] = 1.0
+                    expected_attackers[a, d] = a
+                elif a <= 1:
+                    expected_attackers[a, d] = a
+                    expected_defenders[a, d] = d
+                else:
+                    outcomes = loss_probabilities(min(ATTACK_DICE_MAX, a - 1), min(DEFEND_DICE_MAX, d))
+                    for (attacker_loss, defender_loss), probability in outcomes.items():
+                        next_a, next_d = a - attacker_loss, d - defender_loss
+                        win_probabilities[a, d] += probability * win_probabilities[next_a, next_d]
+                        expected_attackers[a, d] += probability * expected_attackers[next_a, next_d]
+                        expected_defenders[a, d] += probability * expected_defenders[next_a, next_d]
+        self.size = size
+        self.win_probabilities = win_probabilities
+        self.expected_attackers = expected_attackers
+        self.expected_defenders = expected_defenders
+
+    def table_index(self, attacking_count, defending_count):
+        largest = max(attacking_count, defending_count)
+        scale = 1
+        if largest > self.army_limit:
+            # Keep the ratio of armies for battles too large for the table
+            scale = largest / self.army_limit
+            attacking_count = max(round(attacking_count / scale), min(attacking_count, 2))
+            defending_count = max(round(defending_count / scale), min(defending_count, 1))
+            largest = self.army_limit
+        self.grow(largest)
+        return attacking_count, defending_count, scale
+
+
+# Compares dice sorted from high to low, with ties going to the defender, returning armies defeated as
+# positive when the attacker wins more dice and negative when the defender does
+def compare_rolls(high_to_low_attack_rolls, high_to_low_defend_rolls):
+    armies_defeated = 0
+    for i in range(len(high_to_low_defend_rolls)):
+        if i >= len(high_to_low_attack_rolls):
+            break
+        if high_to_low_attack_rolls[i] > high_to_low_defend_rolls[i]:
+            armies_defeated += 1
+        else:
+            armies_defeated -= 1
+    return armies_defeated
+
+
+# Exact probability of each (attacker_loss, defender_loss) for a single roll, found by enumerating every roll
+@lru_cache(maxsize=None)
+def loss_probabilities(attacking_count, defending_count):
+    num_compared = min(attacking_count, defending_count)
+    total_rolls = DIE_FACES ** (attacking_count + defending_count)
+    counts = dict()
+    for rolls in product(range(1, DIE_FACES + 1), repeat=attacking_count + defending_count):
+        attack_rolls = sorted(rolls[:attacking_count], reverse=True)
+        defend_rolls = sorted(rolls[attacking_count:], reverse=True)
+        armies_defeated = compare_rolls(attack_rolls, defend_rolls)
+        defender_loss = (num_compared + armies_defeated) // 2
+        losses = (num_compared - defender_loss, defender_loss)
+        counts[losses] = counts.get(losses, 0) + 1
+    return {losses: count / total_rolls for losses, count in counts.items()}
+
+
+# Resolves every (attacking_count, defending_count) pair at once with the same rules as compare_rolls,
+# returning an array of (attacker_losses, defender_losses) for each pair
+def resolve_battles(battles, generator=None):
+    battles = numpy.asarray(battles, dtype=numpy.int64).reshape(-1, 2)
+    attacking_counts = battles[:, 0]
+    defending_counts = battles[:, 1]
+    if ((attacking_counts < 1) | (attacking_counts > ATTACK_DICE_MAX)).any():
+        raise Exception('battles can only be fought with 1 to {} attacking armies'.format(ATTACK_DICE_MAX))
+    if ((defending_counts < 1) | (defending_counts > DEFEND_DICE_MAX)).any():
+        raise Exception('battles can only be fought with 1 to {} defending armies'.format(DEFEND_DICE_MAX))
+    if generator is None:
+        generator = numpy.random.default_rng()
+    num_battles = len(battles)
+    attack_rolls = generator.integers(1, DIE_FACES + 1, size=(num_battles, ATTACK_DICE_MAX))
+    defend_rolls = generator.integers(1, DIE_FACES + 1, size=(num_battles, DEFEND_DICE_MAX))
+    # Dice that were not rolled are zeroed so they sort below every real roll
+    attack_rolls[numpy.arange(ATTACK_DICE_MAX) >= attacking_counts[:, None]] = 0
+    defend_rolls[numpy.arange(DEFEND_DICE_MAX) >= defending_counts[:, None]] = 0
+    # Sort high to low, then compare the highest dice pairwise with ties going to the defender
+    attack_rolls = -numpy.sort(-attack_rolls, axis=1)[:, :DEFEND_DICE_MAX]
+    defend_rolls = -numpy.sort(-defend_rolls, axis=1)
+    num_compared = numpy.minimum(attacking_counts, defending_counts)
+    compared = numpy.arange(DEFEND_DICE_MAX) < num_compared[:, None]
+    defender_losses = ((attack_rolls > defend_rolls) & compared).sum(axis=1)
+    attacker_losses = num_compared - defender_losses
+    return numpy.stack((attacker_losses, defender_losses), axis=1)
+
+
+# Converts losses into the signed number of armies defeated returned by GameOfRisk.decide_battle
+def net_armies_defeated(losses):
+    return losses[:, 1] - losses[:, 0]
+
+
+battle_odds = BattleOdds()
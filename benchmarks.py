@@ -0,0 +1,208 @@
+from argparse import ArgumentParser
+import json
+import os
+import platform
+from random import Random
+from statistics import median
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from game_of_risk import GameOfRisk
+from map_generator import GRID_TOPOLOGY, TOPOLOGIES, write_map
+from risk_map import RiskMapRenderer
+
+BENCHMARK_NAMES = [
+    'parse',
+    'position_risk_map',
+    'initial_army_placement',
+    'turn',
+    'decide_battle',
+    'choose_attack_route',
+    'choose_fortify_route',
+    'draw_risk_map',
+]
+FORMAT_VERSION = 1
+MIN_SECONDS = 0.5
+REPEAT_MAX = 50
+SIZES = [50, 1000, 10000, 100000]
+# Slower than linear in the map size, so only run up to these sizes unless size limits are lifted
+SIZE_LIMITS = {'draw_risk_map': 1000, 'initial_army_placement': 10000}
+# Relative slowdown from the baseline that counts as a regression
+TOLERANCE = 0.1
+
+
+# Hands each player a contiguous block of territories with a few armies each, in linear time, for benchmarks of
+# the middle of a game on maps too large for initial_army_placement
+def deal_territories(game, seed=0):
+    generator = Random(seed)
+    num_territories = len(game.all_territories)
+    for i, territory in enumerate(game.all_territories):
+        player = game.players[i * len(game.players) // num_territories]
+        game.select_territory_initial(player, territory, generator.randint(1, 5))
+    for player in game.players:
+        player.army_count = 0
+
+
+def load_game(map_path, seed=0):
+    return GameOfRisk(map_path, headless=True, territory_limit=None, seed=seed)
+
+
+def dealt_game(map_path):
+    game = load_game(map_path)
+    deal_territories(game)
+    return game
+
+
+# Times operation on the result of setup, which is not timed, at least once and until it has run for min_seconds
+# or repeat_max times, running it number times per repetition
+def measure(operation, setup=lambda: None, number=1, min_seconds=MIN_SECONDS, repeat_max=REPEAT_MAX):
+    times = []
+    while not times or (len(times) < repeat_max and sum(times) < min_seconds):
+        argument = setup()
+        start = perf_counter()
+        for _ in range(number):
+            operation(argument)
+        times.append((perf_counter() - start) / number)
+    return times
+
+
+def benchmark_map(map_path, num_territories, benchmark_names, size_limits, min_seconds):
+    game = dealt_game(map_path)
+    players = game.players
+    turns = [0]
+
+    def play_turn(_):
+        game.turn(players[turns[0] % len(players)])
+        turns[0] += 1
+
+    def draw(renderer):
+        renderer.draw_risk_map(renderer_game.all_territories)
+
+    renderer_game = dealt_game(map_path)
+    renderer = RiskMapRenderer(renderer_game, layout_cache_directory=None, interactive=False)
+
+    def new_renderer():
+        return RiskMapRenderer(renderer_game, layout_cache_directory=None, interactive=False)
+
+    cases = {
+        'parse': (lambda _: load_game(map_path), lambda: None, 1),
+        'position_risk_map': (lambda r: r.position_risk_map(renderer_game.all_territories), new_renderer, 1),
+        'initial_army_placement': (lambda g: g.initial_army_placement(), lambda: load_game(map_path), 1),
+        'turn': (play_turn, lambda: None, 1),
+        'decide_battle': (lambda _: game.decide_battle(3, 2), lambda: None, 1000),
+        'choose_attack_route': (
+            lambda player: player.choose_attack_route(game.get_territories_for_attack(player), 5),
+            lambda: players[0],
+            1,
+        ),
+        'choose_fortify_route': (lambda player: player.choose_fortify_route(), lambda: players[0], 1),
+        'draw_risk_map': (draw, lambda: renderer, 1),
+    }
+    results = []
+    for name in benchmark_names:
+        if num_territories > size_limits.get(name, num_territories):
+            continue
+        operation, setup, number = cases[name]
+        if name == 'draw_risk_map':
+            # First frame lays out and draws the whole map, later frames only redraw what a turn changed
+            renderer.draw_risk_map(renderer_game.all_territories)
+            setup = turn_before_frame(renderer_game, renderer)
+        times = measure(operation, setup, number, min_seconds)
+        results.append({
+            'benchmark': name,
+            'territories': num_territories,
+            'repeat': len(times),
+            'number': number,
+            'min_seconds': min(times),
+            'median_seconds': median(times),
+        })
+        print('{:>24} {:>8} territories  {:.6f} s'.format(name, num_territories, median(times)), file=sys.stderr)
+    return results
+
+
+# Flags benchmarks whose median time grew by more than tolerance relative to the baseline
+def compare(results, baseline, tolerance=TOLERANCE):
+    baseline_medians = {(r['benchmark'], r['territories']): r['median_seconds'] for r in baseline['results']}
+    comparison = []
+    for result in results:
+        baseline_median = baseline_medians.get((result['benchmark'], result['territories']))
+        if not baseline_median:
+            continue
+        ratio = result['median_seconds'] / baseline_median
+        comparison.append({
+            'benchmark': result['benchmark'],
+            'territories': result['territories'],
+            'baseline_median_seconds': baseline_median,
+            'median_seconds': result['median_seconds'],
+            'ratio': ratio,
+            'regression': ratio > 1 + tolerance,
+        })
+    return comparison
+
+
+def run_benchmarks(sizes=SIZES, benchmark_names=None, size_limits=SIZE_LIMITS, min_seconds=MIN_SECONDS,
+                   topology=GRID_TOPOLOGY):
+    benchmark_names = benchmark_names or BENCHMARK_NAMES
+    results = []
+    with TemporaryDirectory() as directory:
+        for num_territories in sizes:
+            map_path = os.path.join(directory, '{}_{}.txt'.format(topology, num_territories))
+            write_map(map_path, topology, num_territories)
+            results.extend(benchmark_map(map_path, num_territories, benchmark_names, size_limits, min_seconds))
+    return {
+        'version': FORMAT_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'topology': topology,
+        'results': results,
+    }
+
+
+# Setup for draw_risk_map that plays a turn between frames, so each frame redraws what one turn changed
+def turn_before_frame(game, renderer):
+    turns = [0]
+
+    def setup():
+        game.turn(game.players[turns[0] % len(game.players)])
+        turns[0] += 1
+        game.journal.flush()
+        return renderer
+    return setup
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Time the engine, computer player and renderer on generated maps of each size.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARK_NAMES, default=BENCHMARK_NAMES)
+    parser.add_argument('--topology', choices=TOPOLOGIES, default=GRID_TOPOLOGY)
+    parser.add_argument('--min-seconds', type=float, default=MIN_SECONDS)
+    parser.add_argument('--no-size-limits', action='store_true', help='run every benchmark on every map size')
+    parser.add_argument('--output', help='file to write results to as JSON, instead of standard output')
+    parser.add_argument('--baseline', help='results saved by an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    arguments = parser.parse_args()
+    report = run_benchmarks(
+        arguments.sizes,
+        arguments.benchmarks,
+        dict() if arguments.no_size_limits else SIZE_LIMITS,
+        arguments.min_seconds,
+        arguments.topology,
+    )
+    regressions = []
+    if arguments.baseline:
+        with open(arguments.baseline, 'r') as f:
+            report['comparison'] = compare(report['results'], json.load(f), arguments.tolerance)
+        regressions = [c for c in report['comparison'] if c['regression']]
+        for c in regressions:
+            print('Regression: {} on {} territories is {:.2f}x slower than the baseline'.format(
+                c['benchmark'],
+                c['territories'],
+                c['ratio'],
+            ), file=sys.stderr)
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    sys.exit(1 if regressions else 0)
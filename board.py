@@ -0,0 +1,386 @@
+from array import array
+
+import numpy
+
+NO_PLAYER = -1
+
+
+class Board:
+    """
+    Struct-of-arrays state of a map. Territories are numbered in the order they were first named in the data
+    file. Occupying players and army counts live in flat integer arrays indexed by territory, with players stored
+    by their integer id, and neighbors are CSR adjacency, where the neighbors of territory i are
+    neighbor_targets[neighbor_offsets[i]:neighbor_offsets[i + 1]]. The reverse adjacency is kept the same way in
+    bordering_offsets and bordering_targets. Copying the state of a game only takes copying owners and armies.
+    The map arrays are kept as given, so those of a compiled map stay views over its memory-mapped file.
+
+    Continents are interned as ids into continent_names. Every change of owner or army count also keeps running
+    totals by player id: territory_totals and army_totals of everything each player occupies, continent_counts of
+    territories held in each continent, continent_holders with the player holding all of each continent and
+    continent_bonus_totals of the continent_bonuses each player is owed, so none of them take a scan of the map.
+    After writing owners and armies directly, recount_totals brings them back up to date.
+
+    Territory objects are thin views over these arrays, created the first time each territory is looked up and
+    kept from then on so that they compare and hash by identity as before.
+    """
+
+    def __init__(self, names, continent_names, continent_ids, neighbor_offsets, neighbor_targets):
+        num_territories = len(names)
+        self.names = names
+        self.continent_names = continent_names
+        self.continent_ids = continent_ids
+        self.continent_index = {name: continent_id for continent_id, name in enumerate(continent_names)}
+        self.continent_sizes = array('i', numpy.bincount(
+            numpy.frombuffer(self.continent_ids, dtype=numpy.int32), minlength=len(continent_names),
+        ).astype(numpy.int32).tobytes())
+        # Armies a player receives each turn for holding a whole continent, none unless set_continent_bonuses is used
+        self.continent_bonuses = array('i', [0]) * len(continent_names)
+        self.neighbor_offsets = neighbor_offsets
+        self.neighbor_targets = neighbor_targets
+        # Reverse adjacency, found by grouping every edge by its target
+        targets = numpy.frombuffer(self.neighbor_targets, dtype=numpy.int32)
+        sources = numpy.repeat(numpy.arange(num_territories, dtype=numpy.int32),
+                               numpy.diff(numpy.frombuffer(self.neighbor_offsets, dtype=numpy.int64)))
+        order = numpy.argsort(targets, kind='stable')
+        self.bordering_offsets = array('q', numpy.concatenate((
+            [0], numpy.cumsum(numpy.bincount(targets, minlength=num_territories)),
+        )).astype(numpy.int64).tobytes())
+        self.bordering_targets = array('i', sources[order].tobytes())
+        # Game state
+        self.owners = array('i', [NO_PLAYER]) * num_territories
+        self.armies = array('i', [0]) * num_territories
+        # Player whose controlled territories include each territory, with any others kept in extra_controllers
+        self.controller_ids = array('i', [NO_PLAYER]) * num_territories
+        self.extra_controllers = dict()
+        self.players = []
+        self.territories = TerritoryViews(self)
+        # Territories by name, indexed the first time a territory is looked up by name
+        self.name_index = None
+        # Neighbor lists of views are built the first time they are needed and shared from then on
+        self.neighbor_lists = [None] * num_territories
+        self.bordering_lists = [None] * num_territories
+        self.recount_totals()
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def territory_index(self):
+        if self.name_index is None:
+            self.name_index = {territory.name: territory for territory in self.territories}
+        return self.name_index
+
+    def add_controller(self, index, player):
+        if self.controller_ids[index] == NO_PLAYER:
+            self.controller_ids[index] = player.id
+        else:
+            self.extra_controllers.setdefault(index, []).append(player)
+
+    # Board for another game on the same map, sharing the adjacency arrays but with no territories occupied
+    def blank_copy(self):
+        board = Board.__new__(Board)
+        board.__dict__.update(self.__dict__)
+        num_territories = len(self)
+        board.owners = array('i', [NO_PLAYER]) * num_territories
+        board.armies = array('i', [0]) * num_territories
+        board.controller_ids = array('i', [NO_PLAYER]) * num_territories
+        board.extra_controllers = dict()
+        board.players = []
+        board.territories = TerritoryViews(board)
+        board.name_index = None
+        board.neighbor_lists = [None] * num_territories
+        board.bordering_lists = [None] * num_territories
+        board.recount_totals()
+        return board
+
+    def bordering(self, index):
+        if self.bordering_lists[index] is None:
+            start, end = self.bordering_offsets[index], self.bordering_offsets[index + 1]
+            self.bordering_lists[index] = [self.territories[j] for j in self.bordering_targets[start:end]]
+        return self.bordering_lists[index]
+
+    def continent_holder(self, continent_id):
+        holder_id = self.continent_holders[continent_id]
+        return None if holder_id == NO_PLAYER else self.players[holder_id]
+
+    def controllers(self, index):
+        controller_id = self.controller_ids[index]
+        if controller_id == NO_PLAYER:
+            return []
+        return [self.players[controller_id]] + self.extra_controllers.get(index, [])
+
+    # Every edge leaving the territories at indices, in the order of their neighbor lists, as the position in
+    # indices of the territory each edge leaves from and the index of the neighbor it leads to
+    def neighbor_edges(self, indices):
+        offsets = numpy.frombuffer(self.neighbor_offsets, dtype=numpy.int64)
+        starts = offsets[indices]
+        counts = offsets[indices + 1] - starts
+        sources = numpy.repeat(numpy.arange(len(indices)), counts)
+        # Position of each edge within the neighbor list of its territory, added to where that list starts
+        list_positions = numpy.arange(len(sources)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        return sources, numpy.frombuffer(self.neighbor_targets, dtype=numpy.int32)[starts[sources] + list_positions]
+
+    def neighbors(self, index):
+        if self.neighbor_lists[index] is None:
+            start, end = self.neighbor_offsets[index], self.neighbor_offsets[index + 1]
+            self.neighbor_lists[index] = [self.territories[j] for j in self.neighbor_targets[start:end]]
+        return self.neighbor_lists[index]
+
+    def owner(self, index):
+        owner_id = self.owners[index]
+        return None if owner_id == NO_PLAYER else self.players[owner_id]
+
+    # Counts the territories, armies and continents held by every player again from the owner and army arrays
+    def recount_totals(self):
+        num_players = len(self.players)
+        owners = numpy.frombuffer(self.owners, dtype=numpy.int32)
+        occupied = owners != NO_PLAYER
+        occupiers = owners[occupied]
+        armies = numpy.frombuffer(self.armies, dtype=numpy.int32)[occupied]
+        continent_ids = numpy.frombuffer(self.continent_ids, dtype=numpy.int32)[occupied]
+        self.territory_totals = array('i', numpy.bincount(
+            occupiers, minlength=num_players,
+        ).astype(numpy.int32).tobytes())
+        self.army_totals = array('i', numpy.bincount(
+            occupiers, weights=armies, minlength=num_players,
+        ).astype(numpy.int32).tobytes())
+        continent_counts = numpy.zeros((num_players, len(self.continent_names)), dtype=numpy.int32)
+        numpy.add.at(continent_counts, (occupiers, continent_ids), 1)
+        self.continent_counts = [array('i', counts.tobytes()) for counts in continent_counts]
+        self.continent_holders = array('i', [NO_PLAYER]) * len(self.continent_names)
+        self.continent_bonus_totals = array('i', [0]) * num_players
+        for player_id, continent_id in zip(*numpy.nonzero(continent_counts == self.continent_sizes)):
+            self.continent_holders[continent_id] = player_id
+            self.continent_bonus_totals[player_id] += self.continent_bonuses[continent_id]
+
+    def register_player(self, player):
+        player.id = len(self.players)
+        self.players.append(player)
+        self.territory_totals.append(0)
+        self.army_totals.append(0)
+        self.continent_counts.append(array('i', [0]) * len(self.continent_names))
+        self.continent_bonus_totals.append(0)
+
+    def remove_controller(self, index, player):
+        extra_controllers = self.extra_controllers.get(index)
+        if self.controller_ids[index] == player.id:
+            self.controller_ids[index] = extra_controllers.pop(0).id if extra_controllers else NO_PLAYER
+        else:
+            extra_controllers.remove(player)
+        if extra_controllers == []:
+            del self.extra_controllers[index]
+
+    def set_armies(self, index, num_armies):
+        previous_armies = self.armies[index]
+        was_source = previous_armies > 1
+        self.armies[index] = num_armies
+        owner_id = self.owners[index]
+        if owner_id != NO_PLAYER:
+            self.army_totals[owner_id] += num_armies - previous_armies
+        # Territory can only attack or fortify from here while it holds more than one army
+        if (num_armies > 1) != was_source:
+            territory = self.territories[index]
+            for player in self.controllers(index):
+                player.frontier.count_neighbors(territory, 1 if num_armies > 1 else -1)
+
+    # Armies a player receives each turn for holding each continent, by continent name
+    def set_continent_bonuses(self, bonuses):
+        self.continent_bonuses = array('i', [0]) * len(self.continent_names)
+        for continent, num_armies in bonuses.items():
+            if continent not in self.continent_index:
+                raise Exception('{} is not a continent on this map'.format(continent))
+            self.continent_bonuses[self.continent_index[continent]] = num_armies
+        self.recount_totals()
+
+    def set_owner(self, index, player):
+        previous_player = self.owner(index)
+        self.owners[index] = NO_PLAYER if player is None else player.id
+        if previous_player != player:
+            self.transfer_totals(index, previous_player, player)
+            for source in self.bordering(index):
+                if self.armies[source.index] > 1:
+                    for controller in self.controllers(source.index):
+                        controller.frontier.reclassify(source, previous_player, player)
+
+    # Moves a territory, its armies and its share of its continent from the totals of one player to another's
+    def transfer_totals(self, index, previous_player, player):
+        num_armies = self.armies[index]
+        continent_id = self.continent_ids[index]
+        if previous_player is not None:
+            previous_id = previous_player.id
+            self.territory_totals[previous_id] -= 1
+            self.army_totals[previous_id] -= num_armies
+            self.continent_counts[previous_id][continent_id] -= 1
+            if self.continent_holders[continent_id] == previous_id:
+                self.continent_holders[continent_id] = NO_PLAYER
+                self.continent_bonus_totals[previous_id] -= self.continent_bonuses[continent_id]
+        if player is not None:
+            player_id = player.id
+            self.territory_totals[player_id] += 1
+            self.army_totals[player_id] += num_armies
+            self.continent_counts[player_id][continent_id] += 1
+            if self.continent_counts[player_id][continent_id] == self.continent_sizes[continent_id]:
+                self.continent_holders[continent_id] = player_id
+                self.continent_bonus_totals[player_id] += self.continent_bonuses[continent_id]
+
+    # Board over the arrays of a compiled map without copying them, decoding names only once they are looked up
+    @staticmethod
+    def from_compiled_map(compiled_map):
+        return Board(
+            compiled_map.territory_names(),
+            compiled_map.continent_names,
+            memoryview(compiled_map.continent_ids).cast('B').cast('i'),
+            memoryview(compiled_map.neighbor_offsets).cast('B').cast('q'),
+            memoryview(compiled_map.neighbor_targets).cast('B').cast('i'),
+        )
+
+
+class MapBuilder:
+    """
+    Collects territories and neighbors by name while a data file is read, then builds the Board. Neighbors
+    listed more than once for a territory are only added once.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.continents = []
+        self.neighbor_ids = []
+        self.territory_ids = dict()
+        # Declared (territory, neighbor) id pairs, used to skip duplicate edges and find one-sided ones
+        self.declared_edges = set()
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_neighbor(self, territory_id, neighbor_name):
+        neighbor_id = self.get_or_create_territory(neighbor_name, None)
+        if (territory_id, neighbor_id) not in self.declared_edges:
+            self.declared_edges.add((territory_id, neighbor_id))
+            self.neighbor_ids[territory_id].append(neighbor_id)
+
+    def build(self):
+        continent_ids = dict()
+        for continent in self.continents:
+            continent_ids.setdefault(continent, len(continent_ids))
+        neighbor_offsets = [0]
+        for neighbor_ids in self.neighbor_ids:
+            neighbor_offsets.append(neighbor_offsets[-1] + len(neighbor_ids))
+        return Board(
+            self.names,
+            list(continent_ids),
+            array('i', [continent_ids[continent] for continent in self.continents]),
+            array('q', neighbor_offsets),
+            array('i', [neighbor_id for neighbor_ids in self.neighbor_ids for neighbor_id in neighbor_ids]),
+        )
+
+    def get_or_create_territory(self, territory_name, continent_name):
+        territory_id = self.territory_ids.get(territory_name)
+        if territory_id is not None:
+            # Continent field updated if territory was first declared as neighbor
+            if continent_name and not self.continents[territory_id]:
+                self.continents[territory_id] = continent_name
+            return territory_id
+        territory_id = len(self.names)
+        self.names.append(territory_name)
+        self.continents.append(continent_name)
+        self.neighbor_ids.append([])
+        self.territory_ids[territory_name] = territory_id
+        return territory_id
+
+    # Names of territories that were only ever listed as a neighbor
+    def undeclared_territories(self):
+        return [name for name, continent in zip(self.names, self.continents) if not continent]
+
+    # Pairs of territory and neighbor names where the neighbor does not list the territory back
+    def one_sided_neighbors(self):
+        return sorted(
+            (self.names[territory_id], self.names[neighbor_id])
+            for territory_id, neighbor_id in self.declared_edges
+            if (neighbor_id, territory_id) not in self.declared_edges
+        )
+
+
+class Territory:
+    __slots__ = ('board', 'index')
+
+    def __init__(self, board, index):
+        self.board = board
+        self.index = index
+
+    def __str__(self):
+        return '{}, {} --> {}'.format(self.name, self.continent, ', '.join([n.name for n in self.neighbors]))
+
+    @property
+    # Territories that list this territory as a neighbor
+    def bordering(self):
+        return self.board.bordering(self.index)
+
+    @property
+    def continent(self):
+        return self.board.continent_names[self.board.continent_ids[self.index]]
+
+    @property
+    def continent_id(self):
+        return self.board.continent_ids[self.index]
+
+    @property
+    # Players whose controlled territories include this territory, kept by ControlledTerritories
+    def controllers(self):
+        return self.board.controllers(self.index)
+
+    @property
+    def name(self):
+        return self.board.names[self.index]
+
+    @property
+    def neighbors(self):
+        return self.board.neighbors(self.index)
+
+    @property
+    def occupying_armies(self):
+        return self.board.armies[self.index]
+
+    @occupying_armies.setter
+    def occupying_armies(self, num_armies):
+        self.board.set_armies(self.index, num_armies)
+
+    @property
+    def occupying_player(self):
+        return self.board.owner(self.index)
+
+    @occupying_player.setter
+    def occupying_player(self, player):
+        self.board.set_owner(self.index, player)
+
+    def add_controller(self, player):
+        self.board.add_controller(self.index, player)
+
+    def is_empty(self):
+        return self.occupying_armies == 0
+
+    def remove_controller(self, player):
+        self.board.remove_controller(self.index, player)
+
+
+class TerritoryViews:
+    """
+    Territories of a board, each view created the first time it is looked up. Slices are returned as lists.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self.views = [None] * len(board)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.views)))]
+        territory = self.views[index]
+        if territory is None:
+            territory = self.views[index] = Territory(self.board, index % len(self.views))
+        return territory
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self.views)))
+
+    def __len__(self):
+        return len(self.views)
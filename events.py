@@ -0,0 +1,46 @@
+from collections import namedtuple
+
+# Typed changes to the state of a game, recorded by the GameOfRisk mutators
+ArmiesChanged = namedtuple('ArmiesChanged', ['territory', 'num_armies'])
+ArmiesMoved = namedtuple('ArmiesMoved', ['from_territory', 'to_territory', 'num_armies'])
+BattleResolved = namedtuple('BattleResolved', ['attacking_territory', 'defending_territory', 'armies_defeated'])
+OwnerChanged = namedtuple('OwnerChanged', ['territory', 'previous_player', 'player'])
+PlayerEliminated = namedtuple('PlayerEliminated', ['player'])
+ALL_EVENT_TYPES = (ArmiesChanged, ArmiesMoved, BattleResolved, OwnerChanged, PlayerEliminated)
+
+
+class EventJournal:
+    """
+    Events are only created for types that someone has subscribed to, so an unobserved journal costs a set
+    lookup per change. Recorded events are held until flush, which hands each subscriber the batch of events
+    of the types it subscribed to, in the order they were recorded.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.subscriptions = []
+        self.subscribed_types = set()
+
+    def flush(self):
+        if not self.pending:
+            return
+        events = self.pending
+        self.pending = []
+        for callback, event_types in self.subscriptions:
+            batch = [event for event in events if type(event) in event_types]
+            if batch:
+                callback(batch)
+
+    def record(self, event_type, *fields):
+        if event_type in self.subscribed_types:
+            self.pending.append(event_type(*fields))
+
+    def subscribe(self, callback, event_types=ALL_EVENT_TYPES):
+        self.subscriptions.append((callback, frozenset(event_types)))
+        self.subscribed_types.update(event_types)
+
+    def unsubscribe(self, callback):
+        self.subscriptions = [s for s in self.subscriptions if s[0] != callback]
+        self.subscribed_types = set()
+        for _, event_types in self.subscriptions:
+            self.subscribed_types.update(event_types)
@@ -0,0 +1,101 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import os
+from tempfile import TemporaryDirectory
+
+from action_log import load_action_log, TURN
+from game_of_risk import GameOfRisk
+from risk_map import LAYOUT_CACHE_DIRECTORY, RiskMapRenderer
+
+DPI = 80
+FRAME_NAME_DIGITS = 5
+# Seconds each frame is shown for in an animation
+FRAME_SECONDS = 0.5
+
+
+# Number of actions played before each frame, the first frame showing the map once it has been set up and each
+# frame after it the map at the end of a turn
+def frame_boundaries(actions):
+    return [i for i, action in enumerate(actions) if action[0] == TURN and i > 0] + [len(actions)]
+
+
+def frame_path(output_directory, frame, num_frames):
+    digits = max(FRAME_NAME_DIGITS, len(str(num_frames - 1)))
+    return os.path.join(output_directory, 'frame_{:0{}d}.png'.format(frame, digits))
+
+
+# Replays a recorded game into a fresh headless game and draws frames first_frame up to last_frame offscreen,
+# picking up the layout from the layout cache
+def render_frames(game_file, actions, boundaries, first_frame, last_frame, output_directory, layout_cache_directory,
+                  dpi=DPI):
+    game = GameOfRisk(game_file, headless=True, territory_limit=None)
+    renderer = RiskMapRenderer(game, layout_cache_directory=layout_cache_directory, interactive=False)
+    played = 0
+    paths = []
+    for frame in range(first_frame, last_frame):
+        game.replay(actions[played:boundaries[frame]])
+        played = boundaries[frame]
+        game.journal.flush()
+        renderer.draw_risk_map(game.all_territories)
+        renderer.figure.suptitle('{}\nTurn {}'.format(game.title, game.turns_played))
+        paths.append(frame_path(output_directory, frame, len(boundaries)))
+        renderer.figure.savefig(paths[-1], dpi=dpi)
+    renderer.close(game)
+    return paths
+
+
+# Draws the map of a recorded game after setup and after every turn as a numbered PNG sequence in
+# output_directory, splitting the frames into one run of consecutive frames per process. The map is positioned
+# once, and every process reads its layout from the layout cache, which is temporary if layout_cache_directory is
+# None. Returns the paths of the frames in order.
+def export_frames(game_file, action_log, output_directory, processes=None,
+                  layout_cache_directory=LAYOUT_CACHE_DIRECTORY, dpi=DPI):
+    actions = list(action_log)
+    boundaries = frame_boundaries(actions)
+    os.makedirs(output_directory, exist_ok=True)
+    with TemporaryDirectory() as temporary_directory:
+        layout_cache_directory = layout_cache_directory or temporary_directory
+        game = GameOfRisk(game_file, headless=True, territory_limit=None)
+        RiskMapRenderer(game, layout_cache_directory=layout_cache_directory).position_risk_map(game.all_territories)
+        processes = min(processes or os.cpu_count(), len(boundaries))
+        if processes == 1:
+            return render_frames(game_file, actions, boundaries, 0, len(boundaries), output_directory,
+                                 layout_cache_directory, dpi)
+        runs = [(len(boundaries) * i // processes, len(boundaries) * (i + 1) // processes) for i in range(processes)]
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [
+                executor.submit(render_frames, game_file, actions, boundaries, first_frame, last_frame,
+                                output_directory, layout_cache_directory, dpi)
+                for first_frame, last_frame in runs
+            ]
+            return [path for future in futures for path in future.result()]
+
+
+# Joins frames into an animation, in any format Pillow can write several frames of, such as GIF or WebP
+def write_animation(frame_paths, path, frame_seconds=FRAME_SECONDS):
+    from PIL import Image
+    first_frame = Image.open(frame_paths[0])
+    first_frame.save(
+        path,
+        save_all=True,
+        append_images=(Image.open(frame_path) for frame_path in frame_paths[1:]),
+        duration=int(frame_seconds * 1000),
+        loop=0,
+    )
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Draw every turn of a recorded game offscreen as a PNG sequence.')
+    parser.add_argument('game_file')
+    parser.add_argument('action_log', help='action log saved from the game')
+    parser.add_argument('--output', default='frames', help='directory to write frames to')
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--dpi', type=int, default=DPI)
+    parser.add_argument('--animation', help='also join the frames into an animation, such as recap.gif')
+    parser.add_argument('--frame-seconds', type=float, default=FRAME_SECONDS)
+    arguments = parser.parse_args()
+    exported_paths = export_frames(arguments.game_file, load_action_log(arguments.action_log), arguments.output,
+                                   arguments.processes, dpi=arguments.dpi)
+    if arguments.animation:
+        write_animation(exported_paths, arguments.animation, arguments.frame_seconds)
+    print('Wrote {} frames to {}'.format(len(exported_paths), arguments.output))
@@ -0,0 +1,144 @@
+from bisect import bisect_left, insort
+
+
+class ControlledTerritories:
+    """
+    List-like collection of the territories a player controls, which keeps the player's frontier up to date as
+    territories are added or removed. Each territory is numbered as it is added, and a sorted list of those
+    numbers gives list order, so membership, position lookups and indexing take constant time, appending takes
+    constant time and finding the list index of a territory, removing or putting one back at its old place take a
+    binary search.
+    """
+
+    def __init__(self, player, territories=()):
+        self.player = player
+        # Territories are numbered as they are added so that subsets can be put back in list order
+        self.positions = dict()
+        self.territories_by_position = dict()
+        self.sorted_positions = []
+        self.next_position = 0
+        self.extend(territories)
+
+    def __contains__(self, territory):
+        return territory in self.positions
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.territories_by_position[position] for position in self.sorted_positions[index]]
+        return self.territories_by_position[self.sorted_positions[index]]
+
+    def __iter__(self):
+        return map(self.territories_by_position.__getitem__, self.sorted_positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __repr__(self):
+        return repr(self[:])
+
+    def append(self, territory):
+        self.insert(territory, self.next_position)
+
+    def clear(self):
+        for territory in self[:]:
+            self.remove(territory)
+
+    def extend(self, territories):
+        for territory in territories:
+            self.append(territory)
+
+    def index(self, territory):
+        return bisect_left(self.sorted_positions, self.position(territory))
+
+    # Puts a territory back in the place it was removed from, as when a move is undone
+    def insert(self, territory, position):
+        if territory in self.positions:
+            return
+        self.positions[territory] = position
+        self.territories_by_position[position] = territory
+        if not self.sorted_positions or position > self.sorted_positions[-1]:
+            self.sorted_positions.append(position)
+        else:
+            insort(self.sorted_positions, position)
+        self.next_position = max(self.next_position, position + 1)
+        territory.add_controller(self.player)
+        self.player.frontier.add_source(territory)
+
+    def position(self, territory):
+        if territory not in self.positions:
+            raise ValueError('{} is not controlled by {}'.format(territory.name, self.player.name))
+        return self.positions[territory]
+
+    def remove(self, territory):
+        position = self.position(territory)
+        del self.positions[territory]
+        del self.territories_by_position[position]
+        del self.sorted_positions[bisect_left(self.sorted_positions, position)]
+        territory.remove_controller(self.player)
+        self.player.frontier.remove_source(territory)
+
+
+class Frontier:
+    """
+    Territories a player controls with more than one army, each counted by how many of its neighbors are held by
+    another player, for attacking, or by the player, for fortifying. Counts are adjusted in time proportional to
+    the degree of a territory whenever it crosses the one army threshold, joins or leaves the player's controlled
+    territories, or one of its neighbors changes hands. Targets are then found from bordering sources alone, in
+    the same order as a scan of every controlled territory would find them.
+    """
+
+    def __init__(self, player):
+        self.player = player
+        self.attack_sources = dict()
+        self.fortify_sources = dict()
+
+    def add_source(self, territory):
+        if territory.occupying_armies > 1:
+            self.count_neighbors(territory, 1)
+
+    def attack_targets(self):
+        return self.targets(self.attack_sources, lambda neighbor: neighbor.occupying_player != self.player)
+
+    def count_neighbors(self, source, change):
+        num_held = 0
+        for neighbor in source.neighbors:
+            if neighbor.occupying_player == self.player:
+                num_held += 1
+        self.adjust(self.fortify_sources, source, change * num_held)
+        self.adjust(self.attack_sources, source, change * (len(source.neighbors) - num_held))
+
+    def fortify_targets(self):
+        return self.targets(self.fortify_sources, lambda neighbor: neighbor.occupying_player == self.player)
+
+    # Moves one neighbor of a source between attack and fortify counts after that neighbor changes hands
+    def reclassify(self, source, previous_player, player):
+        if (previous_player == self.player) == (player == self.player):
+            return
+        if player == self.player:
+            self.adjust(self.attack_sources, source, -1)
+            self.adjust(self.fortify_sources, source, 1)
+        else:
+            self.adjust(self.fortify_sources, source, -1)
+            self.adjust(self.attack_sources, source, 1)
+
+    def remove_source(self, territory):
+        if territory.occupying_armies > 1:
+            self.count_neighbors(territory, -1)
+
+    def targets(self, sources, is_target):
+        targets = dict()
+        for source in sorted(sources, key=self.player.controlled_territories.position):
+            for neighbor in source.neighbors:
+                if is_target(neighbor):
+                    targets[neighbor] = None
+        return list(targets)
+
+    @staticmethod
+    def adjust(counts, source, change):
+        if change == 0:
+            return
+        count = counts.get(source, 0) + change
+        if count > 0:
+            counts[source] = count
+        else:
+            counts.pop(source, None)
@@ -1,46 +1,49 @@
-from random import randint
-from time import sleep
-from tkinter import Tk
-
-from matplotlib import pyplot
-import networkx
-
+import asyncio
+from copy import copy
+import os
+
+import numpy
+
+from action_log import ActionLog, BATTLE, CLAIM, DRAW, MOVE, PLACE, REINFORCE, TURN
+from async_input import INVALID_NUMBER_MESSAGE, NumberRequest, territory_lines
+from battle import net_armies_defeated, resolve_battles
+from board import Board, MapBuilder
+from events import ArmiesChanged, ArmiesMoved, BattleResolved, EventJournal, OwnerChanged, PlayerEliminated
+from instrumentation import (
+    ATTACK_PHASE, BATTLES, CARD_TRADES, CONQUESTS, FORTIFY_PHASE, REINFORCE_PHASE, ROLLS, SETUP_PHASE, TURNS,
+)
+from map_compiler import (
+    CACHE_DIRECTORY, CompiledMap, compiled_map_path, load_compiled_map, write_compiled_map,
+)
+from moves import AttackStep, Claim, CollectReinforcements, ConquestMove, Fortify, GameSnapshot, Reinforce
+from observers import ConsoleObserver
 from players import ComputerPlayer, HumanPlayer
+from risk_map import RiskMapRenderer
 
 
 class RiskDeck:
-    def __init__(self, card_count):
+    def __init__(self, card_count, generator=None):
         each_category = card_count // 3
         self.cards = [1] * each_category + [2] * each_category + [3] * each_category
+        self.generator = generator or numpy.random.default_rng()
 
-    def draw(self):
-        random_card_index = randint(0, len(self.cards) - 1)
-        random_card = self.cards[random_card_index]
-        self.cards.remove(random_card)
-        return random_card
+    # Card can be given to take a known card from the deck, as when replaying a game
+    def draw(self, card=None):
+        if card is None:
+            random_card_index = int(self.generator.integers(len(self.cards)))
+            card = self.cards[random_card_index]
+        self.cards.remove(card)
+        return card
 
     def give_back(self, card_list):
         self.cards.extend(card_list)
 
 
-class Territory:
-    def __init__(self, name, continent):
-        self.name = name
-        self.continent = continent
-        self.neighbors = []
-        self.occupying_player = None
-        self.occupying_armies = 0
-
-    def is_empty(self):
-        return self.occupying_armies == 0
-
-    def __str__(self):
-        return '{}, {} --> {}'.format(self.name, self.continent, ', '.join([n.name for n in self.neighbors]))
-
-
 class GameOfRisk:
     # Game settings
     ARMY_AWARD_MIN = 3
+    # Battles resolved at once for each pair of attacking and defending counts
+    BATTLE_BLOCK = 256
     CARD_TRADE_INCREMENT = 2
     COLOR_COUNTER = 0
     INITIAL_ARMY_MIN = 20
@@ -50,13 +53,7 @@ class GameOfRisk:
     TERRITORIES_MIN_ARMY_AWARD = 8
     TERRITORY_LIMIT = 50
     # Visualization settings
-    ALL_WINDOWS = 'all'
-    EDGE_COLOR = '#bdc2c9'
-    EMPTY_NODE_COLOR = '#adb1b8'
-    FONT_SIZE = 5
-    FONT_WEIGHT = 'bold'
     COLORS = ['#e66a6a', '#6ab2e6', '#97e699', '#f3f57a', '#edb277', '#d39ef0']
-    NODE_SIZE = 500
 
     """
     Example text data file below. First line is only title of game, second line is number of human players
@@ -70,63 +67,83 @@ class GameOfRisk:
     France|Europe|Germany|Spain|Italy
     Japan|Asia|China|Hawaii
     ...
+
+    A compiled map can be given in place of the data file, and compiled=True compiles the data file once and
+    reuses the compiled map from the cache on later games, which skips parsing entirely.
+
+    A headless game has no observers, so it neither narrates to the console nor draws the map, and
+    computer-only games run without pauses or a display. Observers can be attached with add_observer.
+
+    Given an Instrumentation, a game times each phase of setup and of every turn, counts battles, dice rolls,
+    conquests and card trades, and times every decision of its computer players.
+
+    continent_bonuses gives armies by continent name that a player receives at the start of each turn for holding
+    the whole continent. Holders are kept up to date by the board as territories change hands.
+
+    Each decision of a human player is a NumberRequest yielded by the steps of setup and of each turn. play
+    answers them from the console, while play_async awaits an AsyncInputProvider for each answer, so many games
+    with human players can wait on their players at once on one event loop.
     """
 
-    def __init__(self, game_file):
+    def __init__(self, game_file, headless=False, territory_limit=TERRITORY_LIMIT, strict_neighbors=False,
+                 compiled=False, computer_player_types=None, seed=None, instrumentation=None, continent_bonuses=None):
         # Game attributes
         self.title = ''
         self.players = []
         self.eliminated_players = []
+        # Territories are views over the owner and army arrays of the board, created once the map is read
+        self.board = None
         self.all_territories = []
+        # Pairs of territory and neighbor names where the neighbor does not list the territory back
+        self.one_sided_neighbors = []
         self.player_colors = dict()
+        # Computer players are ComputerPlayer unless their name maps to another player type, such as a search player
+        self.computer_player_types = computer_player_types or dict()
         self.armies_for_card_trade = self.INITIAL_CARD_TRADE
-        # Visualization attributes
-        self.risk_map = networkx.Graph()
-        self.root = Tk()
-        self.root.withdraw()
-        self.node_colors = []
-        self.labels = dict()
-        self.layout = None
-        self.window_dimensions = self.get_window_dimensions()
-        # Read each line of data file to populate information for game
-        with open(game_file, 'r') as f:
-            i = 0
-            info = f.readline()
-            while info:
-                # Number of territories exceeds limit
-                if i > self.TERRITORY_LIMIT + 3:
-                    raise Exception('{} is the maximum number of territories allowed'.format(self.TERRITORY_LIMIT))
-                # First line: title of game
-                if i == 0:
-                    self.title = info.strip()
-                # Second line: human players
-                elif i == 1:
-                    self.set_players(info)
-                # Third line: computer players
-                elif i == 2:
-                    self.set_players(info, is_human=False)
-                # Remaining lines: territory configurations
-                else:
-                    self.set_territory(info)
-                info = f.readline()
-                i += 1
-            if i < 4:
-                raise Exception('uploaded file does not contain enough information to create a game')
+        self.turns_played = 0
+        # Cards and dice are drawn from a generator of this game alone, so games with the same seed play out the same
+        self.generator = numpy.random.default_rng(seed)
+        # Outcomes of battles resolved ahead by decide_battle, by attacking and defending count
+        self.battle_outcomes = dict()
+        # Every change to the game, compact enough to keep for the whole game and replay it with replay
+        self.action_log = ActionLog()
+        # Narration and visualization are delegated to observers
+        self.observers = []
+        # Changes to the game state are recorded for subscribers and flushed whenever the map is drawn
+        self.journal = EventJournal()
+        # Moves made with apply_move, along with what undo_move needs to take each one back
+        self.undo_stack = []
+        # Phase timers, counters and decision latencies are only measured when an Instrumentation is given
+        self.instrumentation = instrumentation
+        if isinstance(game_file, CompiledMap):
+            self.read_compiled_map(game_file, territory_limit)
+        elif compiled:
+            self.read_compiled_map(self.compile_map(game_file), territory_limit)
+        else:
+            self.read_game_file(game_file, territory_limit)
+        self.all_territories = self.board.territories
+        # Players are numbered in the order they were declared
+        for player in self.players:
+            self.board.register_player(player)
+        if continent_bonuses:
+            self.board.set_continent_bonuses(continent_bonuses)
         if not self.PLAYER_MIN <= len(self.players) <= self.PLAYER_MAX:
             raise Exception('{} players have been declared but the game requires {} to {}'.format(
                 len(self.players),
                 self.PLAYER_MIN,
                 self.PLAYER_MAX,
             ))
-        for territory in self.all_territories:
-            if not territory.continent:
-                raise Exception('{} has been specified as a neighbor but has not been declared itself'.format(
-                    territory.name
-                ))
+        if strict_neighbors and self.one_sided_neighbors:
+            raise Exception('{} lists {} as a neighbor but {} does not list {}'.format(
+                *self.one_sided_neighbors[0],
+                *reversed(self.one_sided_neighbors[0]),
+            ))
         # Players can hold 7 cards at most
-        self.card_deck = RiskDeck(7 * len(self.players))
+        self.card_deck = RiskDeck(7 * len(self.players), self.generator)
         self.allocate_armies()
-        self.position_risk_map()
+        if not headless:
+            self.add_observer(ConsoleObserver())
+            self.add_observer(RiskMapRenderer(self))
 
     def __str__(self):
         return '{}\nPlaying: {}\nEliminated: {}\nTerritories:\n{}'.format(
@@ -136,21 +153,105 @@ class GameOfRisk:
             '\n'.join([str(t) for t in self.all_territories]),
         )
 
+    @property
+    # Territories by name, indexed by the board the first time a territory is looked up by name
+    def territory_index(self):
+        return self.board.territory_index
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def add_player(self, player_name, is_human):
+        player_type = 'human' if is_human else 'computer'
+        if is_human:
+            player = HumanPlayer(player_name)
+        else:
+            player = self.computer_player_types.get(player_name, ComputerPlayer)(player_name)
+        player.game = self
+        self.players.append(player)
+        # Track player color for visualization
+        if self.COLOR_COUNTER >= len(self.COLORS):
+            raise Exception('too many {} players have been declared'.format(player_type))
+        self.player_colors[player_name] = self.COLORS[self.COLOR_COUNTER]
+        self.COLOR_COUNTER += 1
+
     def allocate_armies(self):
         # The less players there are, the more armies they receive, at an increment of 5
         num_armies = self.INITIAL_ARMY_MIN + 5 * (self.PLAYER_MAX - len(self.players))
         for player in self.players:
             player.army_count = num_armies
 
-    def attack_territory(self, attacking_territory, defending_territory, attacking_count, defending_count):
+    # Narrates to all observers, pausing observers that pace output for a reader
+    def announce(self, output_string, pause=False):
+        for observer in self.observers:
+            observer.announce(output_string, pause)
+
+    # Makes a move from moves.py so it can later be taken back with undo_move, returning the armies defeated for
+    # an attack step, the reinforcements received when collecting reinforcements and None otherwise
+    def apply_move(self, move):
+        move_type = type(move)
+        outcome = None
+        log_length = len(self.action_log)
+        if move_type is Reinforce:
+            self.reinforce_territory(move.territory, move.num_armies)
+            undo_info = None
+        elif move_type is CollectReinforcements:
+            undo_info = (list(self.card_deck.cards), list(move.player.cards), self.armies_for_card_trade)
+            outcome = self.calculate_reinforcements(move.player)
+        elif move_type is Claim:
+            self.select_territory_initial(move.player, move.territory, move.num_armies)
+            undo_info = None
+        elif move_type is AttackStep:
+            defending_player = move.defending_territory.occupying_player
+            # Players, eliminated players and the deck only change when the last territory of a player falls
+            eliminating = len(defending_player.controlled_territories) == 1
+            undo_info = (
+                move.attacking_territory.occupying_armies,
+                move.defending_territory.occupying_armies,
+                defending_player,
+                defending_player.controlled_territories.position(move.defending_territory),
+                (list(self.players), list(self.card_deck.cards)) if eliminating else None,
+            )
+            outcome = move.armies_defeated
+            if outcome is None:
+                outcome = self.decide_battle(move.attacking_count, move.defending_count)
+            self.attack_territory(
+                move.attacking_territory,
+                move.defending_territory,
+                move.attacking_count,
+                move.defending_count,
+                armies_defeated=outcome,
+            )
+        elif move_type is ConquestMove or move_type is Fortify:
+            self.fortify_territory(move.from_territory, move.to_territory, move.num_armies)
+            undo_info = None
+        else:
+            raise Exception('{} is not a move that can be applied'.format(move))
+        self.undo_stack.append((move, undo_info, log_length))
+        return outcome
+
+    # Battle outcome can be supplied when it has already been resolved, such as by an AttackStep
+    def attack_territory(self, attacking_territory, defending_territory, attacking_count, defending_count,
+                         armies_defeated=None):
         attacking_player = attacking_territory.occupying_player
         defending_player = defending_territory.occupying_player
-        armies_defeated = self.decide_battle(attacking_count, defending_count)
+        if armies_defeated is None:
+            armies_defeated = self.decide_battle(attacking_count, defending_count)
+        if self.instrumentation is not None:
+            self.instrumentation.count(BATTLES)
+        self.action_log.record(
+            BATTLE, attacking_territory.index, defending_territory.index, attacking_count, defending_count,
+            armies_defeated,
+        )
+        self.journal.record(BattleResolved, attacking_territory, defending_territory, armies_defeated)
         if armies_defeated > 0:
             self.change_armies(defending_territory, -armies_defeated)
             if defending_territory.is_empty():
-                self.fortify_territory(attacking_territory, defending_territory, attacking_count)
+                self.move_armies(attacking_territory, defending_territory, attacking_count)
                 defending_territory.occupying_player = attacking_territory.occupying_player
+                self.journal.record(OwnerChanged, defending_territory, defending_player, attacking_player)
+                if self.instrumentation is not None:
+                    self.instrumentation.count(CONQUESTS)
                 attacking_player.controlled_territories.append(defending_territory)
                 defending_player.controlled_territories.remove(defending_territory)
         elif armies_defeated < 0:
@@ -162,28 +263,66 @@ class GameOfRisk:
         if len(defending_player.controlled_territories) == 0:
             self.eliminate_player(defending_player)
 
-    def calculate_reinforcements(self, player):
+    # Card can be given to take a known card from the deck, as when replaying a game
+    def calculate_reinforcements(self, player, new_card=None):
         num_territories = len(player.controlled_territories)
         if num_territories <= self.TERRITORIES_MIN_ARMY_AWARD:
             armies_from_territories = self.ARMY_AWARD_MIN
         else:
             armies_from_territories = num_territories // 3
-        new_card = self.card_deck.draw()
+        armies_from_continents = self.board.continent_bonus_totals[player.id]
+        new_card = self.card_deck.draw(new_card)
+        self.action_log.record(DRAW, player.id, new_card)
         armies_from_cards = self.determine_card_match(player, new_card)
-        return armies_from_territories + armies_from_cards
-
+        return armies_from_territories + armies_from_continents + armies_from_cards
+
+    # Independent headless copy of the game on the same map, optionally with every player replaced by player_type,
+    # such as ComputerPlayer for playing out positions without input
+    def clone(self, player_type=None):
+        game = copy(self)
+        game.board = self.board.blank_copy()
+        game.all_territories = game.board.territories
+        game.players = []
+        for player in self.board.players:
+            cloned_player = (player_type or type(player))(player.name)
+            cloned_player.game = game
+            game.board.register_player(cloned_player)
+        game.eliminated_players = []
+        game.player_colors = dict(self.player_colors)
+        game.generator = numpy.random.default_rng()
+        game.battle_outcomes = dict()
+        game.card_deck = RiskDeck(0, game.generator)
+        game.action_log = ActionLog()
+        game.observers = []
+        game.journal = EventJournal()
+        game.instrumentation = None
+        game.restore(self.snapshot())
+        return game
+
+    # Asks a computer player for a decision by calling decision with args, timing it when the game is instrumented
+    def decide(self, decision, *args):
+        if self.instrumentation is None:
+            return decision(*args)
+        return self.instrumentation.time_decision(decision, *args)
+
+    # Battles are resolved BATTLE_BLOCK at a time for each pair of counts with a single vectorized roll of the
+    # dice, and their outcomes handed out one by one
     def decide_battle(self, attacking_count, defending_count):
-        high_to_low_attack_rolls = self.roll_dice(attacking_count)
-        high_to_low_defend_rolls = self.roll_dice(defending_count)
-        armies_defeated = 0
-        for i in range(len(high_to_low_defend_rolls)):
-            if i >= len(high_to_low_attack_rolls):
-                break
-            if high_to_low_attack_rolls[i] > high_to_low_defend_rolls[i]:
-                armies_defeated += 1
-            else:
-                armies_defeated -= 1
-        return armies_defeated
+        if self.instrumentation is not None:
+            self.instrumentation.count(ROLLS, attacking_count + defending_count)
+        outcomes = self.battle_outcomes.get((attacking_count, defending_count))
+        if not outcomes:
+            battles = numpy.tile((attacking_count, defending_count), (self.BATTLE_BLOCK, 1))
+            outcomes = net_armies_defeated(resolve_battles(battles, self.generator)).tolist()
+            self.battle_outcomes[(attacking_count, defending_count)] = outcomes
+        return outcomes.pop()
+
+    # Makes a computer decision from within steps, then yields None so asynchronous games let other games run
+    # between decisions of computer players as well as between turns
+    def decide_steps(self, decision, *args):
+        result = self.decide(decision, *args)
+        yield None
+        return result
 
     def determine_card_match(self, player, current_card):
         player.cards.append(current_card)
@@ -196,6 +335,8 @@ class GameOfRisk:
                 for match_card in matching_cards:
                     player.cards.remove(match_card)
                 self.card_deck.give_back(matching_cards)
+                if self.instrumentation is not None:
+                    self.instrumentation.count(CARD_TRADES)
                 # Award armies based on number of card trades thus far, then adjust award
                 armies_from_cards = self.armies_for_card_trade
                 self.armies_for_card_trade += self.CARD_TRADE_INCREMENT
@@ -203,62 +344,47 @@ class GameOfRisk:
         return 0
 
     def draw_risk_map(self):
-        self.update_risk_map()
-        pyplot.close(self.ALL_WINDOWS)
-        self.root.update_idletasks()
-        pyplot.figure(num=self.title, figsize=self.window_dimensions)
-        networkx.draw(
-            self.risk_map,
-            pos=self.layout,
-            node_size=self.NODE_SIZE,
-            node_color=self.node_colors,
-            edge_color=self.EDGE_COLOR,
-            labels=self.labels,
-            font_size=self.FONT_SIZE,
-            font_weight=self.FONT_WEIGHT,
-        )
-        pyplot.show(block=False)
-        self.root.update()
+        self.journal.flush()
+        for observer in self.observers:
+            observer.refresh(self)
 
     def eliminate_player(self, player):
         self.card_deck.give_back(player.cards)
         self.players.remove(player)
         self.eliminated_players.append(player)
+        self.journal.record(PlayerEliminated, player)
         self.print_slow('\nWith no remaining territories, {} has been eliminated!'.format(player.name))
 
     def fortify_territory(self, from_territory, to_territory, num_armies):
-        self.change_armies(from_territory, -num_armies)
-        self.change_armies(to_territory, num_armies)
-
-    def get_or_create_territory(self, territory_name, continent_name):
-        for territory in self.all_territories:
-            if territory.name == territory_name:
-                # Continent field updated if territory was first declared as neighbor
-                if continent_name and not territory.continent:
-                    territory.continent = continent_name
-                return territory
-        new_territory = Territory(territory_name, continent_name)
-        self.all_territories.append(new_territory)
-        return new_territory
-
-    def get_window_dimensions(self):
-        # Match window dimensions to aspect ratio of computer
-        return self.root.winfo_screenmmwidth() / 30, self.root.winfo_screenmmheight() / 40
+        self.action_log.record(MOVE, from_territory.index, to_territory.index, num_armies)
+        self.move_armies(from_territory, to_territory, num_armies)
 
     def initial_army_placement(self):
-        available_territories = list.copy(self.all_territories)
+        self.run_steps(self.initial_army_placement_steps())
+
+    async def initial_army_placement_async(self, input_provider):
+        await self.run_steps_async(self.initial_army_placement_steps(), input_provider)
+
+    def initial_army_placement_steps(self):
+        if self.instrumentation is not None:
+            self.instrumentation.enter_phase(SETUP_PHASE)
+        available_territories = list(self.all_territories)
         # Claim all initial territories
         for i in range(len(self.all_territories)):
             current_player = self.players[i % len(self.players)]
             if current_player.is_human:
-                self.print_territory_info(available_territories)
                 query = '\n{}\'s turn to place an army. Select the number of the territory to claim: '.format(
                     current_player.name,
                 )
-                selection = self.retrieve_numerical_input(query, len(available_territories) - 1)
+                selection = yield NumberRequest(
+                    current_player,
+                    query,
+                    len(available_territories) - 1,
+                    available_territories,
+                )
                 initial_selection = available_territories[selection]
             else:
-                initial_selection = current_player.claim_territory(available_territories)
+                initial_selection = yield from self.decide_steps(current_player.claim_territory, available_territories)
                 self.print_slow('\n{} claimed {}.'.format(current_player.name, initial_selection.name))
             self.select_territory_initial(current_player, initial_selection, 1)
             available_territories.remove(initial_selection)
@@ -270,61 +396,219 @@ class GameOfRisk:
                 self.print_slow('\n{}\'s turn to reinforce territories.'.format(player.name))
             if player.is_human:
                 while player.army_count > 0:
-                    self.print_territory_info(player.controlled_territories)
                     query = 'Select the number of a territory to reinforce: '
-                    reinforce_index = self.retrieve_numerical_input(
+                    reinforce_index = yield NumberRequest(
+                        player,
                         query,
                         len(player.controlled_territories) - 1,
+                        player.controlled_territories,
                     )
                     reinforce_territory = player.controlled_territories[reinforce_index]
                     query = 'How many additional armies would you like to place in {}? (Up to {}) '.format(
                         reinforce_territory.name,
                         player.army_count,
                     )
-                    reinforcement = self.retrieve_numerical_input(query, player.army_count)
-                    self.change_armies(reinforce_territory, reinforcement)
-                    player.army_count -= reinforcement
+                    reinforcement = yield NumberRequest(player, query, player.army_count)
+                    self.place_armies(player, reinforce_territory, reinforcement)
             else:
-                reinforced_territory_names = player.reinforce_initial()
+                reinforced_territory_names = []
+                for territory, num_armies in (yield from self.decide_steps(player.initial_reinforcements)):
+                    self.place_armies(player, territory, num_armies)
+                    reinforced_territory_names.append(territory.name)
                 self.print_slow('\n{} reinforced {}.'.format(player.name, ', '.join(reinforced_territory_names)))
         self.print_slow('\nReinforcement completed.\n')
+        if self.instrumentation is not None:
+            self.instrumentation.enter_phase(None)
+
+    # Moves armies without logging the move, for armies that follow from another action such as a conquest
+    def move_armies(self, from_territory, to_territory, num_armies):
+        self.change_armies(from_territory, -num_armies)
+        self.change_armies(to_territory, num_armies)
+        self.journal.record(ArmiesMoved, from_territory, to_territory, num_armies)
+
+    # Places armies from the initial army count of a player
+    def place_armies(self, player, territory, num_armies):
+        self.action_log.record(PLACE, player.id, territory.index, num_armies)
+        self.change_armies(territory, num_armies)
+        player.army_count -= num_armies
+
+    # Game can be stopped without a winner after max_turns turns, such as in tournaments between computer players
+    def play(self, max_turns=None):
+        self.run_steps(self.play_steps(max_turns))
+
+    # Plays the game on the running event loop, waiting on input_provider for the decisions of human players
+    async def play_async(self, input_provider, max_turns=None):
+        await self.run_steps_async(self.play_steps(max_turns), input_provider)
 
-    def play(self):
+    def play_steps(self, max_turns):
         self.print_slow('\nGAME OF RISK: {}\n'.format(self.title.upper()))
-        self.initial_army_placement()
+        yield from self.initial_army_placement_steps()
         current_turn = 0
-        while len(self.players) > 1:
+        while len(self.players) > 1 and (max_turns is None or self.turns_played < max_turns):
             # Visualize risk map
             self.draw_risk_map()
-            self.turn(self.players[current_turn])
+            yield from self.turn_steps(self.players[current_turn])
+            self.turns_played += 1
+            # Turns end with None instead of a request, where asynchronous games let other games run
+            yield None
             # Index next player for turn or cycle back to first player
             current_turn = current_turn + 1 if current_turn < len(self.players) - 1 else 0
-        winner = self.players[0].name
-        confetti = '*' * (len(winner) + 8)
-        self.print_slow('\n{0}\n*{1} wins!*\n{0}\n'.format(confetti, winner))
-        # Spin down visualization
-        pyplot.close(self.ALL_WINDOWS)
-        self.root.update_idletasks()
-        self.root.destroy()
-
-    def position_risk_map(self):
-        for territory in self.all_territories:
-            # Include territory in map
-            self.risk_map.add_node(territory.name)
-            # Initiate with empty color
-            self.node_colors.append(self.EMPTY_NODE_COLOR)
-            # Label territory with name, army count, and occupying player
-            self.labels[territory.name] = '{}\n0 armies\n'.format(territory.name)
-            for neighbor in territory.neighbors:
-                self.risk_map.add_edge(territory.name, neighbor.name)
-        # Position nodes using a cost function based on path length
-        self.layout = networkx.kamada_kawai_layout(self.risk_map)
+        if len(self.players) == 1:
+            winner = self.players[0].name
+            confetti = '*' * (len(winner) + 8)
+            self.print_slow('\n{0}\n*{1} wins!*\n{0}\n'.format(confetti, winner))
+        else:
+            self.print_slow('\nNo winner after {} turns.\n'.format(self.turns_played))
+        self.journal.flush()
+        # Spin down observers
+        for observer in self.observers:
+            observer.close(self)
+
+    def print_battle_report(self, losing_territory, loss_amount):
+        army_description = 'armies' if loss_amount > 1 else 'army'
+        self.announce('{} lost {} {} from {}.'.format(
+            losing_territory.occupying_player,
+            loss_amount,
+            army_description,
+            losing_territory.name,
+        ))
+
+    def print_slow(self, output_string):
+        self.announce(output_string, pause=True)
+
+    def read_compiled_map(self, compiled_map, territory_limit):
+        if territory_limit is not None and len(compiled_map) > territory_limit:
+            raise Exception('{} is the maximum number of territories allowed'.format(territory_limit))
+        self.title = compiled_map.title
+        for player_name in compiled_map.human_players:
+            self.add_player(player_name, is_human=True)
+        for player_name in compiled_map.computer_players:
+            self.add_player(player_name, is_human=False)
+        self.board = Board.from_compiled_map(compiled_map)
+        self.one_sided_neighbors = list(compiled_map.one_sided_neighbors)
+
+    def read_game_file(self, game_file, territory_limit):
+        map_builder = MapBuilder()
+        # Read each line of data file to populate information for game
+        with open(game_file, 'r') as f:
+            i = 0
+            for i, info in enumerate(f):
+                # Number of territories exceeds limit, which can be lifted for large maps with None
+                if territory_limit is not None and i - 3 >= territory_limit:
+                    raise Exception('{} is the maximum number of territories allowed'.format(territory_limit))
+                # First line: title of game
+                if i == 0:
+                    self.title = info.strip()
+                # Second line: human players
+                elif i == 1:
+                    self.set_players(info)
+                # Third line: computer players
+                elif i == 2:
+                    self.set_players(info, is_human=False)
+                # Remaining lines: territory configurations
+                else:
+                    self.set_territory(info, map_builder)
+            if i < 3:
+                raise Exception('uploaded file does not contain enough information to create a game')
+        undeclared_territories = map_builder.undeclared_territories()
+        if undeclared_territories:
+            raise Exception('{} has been specified as a neighbor but has not been declared itself'.format(
+                undeclared_territories[0]
+            ))
+        self.one_sided_neighbors = map_builder.one_sided_neighbors()
+        self.board = map_builder.build()
+
+    def reinforce_territory(self, territory, num_armies):
+        self.action_log.record(REINFORCE, territory.index, num_armies)
+        self.change_armies(territory, num_armies)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    # Plays back actions from the action log of a game on the same map into this freshly loaded game, without
+    # asking any player for decisions or rolling any dice. Headless games replay without narration or pauses.
+    def replay(self, action_log):
+        territories = self.all_territories
+        players = self.board.players
+        for action in action_log:
+            code = action[0]
+            if code == BATTLE:
+                self.attack_territory(territories[action[1]], territories[action[2]], *action[3:])
+            elif code == CLAIM:
+                self.select_territory_initial(players[action[1]], territories[action[2]], action[3])
+            elif code == DRAW:
+                self.calculate_reinforcements(players[action[1]], action[2])
+            elif code == MOVE:
+                self.fortify_territory(territories[action[1]], territories[action[2]], action[3])
+            elif code == PLACE:
+                self.place_armies(players[action[1]], territories[action[2]], action[3])
+            elif code == REINFORCE:
+                self.reinforce_territory(territories[action[1]], action[2])
+            elif code == TURN:
+                self.action_log.record(TURN, action[1])
+                self.turns_played += 1
+            else:
+                raise Exception('{} is not an action that can be replayed'.format(action))
+
+    # Returns the game to a snapshot taken from this game or another game on the same map. Every territory and player
+    # is written again, which takes time in proportion to the map, so searches that return to a position over and
+    # over should take back their moves with undo_move instead and only restore once per search
+    def restore(self, snapshot):
+        roster = self.board.players
+        for player in roster:
+            player.controlled_territories.clear()
+        # With nothing controlled, state arrays can be written without keeping frontiers up to date
+        self.board.owners[:] = snapshot.owners
+        self.board.armies[:] = snapshot.armies
+        self.board.recount_totals()
+        for player in roster:
+            player.controlled_territories.extend(
+                self.all_territories[i] for i in snapshot.controlled_territories[player.id]
+            )
+            player.army_count = snapshot.army_counts[player.id]
+            player.cards = list(snapshot.cards[player.id])
+        self.players = [roster[player_id] for player_id in snapshot.player_ids]
+        self.eliminated_players = [roster[player_id] for player_id in snapshot.eliminated_player_ids]
+        self.card_deck.cards = list(snapshot.deck)
+        self.armies_for_card_trade = snapshot.armies_for_card_trade
+        self.undo_stack = []
+
+    # Plays steps, a generator that yields a NumberRequest for each decision of a human player and None after each
+    # decision of a computer player and between turns, answering each request from the console
+    def run_steps(self, steps):
+        answer = None
+        try:
+            while True:
+                request = steps.send(answer)
+                answer = None
+                if request is None:
+                    continue
+                if request.territories is not None:
+                    self.print_territory_info(request.territories)
+                answer = self.retrieve_numerical_input(request.query, request.limit)
+        except StopIteration:
+            pass
+
+    async def run_steps_async(self, steps, input_provider):
+        answer = None
+        while True:
+            try:
+                request = steps.send(answer)
+            except StopIteration:
+                return
+            answer = None
+            if request is None:
+                await asyncio.sleep(0)
+            else:
+                answer = await input_provider.request_number(request)
 
     def select_territory_initial(self, player, territory, num_armies):
+        self.action_log.record(CLAIM, player.id, territory.index, num_armies)
         self.change_armies(territory, num_armies)
         player.army_count -= num_armies
         territory.occupying_player = player
         player.controlled_territories.append(territory)
+        self.journal.record(OwnerChanged, territory, None, player)
 
     def set_players(self, line_info, is_human=True):
         player_type = 'human' if is_human else 'computer'
@@ -335,16 +619,7 @@ class GameOfRisk:
         try:
             while i < num_players + 1:
                 if info_items[i]:
-                    player_name = info_items[i].strip()
-                    if is_human:
-                        self.players.append(HumanPlayer(player_name))
-                    else:
-                        self.players.append(ComputerPlayer(player_name))
-                    # Track player color for visualization
-                    if self.COLOR_COUNTER >= len(self.COLORS):
-                        raise Exception('too many {} players have been declared'.format(player_type))
-                    self.player_colors[player_name] = self.COLORS[self.COLOR_COUNTER]
-                    self.COLOR_COUNTER += 1
+                    self.add_player(info_items[i].strip(), is_human)
                     i += 1
                 else:
                     raise Exception('a {} player with no name has been declared'.format(player_type))
@@ -363,19 +638,43 @@ class GameOfRisk:
                 len(info_items) - 1,
             ))
 
-    def set_territory(self, line_info):
+    def set_territory(self, line_info, map_builder):
         info_items = line_info.split('|')
         try:
-            current_territory = self.get_or_create_territory(info_items[0].strip(), info_items[1].strip())
-            neighbor_list = []
+            territory_id = map_builder.get_or_create_territory(info_items[0].strip(), info_items[1].strip())
             for neighbor in info_items[2:]:
-                neighbor_list.append(self.get_or_create_territory(neighbor.strip(), None))
-            current_territory.neighbors.extend(neighbor_list)
+                map_builder.add_neighbor(territory_id, neighbor.strip())
         except IndexError:
             raise Exception('all territories must belong to a continent and have at least one neighbor')
 
+    def snapshot(self):
+        roster = self.board.players
+        return GameSnapshot(
+            owners=self.board.owners[:],
+            armies=self.board.armies[:],
+            player_ids=[player.id for player in self.players],
+            eliminated_player_ids=[player.id for player in self.eliminated_players],
+            controlled_territories=[[t.index for t in player.controlled_territories] for player in roster],
+            army_counts=[player.army_count for player in roster],
+            cards=[list(player.cards) for player in roster],
+            deck=list(self.card_deck.cards),
+            armies_for_card_trade=self.armies_for_card_trade,
+        )
+
     def turn(self, player):
+        self.run_steps(self.turn_steps(player))
+
+    async def turn_async(self, player, input_provider):
+        await self.run_steps_async(self.turn_steps(player), input_provider)
+
+    # Phases of a turn, each decision of a human player yielded as a NumberRequest
+    def turn_phase_steps(self, player):
+        metrics = self.instrumentation
+        if metrics is not None:
+            metrics.count(TURNS)
+            metrics.enter_phase(REINFORCE_PHASE)
         player_address = 'You' if player.is_human else player.name
+        self.action_log.record(TURN, player.id)
         border = '-' * (len(player.name) + 12)
         self.print_slow('\n{0}\n| {1}\'s turn. |\n{0}'.format(border, player.name))
 
@@ -389,19 +688,25 @@ class GameOfRisk:
 
         if player.is_human:
             while reinforcements > 0:
-                self.print_territory_info(player.controlled_territories)
                 self.print_slow('Here are the territories that you control.')
                 query = 'Select the number of the territory you\'d like to reinforce: '
-                reinforce_index = self.retrieve_numerical_input(query, len(player.controlled_territories) - 1)
+                reinforce_index = yield NumberRequest(
+                    player,
+                    query,
+                    len(player.controlled_territories) - 1,
+                    player.controlled_territories,
+                )
                 query = 'How many armies would you like to place in {}? (up to {}) '.format(
                     player.controlled_territories[reinforce_index].name,
                     reinforcements,
                 )
-                reinforcement_count = self.retrieve_numerical_input(query, reinforcements)
-                self.change_armies(player.controlled_territories[reinforce_index], reinforcement_count)
+                reinforcement_count = yield NumberRequest(player, query, reinforcements)
+                self.reinforce_territory(player.controlled_territories[reinforce_index], reinforcement_count)
                 reinforcements -= reinforcement_count
         else:
-            attack_route = player.choose_attack_route(territories_for_attack, reinforcements)
+            attack_route = yield from self.decide_steps(
+                player.choose_attack_route, territories_for_attack, reinforcements,
+            )
             # Reinforce territory with fewest armies if no attack is advisable
             if attack_route:
                 territory_to_reinforce = attack_route[0]
@@ -412,28 +717,38 @@ class GameOfRisk:
                 territory_to_reinforce.name,
                 reinforcements,
             ))
-            self.change_armies(territory_to_reinforce, reinforcements)
+            self.reinforce_territory(territory_to_reinforce, reinforcements)
 
         # Phase 2: attack
+        if metrics is not None:
+            metrics.enter_phase(ATTACK_PHASE)
         attack = 0
         if len(territories_for_attack) > 0:
             if player.is_human:
                 self.print_slow('\nPHASE 2: ATTACK\n')
                 query = 'Would you like to attack? (1 = yes, 0 = no) '
-                attack = self.retrieve_numerical_input(query, 1)
+                attack = yield NumberRequest(player, query, 1)
             else:
                 attack = 1 if attack_route else 0
         while attack == 1 and len(self.players) > 1:
             if player.is_human:
-                self.print_territory_info(territories_for_attack)
                 query = 'Select the number of the territory you\'d like to attack: '
-                attack_choice = self.retrieve_numerical_input(query, len(territories_for_attack) - 1)
+                attack_choice = yield NumberRequest(
+                    player,
+                    query,
+                    len(territories_for_attack) - 1,
+                    territories_for_attack,
+                )
                 to_be_attacked = territories_for_attack[attack_choice]
                 attacking_territories = self.get_surrounding_territories(player, to_be_attacked)
                 # Display available territories to attack from
-                self.print_territory_info(attacking_territories)
                 query = 'Select the number of the territory you\'d like to attack from: '
-                attacking_territory_choice = self.retrieve_numerical_input(query, len(attacking_territories) - 1)
+                attacking_territory_choice = yield NumberRequest(
+                    player,
+                    query,
+                    len(attacking_territories) - 1,
+                    attacking_territories,
+                )
                 to_attack_from = attacking_territories[attacking_territory_choice]
             else:
                 to_be_attacked = attack_route[1]
@@ -445,7 +760,7 @@ class GameOfRisk:
                 attack_limit = 3 if to_attack_from.occupying_armies >= 4 else to_attack_from.occupying_armies - 1
                 if player.is_human:
                     query = 'How many armies do you want to attack with? (up to {}) '.format(attack_limit)
-                    attacking_armies = self.retrieve_numerical_input(query, attack_limit)
+                    attacking_armies = yield NumberRequest(player, query, attack_limit)
                 else:
                     attacking_armies = attack_limit
                     army_tag = 'army' if attacking_armies == 1 else 'armies'
@@ -463,7 +778,7 @@ class GameOfRisk:
                         to_be_attacked.name,
                         defend_limit,
                     )
-                    defending_armies = self.retrieve_numerical_input(query, defend_limit)
+                    defending_armies = yield NumberRequest(defending_player, query, defend_limit)
                 else:
                     defending_armies = defend_limit
                     army_tag = 'army' if defending_armies == 1 else 'armies'
@@ -486,15 +801,17 @@ class GameOfRisk:
                     ))
                     move_limit = to_attack_from.occupying_armies - 1
                     if len(self.players) == 1:
+                        if metrics is not None:
+                            metrics.enter_phase(None)
                         return
                     if move_limit > 0:
                         if player.is_human:
                             query = 'How many additional armies would you like to move there? (up to {}) '.format(
                                     move_limit,
                             )
-                            num_armies = self.retrieve_numerical_input(query, move_limit)
+                            num_armies = yield NumberRequest(player, query, move_limit)
                         else:
-                            num_armies = player.armies_to_move(to_attack_from, move_limit)
+                            num_armies = yield from self.decide_steps(player.armies_to_move, to_attack_from, move_limit)
                             army_tag = 'army' if num_armies == 1 else 'armies'
                             self.print_slow('\n{} moved {} additional {} to {}.'.format(
                                 player.name,
@@ -507,7 +824,7 @@ class GameOfRisk:
 
                 attack_loss = to_attack_with_count_before - to_attack_from.occupying_armies
                 defend_loss = to_be_attacked_count_before - to_be_attacked.occupying_armies
-                print('\n')
+                self.announce('\n')
                 if attack_loss > 0 and defend_loss == 0:
                     self.print_battle_report(to_attack_from, attack_loss)
                 elif defend_loss > 0 and attack_loss == 0:
@@ -534,9 +851,12 @@ class GameOfRisk:
                 else:
                     if player.is_human:
                         query = 'Would you like to continue the battle? (1 = yes, 0 = no) '
-                        fight = self.retrieve_numerical_input(query, 1)
+                        fight = yield NumberRequest(player, query, 1)
                     else:
-                        fight = 1 if to_attack_from.occupying_armies >= to_be_attacked.occupying_armies else 0
+                        continue_battle = yield from self.decide_steps(
+                            player.continue_battle, to_attack_from, to_be_attacked,
+                        )
+                        fight = 1 if continue_battle else 0
                     if fight == 0:
                         if not player.is_human:
                             self.print_slow('\n{} is not continuing the battle.'.format(player.name))
@@ -548,12 +868,14 @@ class GameOfRisk:
                 break
             if player.is_human:
                 query = 'Would you like to attack another territory? (1 = yes, 0 = no) '
-                attack = self.retrieve_numerical_input(query, 1)
+                attack = yield NumberRequest(player, query, 1)
             else:
-                attack_route = player.choose_attack_route(territories_for_attack, 0)
+                attack_route = yield from self.decide_steps(player.choose_attack_route, territories_for_attack, 0)
                 attack = 1 if attack_route else 0
 
         # Phase 3: fortify
+        if metrics is not None:
+            metrics.enter_phase(FORTIFY_PHASE)
         territories_to_fortify = self.get_territories_to_fortify(player)
         fortify_route = None
 
@@ -562,20 +884,18 @@ class GameOfRisk:
             if player.is_human:
                 self.print_slow('\nPHASE 3: FORTIFY\n')
                 query = 'Would you like to fortify any territories? (1 = yes, 0 = no) '
-                fortify = self.retrieve_numerical_input(query, 1)
+                fortify = yield NumberRequest(player, query, 1)
             else:
-                fortify_route = player.choose_fortify_route()
+                fortify_route = yield from self.decide_steps(player.choose_fortify_route)
                 fortify = 1 if fortify_route else 0
         if fortify == 1:
             if player.is_human:
-                self.print_territory_info(territories_to_fortify)
                 query = 'Select the number of the territory you\'d like to move armies to: '
-                index_to = self.retrieve_numerical_input(query, len(territories_to_fortify) - 1)
+                index_to = yield NumberRequest(player, query, len(territories_to_fortify) - 1, territories_to_fortify)
                 territory_to = territories_to_fortify[index_to]
                 occupied_territories = self.get_surrounding_territories(player, territory_to)
-                self.print_territory_info(occupied_territories)
                 query = 'Select the number of the territory you\'d like to move armies from: '
-                index_from = self.retrieve_numerical_input(query, len(occupied_territories) - 1)
+                index_from = yield NumberRequest(player, query, len(occupied_territories) - 1, occupied_territories)
                 territory_from = occupied_territories[index_from]
                 fortify_limit = territory_from.occupying_armies - 1
                 query = 'How many armies would you like to move from {} to {}? (up to {}) '.format(
@@ -583,7 +903,7 @@ class GameOfRisk:
                     territory_to.name,
                     fortify_limit,
                 )
-                num_armies = self.retrieve_numerical_input(query, fortify_limit)
+                num_armies = yield NumberRequest(player, query, fortify_limit)
             else:
                 territory_from = fortify_route[0]
                 territory_to = fortify_route[1]
@@ -599,28 +919,62 @@ class GameOfRisk:
                     ))
             self.fortify_territory(territory_from, territory_to, num_armies)
         self.print_slow('\nEnd of turn.\n')
+        if metrics is not None:
+            metrics.enter_phase(None)
+
+    def turn_steps(self, player):
+        yield from self.turn_phase_steps(player)
+        # Changes are delivered after every turn, so games played turn by turn never let the journal pile up
+        self.journal.flush()
+
+    # Takes back the last move made with apply_move
+    def undo_move(self):
+        move, undo_info, log_length = self.undo_stack.pop()
+        self.action_log.truncate(log_length)
+        move_type = type(move)
+        if move_type is Reinforce:
+            self.change_armies(move.territory, -move.num_armies)
+        elif move_type is CollectReinforcements:
+            deck, cards, armies_for_card_trade = undo_info
+            self.card_deck.cards = deck
+            move.player.cards = cards
+            self.armies_for_card_trade = armies_for_card_trade
+        elif move_type is Claim:
+            move.player.controlled_territories.remove(move.territory)
+            move.territory.occupying_player = None
+            self.journal.record(OwnerChanged, move.territory, move.player, None)
+            self.change_armies(move.territory, -move.num_armies)
+            move.player.army_count += move.num_armies
+        elif move_type is AttackStep:
+            attacking_armies, defending_armies, defending_player, position, eliminated_state = undo_info
+            attacking_territory, defending_territory = move.attacking_territory, move.defending_territory
+            attacking_player = defending_territory.occupying_player
+            if attacking_player != defending_player:
+                attacking_player.controlled_territories.remove(defending_territory)
+                defending_territory.occupying_player = defending_player
+                self.journal.record(OwnerChanged, defending_territory, attacking_player, defending_player)
+                defending_player.controlled_territories.insert(defending_territory, position)
+            self.change_armies(attacking_territory, attacking_armies - attacking_territory.occupying_armies)
+            self.change_armies(defending_territory, defending_armies - defending_territory.occupying_armies)
+            if eliminated_state and defending_player in self.eliminated_players:
+                self.players, self.card_deck.cards = eliminated_state
+                self.eliminated_players.remove(defending_player)
+        else:
+            self.change_armies(move.to_territory, -move.num_armies)
+            self.change_armies(move.from_territory, move.num_armies)
 
-    def update_risk_map(self):
-        node_list = list(self.risk_map.nodes)
-        for territory in self.all_territories:
-            # Change color to reflect occupation
-            if territory.occupying_player:
-                node_index = node_list.index(territory.name)
-                self.node_colors[node_index] = self.player_colors[territory.occupying_player.name]
-            army_tag = 'army' if territory.occupying_armies == 1 else 'armies'
-            occupier = '' if not territory.occupying_player else territory.occupying_player.name
-            # Label territory with name, army count, and occupying player
-            self.labels[territory.name] = '{}\n{} {}\n{}'.format(
-                territory.name,
-                territory.occupying_armies,
-                army_tag,
-                occupier,
-            )
+    @classmethod
+    # Loads the compiled version of a data file, compiling and caching it first if it has changed
+    def compile_map(cls, game_file, cache_directory=CACHE_DIRECTORY):
+        path = compiled_map_path(game_file, cache_directory)
+        if not os.path.exists(path):
+            write_compiled_map(cls(game_file, headless=True, territory_limit=None), path)
+        return load_compiled_map(path)
 
-    @staticmethod
     # Accepts positive or negative integer to increase or decrease armies in a territory
-    def change_armies(territory, num_armies):
+    def change_armies(self, territory, num_armies):
         territory.occupying_armies += num_armies
+        self.journal.record(ArmiesChanged, territory, num_armies)
 
     @staticmethod
     # Finds list of neighbors controlled by player
@@ -632,69 +986,26 @@ class GameOfRisk:
         return surrounding_territories
 
     @staticmethod
+    # Enemy or unoccupied neighbors of player territories with more than one army, found from the player's frontier
     def get_territories_for_attack(player):
-        territories_for_attack = []
-        for territory in player.controlled_territories:
-            if territory.occupying_armies > 1:
-                for neighbor in territory.neighbors:
-                    if neighbor.occupying_player != player and neighbor not in territories_for_attack:
-                        territories_for_attack.append(neighbor)
-        return territories_for_attack
+        return player.frontier.attack_targets()
 
     @staticmethod
+    # Player-held neighbors of player territories with more than one army, found from the player's frontier
     def get_territories_to_fortify(player):
-        territories_to_fortify = []
-        for territory in player.controlled_territories:
-            if territory.occupying_armies > 1:
-                for neighbor in territory.neighbors:
-                    if neighbor.occupying_player == player and neighbor not in territories_to_fortify:
-                        territories_to_fortify.append(neighbor)
-        return territories_to_fortify
-
-    @staticmethod
-    def print_battle_report(losing_territory, loss_amount):
-        army_description = 'armies' if loss_amount > 1 else 'army'
-        print('{} lost {} {} from {}.'.format(
-            losing_territory.occupying_player,
-            loss_amount,
-            army_description,
-            losing_territory.name,
-        ))
-
-    @staticmethod
-    def print_slow(output_string):
-        print(output_string)
-        sleep(1.0)
+        return player.frontier.fortify_targets()
 
     @staticmethod
     def print_territory_info(territory_list):
         print('\n')
-        for i, territory in enumerate(territory_list):
-            occupant = territory.occupying_player.name if territory.occupying_player else 'unoccupied'
-            print('[{}] {}, {} -- {}, {} armies'.format(
-                i,
-                territory.name,
-                territory.continent,
-                occupant,
-                territory.occupying_armies,
-            ))
+        for line in territory_lines(territory_list):
+            print(line)
         print('\n')
 
     @staticmethod
     def retrieve_numerical_input(query_string, n):
         user_input = input(query_string)
         while not (user_input.isnumeric() and 0 <= int(user_input) <= n):
-            print("Oops, looks like that wasn't a valid number.")
+            print(INVALID_NUMBER_MESSAGE)
             user_input = input(query_string)
         return int(user_input)
-
-    @staticmethod
-    def roll_dice(num_rolls):
-        rolls = []
-        for _ in range(num_rolls):
-            current_roll = randint(1, 6)
-            i = 0
-            while i < len(rolls) and current_roll < rolls[i]:
-                i += 1
-            rolls.insert(i, current_roll)
-        return rolls
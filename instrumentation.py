@@ -0,0 +1,128 @@
+from bisect import bisect_left
+import json
+from time import perf_counter, process_time
+
+# Phases of a game, the last three making up each turn
+SETUP_PHASE = 'setup'
+REINFORCE_PHASE = 'reinforce'
+ATTACK_PHASE = 'attack'
+FORTIFY_PHASE = 'fortify'
+PHASES = (SETUP_PHASE, REINFORCE_PHASE, ATTACK_PHASE, FORTIFY_PHASE)
+# Counters
+BATTLES = 'battles'
+CARD_TRADES = 'card_trades'
+CONQUESTS = 'conquests'
+ROLLS = 'rolls'
+TURNS = 'turns'
+COUNTERS = (BATTLES, CARD_TRADES, CONQUESTS, ROLLS, TURNS)
+# Upper bounds in seconds of the buckets of decision latency histograms, with a last bucket for anything slower
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRIC_PREFIX = 'risk'
+
+
+class Instrumentation:
+    """
+    Wall and CPU time spent in each phase, counts of what happened in the game, and histograms of how long
+    computer players took over each kind of decision. A game only measures anything when it is given an
+    Instrumentation, and otherwise checks a single attribute at each phase, battle and card draw.
+
+    Each phase runs from enter_phase until the next phase is entered, or until enter_phase(None) at the end of
+    a turn. Measurements can be exported with as_dict for JSON or with prometheus_text for the Prometheus text
+    exposition format.
+    """
+
+    def __init__(self):
+        self.phase_counts = dict.fromkeys(PHASES, 0)
+        self.phase_wall_seconds = dict.fromkeys(PHASES, 0.0)
+        self.phase_cpu_seconds = dict.fromkeys(PHASES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        # Per decision name, the count in each bucket (not cumulative) followed by the count of slower decisions
+        self.decision_buckets = dict()
+        self.decision_seconds = dict()
+        self.phase = None
+        self.phase_started = None
+
+    def as_dict(self):
+        return {
+            'phases': {
+                phase: {
+                    'count': self.phase_counts[phase],
+                    'wall_seconds': self.phase_wall_seconds[phase],
+                    'cpu_seconds': self.phase_cpu_seconds[phase],
+                }
+                for phase in PHASES
+            },
+            'counters': dict(self.counters),
+            'decisions': {
+                name: {
+                    'count': sum(buckets),
+                    'sum_seconds': self.decision_seconds[name],
+                    'buckets': [[bound, count] for bound, count in zip(LATENCY_BUCKETS + (None,), buckets)],
+                }
+                for name, buckets in sorted(self.decision_buckets.items())
+            },
+        }
+
+    def count(self, counter, amount=1):
+        self.counters[counter] += amount
+
+    # Ends the phase in progress, if any, and starts timing phase unless it is None
+    def enter_phase(self, phase):
+        wall, cpu = perf_counter(), process_time()
+        if self.phase is not None:
+            started_wall, started_cpu = self.phase_started
+            self.phase_counts[self.phase] += 1
+            self.phase_wall_seconds[self.phase] += wall - started_wall
+            self.phase_cpu_seconds[self.phase] += cpu - started_cpu
+        self.phase = phase
+        self.phase_started = (wall, cpu)
+
+    def prometheus_text(self):
+        lines = []
+
+        def metric(name, metric_type, description, samples):
+            full_name = '{}_{}'.format(METRIC_PREFIX, name)
+            lines.append('# HELP {} {}'.format(full_name, description))
+            lines.append('# TYPE {} {}'.format(full_name, metric_type))
+            for suffix, labels, value in samples:
+                label_text = ','.join('{}="{}"'.format(key, label) for key, label in labels)
+                lines.append('{}{}{} {}'.format(full_name, suffix, '{' + label_text + '}' if labels else '', value))
+
+        metric('phase_wall_seconds_total', 'counter', 'Wall time spent in each phase.',
+               [('', [('phase', phase)], self.phase_wall_seconds[phase]) for phase in PHASES])
+        metric('phase_cpu_seconds_total', 'counter', 'CPU time spent in each phase.',
+               [('', [('phase', phase)], self.phase_cpu_seconds[phase]) for phase in PHASES])
+        metric('phases_total', 'counter', 'Number of times each phase was played.',
+               [('', [('phase', phase)], self.phase_counts[phase]) for phase in PHASES])
+        for counter in COUNTERS:
+            metric('{}_total'.format(counter), 'counter', 'Number of {}.'.format(counter.replace('_', ' ')),
+                   [('', [], self.counters[counter])])
+        samples = []
+        for name, buckets in sorted(self.decision_buckets.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                samples.append(('_bucket', [('decision', name), ('le', bound)], cumulative))
+            samples.append(('_sum', [('decision', name)], self.decision_seconds[name]))
+            samples.append(('_count', [('decision', name)], cumulative))
+        metric('decision_seconds', 'histogram', 'Time computer players took to make each kind of decision.', samples)
+        return '\n'.join(lines) + '\n'
+
+    def record_decision(self, name, seconds):
+        buckets = self.decision_buckets.get(name)
+        if buckets is None:
+            buckets = self.decision_buckets[name] = [0] * (len(LATENCY_BUCKETS) + 1)
+            self.decision_seconds[name] = 0.0
+        buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.decision_seconds[name] += seconds
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    # Makes a decision by calling decision with args, recording how long it took under the decision's name
+    def time_decision(self, decision, *args):
+        start = perf_counter()
+        result = decision(*args)
+        self.record_decision(decision.__name__, perf_counter() - start)
+        return result
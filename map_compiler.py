@@ -0,0 +1,140 @@
+from hashlib import sha256
+import json
+import mmap
+import os
+
+import numpy
+
+CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'game_of_risk', 'maps')
+FILE_EXTENSION = '.riskmap'
+FORMAT_VERSION = 1
+MAGIC = b'RISKMAP\0'
+# Arrays are stored in this order after the metadata, each aligned to 8 bytes
+ARRAY_NAMES = ['continent_ids', 'neighbor_offsets', 'neighbor_targets', 'name_offsets', 'name_data']
+
+
+class CompiledMap:
+    """
+    Binary map artifact, laid out as MAGIC, the length of the JSON metadata as 8 little-endian bytes, the
+    metadata itself, then the arrays named in ARRAY_NAMES. Neighbors are stored as CSR adjacency, where the
+    neighbors of territory i are neighbor_targets[neighbor_offsets[i]:neighbor_offsets[i + 1]]. Names are
+    stored the same way as UTF-8 bytes in name_data. Arrays are read straight from the memory-mapped file, so
+    opening a compiled map costs nothing per territory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise Exception('{} is not a compiled map'.format(path))
+        metadata_start = len(MAGIC) + 8
+        metadata_length = int.from_bytes(self.buffer[len(MAGIC):metadata_start], 'little')
+        metadata = json.loads(self.buffer[metadata_start:metadata_start + metadata_length].decode('utf-8'))
+        if metadata['version'] != FORMAT_VERSION:
+            raise Exception('{} was compiled with an unsupported format version'.format(path))
+        self.title = metadata['title']
+        self.human_players = metadata['human_players']
+        self.computer_players = metadata['computer_players']
+        self.continent_names = metadata['continent_names']
+        self.one_sided_neighbors = [tuple(pair) for pair in metadata['one_sided_neighbors']]
+        for name in ARRAY_NAMES:
+            dtype, count, offset = metadata['arrays'][name]
+            setattr(self, name, numpy.frombuffer(self.buffer, dtype=dtype, count=count, offset=offset))
+
+    def __len__(self):
+        return len(self.continent_ids)
+
+    def neighbor_indices(self, territory_index):
+        start, end = self.neighbor_offsets[territory_index], self.neighbor_offsets[territory_index + 1]
+        return self.neighbor_targets[start:end]
+
+    def territory_names(self):
+        return TerritoryNames(self.name_offsets, self.name_data)
+
+
+class TerritoryNames:
+    """
+    Names of the territories of a compiled map, each decoded from name_data the first time it is looked up.
+    """
+
+    def __init__(self, name_offsets, name_data):
+        self.name_offsets = name_offsets
+        self.name_data = name_data
+        self.names = [None] * (len(name_offsets) - 1)
+
+    def __getitem__(self, index):
+        name = self.names[index]
+        if name is None:
+            index %= len(self.names)
+            start, end = self.name_offsets[index], self.name_offsets[index + 1]
+            name = self.names[index] = self.name_data[start:end].tobytes().decode('utf-8')
+        return name
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self.names)))
+
+    def __len__(self):
+        return len(self.names)
+
+
+# Compiled maps are named by a hash of the data file contents, so edited files are compiled again
+def compiled_map_path(game_file, cache_directory=CACHE_DIRECTORY):
+    file_hash = sha256('{}\n'.format(FORMAT_VERSION).encode('utf-8'))
+    with open(game_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(block)
+    return os.path.join(cache_directory, file_hash.hexdigest() + FILE_EXTENSION)
+
+
+def load_compiled_map(path):
+    return CompiledMap(path)
+
+
+# Writes the territories and players of a game to path, players in the order they joined the board so their ids
+# match those of any saved owner array, even once some have been eliminated
+def write_compiled_map(game, path):
+    board = game.board
+    encoded_names = [name.encode('utf-8') for name in board.names]
+    arrays = {
+        'continent_ids': numpy.frombuffer(board.continent_ids, dtype=numpy.int32).astype('<i4'),
+        'neighbor_offsets': numpy.frombuffer(board.neighbor_offsets, dtype=numpy.int64).astype('<i8'),
+        'neighbor_targets': numpy.frombuffer(board.neighbor_targets, dtype=numpy.int32).astype('<i4'),
+        'name_offsets': numpy.cumsum([0] + [len(name) for name in encoded_names], dtype='<i8'),
+        'name_data': numpy.frombuffer(b''.join(encoded_names), dtype='u1'),
+    }
+    metadata = {
+        'version': FORMAT_VERSION,
+        'title': game.title,
+        'human_players': [p.name for p in board.players if p.is_human],
+        'computer_players': [p.name for p in board.players if not p.is_human],
+        'continent_names': list(board.continent_names),
+        'one_sided_neighbors': game.one_sided_neighbors,
+        'arrays': dict(),
+    }
+    # Array offsets depend on the length of the metadata that records them, so lay out until it settles
+    metadata_length = 0
+    while True:
+        offset = align(len(MAGIC) + 8 + metadata_length)
+        for name in ARRAY_NAMES:
+            metadata['arrays'][name] = [arrays[name].dtype.str, len(arrays[name]), offset]
+            offset = align(offset + arrays[name].nbytes)
+        encoded_metadata = json.dumps(metadata).encode('utf-8')
+        if len(encoded_metadata) == metadata_length:
+            break
+        metadata_length = len(encoded_metadata)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Written under a temporary name and renamed so concurrent games never read a partial file
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(metadata_length.to_bytes(8, 'little'))
+        f.write(encoded_metadata)
+        for name in ARRAY_NAMES:
+            f.write(b'\0' * (metadata['arrays'][name][2] - f.tell()))
+            f.write(arrays[name].tobytes())
+    os.replace(temporary_path, path)
+
+
+def align(offset):
+    return (offset + 7) // 8 * 8
@@ -0,0 +1,246 @@
+from argparse import ArgumentParser
+import math
+import sys
+
+import numpy
+
+# Topologies
+CLUSTERED_TOPOLOGY = 'clustered'
+GRID_TOPOLOGY = 'grid'
+RANDOM_GEOMETRIC_TOPOLOGY = 'random_geometric'
+SCALE_FREE_TOPOLOGY = 'scale_free'
+TOPOLOGIES = [CLUSTERED_TOPOLOGY, GRID_TOPOLOGY, RANDOM_GEOMETRIC_TOPOLOGY, SCALE_FREE_TOPOLOGY]
+CONTINENT_SIZE = 100
+MEAN_DEGREE = 4
+# Random links from each continent to others in clustered maps, besides the ring joining consecutive continents
+CONTINENT_LINKS = 2
+# Territories per cell when finding neighbors in random geometric maps
+CELL_OCCUPANCY = 32
+PLAYER_NAMES = ['Red', 'Blue', 'Green', 'Yellow', 'Orange', 'Purple']
+
+
+# Lines of a game data file, produced one at a time so that maps of any size can be streamed to a file without
+# holding the text in memory. Human players take the first names and computer players the ones after them.
+def map_lines(topology, num_territories, humans=0, computers=4, mean_degree=MEAN_DEGREE,
+              continent_size=CONTINENT_SIZE, seed=0, title=None):
+    if humans + computers > len(PLAYER_NAMES):
+        raise Exception('at most {} players can be generated'.format(len(PLAYER_NAMES)))
+    yield '{}\n'.format(title or '{} map of {} territories'.format(topology.replace('_', ' ').capitalize(),
+                                                                   num_territories))
+    yield player_line(PLAYER_NAMES[:humans])
+    yield player_line(PLAYER_NAMES[humans:humans + computers])
+    territories = generate_territories(topology, num_territories, mean_degree, continent_size, seed)
+    for i, (continent, neighbors) in enumerate(territories):
+        yield 'T{}|C{}|{}\n'.format(i, continent, '|'.join(['T{}'.format(j) for j in neighbors]))
+
+
+def player_line(names):
+    return '|'.join([str(len(names))] + names) + '\n' if names else '0\n'
+
+
+def write_map(path, topology, num_territories, **options):
+    with open(path, 'w') as f:
+        f.writelines(map_lines(topology, num_territories, **options))
+
+
+# Continent and sorted neighbor indices of each territory in index order. Neighbors are always mutual and every
+# territory has at least one, as the game requires.
+def generate_territories(topology, num_territories, mean_degree=MEAN_DEGREE, continent_size=CONTINENT_SIZE, seed=0):
+    if num_territories < 2:
+        raise Exception('a map needs at least 2 territories')
+    if topology == GRID_TOPOLOGY:
+        return grid_territories(num_territories, mean_degree, continent_size)
+    if topology == RANDOM_GEOMETRIC_TOPOLOGY:
+        return random_geometric_territories(num_territories, mean_degree, continent_size, seed)
+    if topology == SCALE_FREE_TOPOLOGY:
+        return scale_free_territories(num_territories, mean_degree, continent_size, seed)
+    if topology == CLUSTERED_TOPOLOGY:
+        return clustered_territories(num_territories, mean_degree, continent_size, seed)
+    raise Exception('{} is not a supported topology'.format(topology))
+
+
+# Dense random continents of continent_size territories, each a path with random shortcuts, joined in a ring and
+# by a few random links to other continents. Only one continent is held in memory at a time.
+def clustered_territories(num_territories, mean_degree, continent_size, seed):
+    generator = numpy.random.default_rng(seed)
+    num_continents = math.ceil(num_territories / continent_size)
+    links = dict()
+
+    def link(a, b):
+        links.setdefault(a, set()).add(b)
+        links.setdefault(b, set()).add(a)
+
+    def random_member(continent):
+        start = continent * continent_size
+        return int(generator.integers(start, min(start + continent_size, num_territories)))
+
+    for continent in range(1, num_continents):
+        link(random_member(continent - 1), random_member(continent))
+    if num_continents > 2:
+        link(random_member(num_continents - 1), random_member(0))
+        for continent in range(num_continents):
+            for other in generator.integers(0, num_continents, CONTINENT_LINKS):
+                if other != continent:
+                    link(random_member(continent), random_member(int(other)))
+    for continent in range(num_continents):
+        start = continent * continent_size
+        size = min(continent_size, num_territories - start)
+        members = [set() for _ in range(size)]
+        for i in range(size - 1):
+            members[i].add(i + 1)
+            members[i + 1].add(i)
+        if size > 2:
+            # Path gives each territory about two neighbors, shortcuts make up the rest of the mean degree
+            probability = max(mean_degree - 2, 0) / (size - 1)
+            rows, columns = numpy.triu_indices(size, 2)
+            chosen = generator.random(len(rows)) < probability
+            for a, b in zip(rows[chosen].tolist(), columns[chosen].tolist()):
+                members[a].add(b)
+                members[b].add(a)
+        for i, neighbors in enumerate(members):
+            yield continent, sorted([start + j for j in neighbors] + sorted(links.get(start + i, ())))
+
+
+# Square grid filled row by row, with continents of square blocks. Territories border 4 neighbors, or 8 when the
+# mean degree asked for is 8 or more.
+def grid_territories(num_territories, mean_degree, continent_size):
+    side = math.ceil(math.sqrt(num_territories))
+    block = max(round(math.sqrt(continent_size)), 1)
+    blocks_per_row = math.ceil(side / block)
+    offsets = [(-1, 0), (0, -1), (0, 1), (1, 0)]
+    if mean_degree >= 8:
+        offsets = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+    for i in range(num_territories):
+        row, column = divmod(i, side)
+        neighbors = []
+        for row_offset, column_offset in offsets:
+            neighbor_row, neighbor_column = row + row_offset, column + column_offset
+            neighbor = neighbor_row * side + neighbor_column
+            if 0 <= neighbor_row and 0 <= neighbor_column < side and neighbor < num_territories:
+                neighbors.append(neighbor)
+        # Last row may be partial, so its first territory can be left with only the territory above
+        yield (row // block) * blocks_per_row + column // block, neighbors
+
+
+# Territories scattered over the unit square, bordering every territory within the radius that gives the mean
+# degree. Territories are numbered by cell in a serpentine order and each borders the next, so the map is
+# connected and nearby territories have nearby indices. Continents are square regions of the unit square.
+def random_geometric_territories(num_territories, mean_degree, continent_size, seed):
+    generator = numpy.random.default_rng(seed)
+    positions = generator.random((num_territories, 2))
+    # Links between consecutive territories add about one neighbor on top of those within the radius
+    radius = math.sqrt(max(mean_degree - 1, 1) / (math.pi * num_territories))
+    cells_per_side = max(min(int(1 / radius), int(math.sqrt(num_territories / CELL_OCCUPANCY))), 1)
+    cell_rows = numpy.minimum((positions[:, 1] * cells_per_side).astype(numpy.int64), cells_per_side - 1)
+    cell_columns = numpy.minimum((positions[:, 0] * cells_per_side).astype(numpy.int64), cells_per_side - 1)
+
+    def cell_key(row, column):
+        return row * cells_per_side + column + (row % 2) * (cells_per_side - 1 - 2 * column)
+
+    keys = cell_key(cell_rows, cell_columns)
+    order = numpy.lexsort((positions[:, 0], keys))
+    positions = positions[order]
+    keys = keys[order]
+    # Territories of each cell, as a range into the numbering
+    cell_starts = numpy.zeros(cells_per_side * cells_per_side + 1, dtype=numpy.int64)
+    numpy.add.at(cell_starts, keys + 1, 1)
+    cell_starts = numpy.cumsum(cell_starts).tolist()
+    continents_per_side = max(round(math.sqrt(num_territories / continent_size)), 1)
+    continents = numpy.minimum((positions * continents_per_side).astype(numpy.int64), continents_per_side - 1)
+    continents = (continents[:, 1] * continents_per_side + continents[:, 0]).tolist()
+    for row in range(cells_per_side):
+        columns = range(cells_per_side) if row % 2 == 0 else range(cells_per_side - 1, -1, -1)
+        for column in columns:
+            key = cell_key(row, column)
+            if cell_starts[key] == cell_starts[key + 1]:
+                continue
+            members = numpy.arange(cell_starts[key], cell_starts[key + 1])
+            candidate_keys = [
+                cell_key(r, c)
+                for r in range(max(row - 1, 0), min(row + 2, cells_per_side))
+                for c in range(max(column - 1, 0), min(column + 2, cells_per_side))
+            ]
+            candidates = numpy.concatenate([numpy.arange(cell_starts[k], cell_starts[k + 1]) for k in candidate_keys])
+            distances = numpy.linalg.norm(positions[members, None, :] - positions[None, candidates, :], axis=2)
+            within = distances <= radius
+            for i, member in enumerate(members.tolist()):
+                neighbors = set(candidates[within[i]].tolist())
+                if member > 0:
+                    neighbors.add(member - 1)
+                if member < num_territories - 1:
+                    neighbors.add(member + 1)
+                neighbors.discard(member)
+                yield continents[member], sorted(neighbors)
+
+
+# Preferential attachment, where each territory after the first few borders territories chosen in proportion to
+# how many neighbors they already have, giving a power law of degrees with a few large hubs. Edges are kept as
+# arrays of indices until every territory has been placed, since hubs gain neighbors until the very end.
+def scale_free_territories(num_territories, mean_degree, continent_size, seed):
+    generator = numpy.random.default_rng(seed)
+    links_per_territory = max(min(round(mean_degree / 2), num_territories - 1), 1)
+    num_edges = links_per_territory * (num_territories - links_per_territory) + links_per_territory - 1
+    sources = numpy.empty(num_edges, dtype=numpy.int32)
+    targets = numpy.empty(num_edges, dtype=numpy.int32)
+    # Each territory appears once for every edge it has, so sampling from it favors territories with more edges
+    endpoints = numpy.empty(2 * num_edges, dtype=numpy.int32)
+    num_placed = 0
+    # First territories form a path to attach to
+    for i in range(1, links_per_territory):
+        sources[num_placed], targets[num_placed] = i, i - 1
+        endpoints[2 * num_placed], endpoints[2 * num_placed + 1] = i, i - 1
+        num_placed += 1
+    # Samples are drawn in batches, since one call per territory would dominate the time taken
+    samples = iter(())
+    for i in range(links_per_territory, num_territories):
+        chosen = set()
+        if num_placed == 0:
+            chosen = set(range(links_per_territory))
+        while len(chosen) < links_per_territory:
+            sample = next(samples, None)
+            if sample is None:
+                samples = iter(generator.random(4096).tolist())
+                continue
+            chosen.add(int(endpoints[int(sample * 2 * num_placed)]))
+        for target in chosen:
+            sources[num_placed], targets[num_placed] = i, target
+            endpoints[2 * num_placed], endpoints[2 * num_placed + 1] = i, target
+            num_placed += 1
+    ends = numpy.concatenate((sources, targets))
+    others = numpy.concatenate((targets, sources))
+    order = numpy.argsort(ends, kind='stable')
+    offsets = numpy.zeros(num_territories + 1, dtype=numpy.int64)
+    numpy.add.at(offsets, ends + 1, 1)
+    offsets = numpy.cumsum(offsets)
+    others = others[order]
+    for i in range(num_territories):
+        yield i // continent_size, sorted(others[offsets[i]:offsets[i + 1]].tolist())
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Write a game data file for a generated map of any size.')
+    parser.add_argument('topology', choices=TOPOLOGIES)
+    parser.add_argument('territories', type=int)
+    parser.add_argument('--output', help='file to write the map to, instead of standard output')
+    parser.add_argument('--humans', type=int, default=0)
+    parser.add_argument('--computers', type=int, default=4)
+    parser.add_argument('--mean-degree', type=float, default=MEAN_DEGREE)
+    parser.add_argument('--continent-size', type=int, default=CONTINENT_SIZE)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--title')
+    arguments = parser.parse_args()
+    lines = map_lines(
+        arguments.topology,
+        arguments.territories,
+        humans=arguments.humans,
+        computers=arguments.computers,
+        mean_degree=arguments.mean_degree,
+        continent_size=arguments.continent_size,
+        seed=arguments.seed,
+        title=arguments.title,
+    )
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            f.writelines(lines)
+    else:
+        sys.stdout.writelines(lines)
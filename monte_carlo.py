@@ -0,0 +1,331 @@
+from concurrent.futures import ProcessPoolExecutor
+from math import log
+from time import perf_counter
+
+import numpy
+
+from battle import battle_odds
+from moves import AttackStep, Claim, CollectReinforcements, ConquestMove, Fortify, Reinforce
+from observers import GameObserver
+from players import ComputerPlayer
+
+# Decisions a MonteCarloPlayer searches, each made in turn() or initial_army_placement()
+ARMIES_TO_MOVE = 'armies_to_move'
+ATTACK_ROUTE = 'attack_route'
+CLAIM = 'claim'
+CONTINUE_BATTLE = 'continue_battle'
+FORTIFY_ROUTE = 'fortify_route'
+INITIAL_REINFORCEMENTS = 'initial_reinforcements'
+
+# Headless copy of the game searched by each worker process
+worker_simulation = None
+
+
+class MonteCarloPlayer(ComputerPlayer):
+    CANDIDATE_MAX = 8
+    EXPLORATION = 1.4
+    PROCESSES = 1
+    ROLLOUT_TURNS = 4
+    TIME_BUDGET_MS = 100
+
+    """
+    Computer player that searches each decision with Monte Carlo rollouts. Candidates for a decision start with
+    the choice ComputerPlayer would make, followed by its strongest alternatives, and are sampled with UCB1 until
+    time_budget_ms milliseconds have passed. Each rollout plays the candidate out on a headless clone of the
+    game, finishes the turn and plays rollout_turns more turns with ComputerPlayer for every player, using
+    apply_move so the clone can be put back with undo_move. Rollouts score 1 for a win, 0 for an elimination
+    and otherwise the mean of the player's share of territories and armies, and the candidate sampled most
+    often is chosen.
+
+    The search is flat rather than a tree: UCB1 only chooses among the candidates of the decision at hand, and
+    every move after it is played by ComputerPlayer. This is deliberate, since dice decide most of what follows
+    a decision and a tree grown below it within a budget of milliseconds would be too thin to improve on the
+    greedy playouts.
+
+    With more than one process, the same search runs in each worker process on its own clone and the rollouts
+    of every process are added together, so more cores give more rollouts within the same budget. Workers are
+    started on the first decision, which makes that decision slower than the budget, and shut down once the
+    game is over.
+    """
+
+    __slots__ = ('time_budget_ms', 'processes', 'rollout_turns', 'simulation', 'executor')
+
+    def __init__(self, name, time_budget_ms=TIME_BUDGET_MS, processes=PROCESSES, rollout_turns=ROLLOUT_TURNS):
+        super().__init__(name)
+        self.time_budget_ms = time_budget_ms
+        self.processes = processes
+        self.rollout_turns = rollout_turns
+        self.simulation = None
+        self.executor = None
+
+    # Territory conquered can be given as territory_to, and is otherwise the last one added to the controlled
+    # territories, as it always is in a game
+    def armies_to_move(self, territory_from, move_limit, *, territory_to=None):
+        greedy_choice = super().armies_to_move(territory_from, move_limit)
+        territory_to = territory_to or self.controlled_territories[-1]
+        candidates = list(dict.fromkeys([greedy_choice, 0, move_limit // 2, move_limit]))
+        decision = (ARMIES_TO_MOVE, territory_from.index, territory_to.index)
+        return self.search(decision, candidates)
+
+    def choose_attack_route(self, territory_list, reinforcements):
+        greedy_route = super().choose_attack_route(territory_list, reinforcements)
+        routes = dict()
+        for territory in territory_list:
+            for neighbor in territory.neighbors:
+                if neighbor.occupying_player == self and neighbor.occupying_armies + reinforcements > 1:
+                    routes[(neighbor.index, territory.index)] = battle_odds.conquest_probability(
+                        neighbor.occupying_armies + reinforcements,
+                        territory.occupying_armies,
+                    )
+        candidates = [route_indices(greedy_route), None]
+        candidates.extend(sorted(routes, key=routes.get, reverse=True))
+        route = self.search((ATTACK_ROUTE, reinforcements), unique_candidates(candidates, self.CANDIDATE_MAX))
+        return route_territories(self.game, route)
+
+    def choose_fortify_route(self):
+        greedy_route = super().choose_fortify_route()
+        routes = dict()
+        for territory in self.controlled_territories:
+            if territory.occupying_armies > 1:
+                for neighbor in territory.neighbors:
+                    if neighbor.occupying_player == self:
+                        routes[(territory.index, neighbor.index)] = (
+                            self.army_count_differential(neighbor) - self.army_count_differential(territory)
+                        )
+        candidates = [route_indices(greedy_route), None]
+        candidates.extend(sorted(routes, key=routes.get, reverse=True))
+        route = self.search((FORTIFY_ROUTE,), unique_candidates(candidates, self.CANDIDATE_MAX))
+        return route_territories(self.game, route)
+
+    def claim_territory(self, available_territories):
+        greedy_choice = super().claim_territory(available_territories)
+        alternatives = self.get_unoccupied_neighbors(self.controlled_territories) or available_territories
+        alternatives = sorted(alternatives, key=lambda territory: len(territory.neighbors))
+        candidates = unique_candidates([greedy_choice.index] + [t.index for t in alternatives], self.CANDIDATE_MAX)
+        return self.game.all_territories[self.search((CLAIM,), candidates)]
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+
+    def continue_battle(self, attacking_territory, defending_territory):
+        greedy_choice = super().continue_battle(attacking_territory, defending_territory)
+        decision = (CONTINUE_BATTLE, attacking_territory.index, defending_territory.index)
+        return self.search(decision, [greedy_choice, not greedy_choice])
+
+    # Spreads armies as ComputerPlayer does, or stacks them all on one territory bordering an enemy
+    def initial_reinforcements(self):
+        greedy_plan = tuple((t.index, num_armies) for t, num_armies in super().initial_reinforcements())
+        candidates = [greedy_plan] + [
+            ((territory.index, self.army_count),)
+            for territory in self.enemy_adjacent_territories(self.controlled_territories)
+        ]
+        plan = self.search((INITIAL_REINFORCEMENTS,), unique_candidates(candidates, self.CANDIDATE_MAX))
+        return [(self.game.all_territories[i], num_armies) for i, num_armies in plan]
+
+    # Chooses among candidates, encoded with territory indices, for a decision of the player's in the current game
+    def search(self, decision, candidates):
+        if len(candidates) == 1 or self.time_budget_ms <= 0:
+            return candidates[0]
+        deadline = perf_counter() + self.time_budget_ms / 1000
+        snapshot = self.game.snapshot()
+        if self.processes > 1:
+            if not self.executor:
+                self.executor = ProcessPoolExecutor(
+                    self.processes,
+                    initializer=start_worker,
+                    initargs=(self.game.clone(ComputerPlayer),),
+                )
+                self.game.add_observer(WorkerShutdown(self))
+            futures = [
+                self.executor.submit(search_worker, snapshot, self.id, decision, candidates,
+                                     deadline - perf_counter(), self.rollout_turns)
+                for _ in range(self.processes)
+            ]
+            visits = numpy.zeros(len(candidates))
+            for future in futures:
+                visits += future.result()[0]
+        else:
+            if not self.simulation:
+                self.simulation = self.game.clone(ComputerPlayer)
+            else:
+                self.simulation.restore(snapshot)
+            visits, _ = run_rollouts(self.simulation, self.id, decision, candidates, deadline, self.rollout_turns)
+        # Most sampled candidate wins, with ties going to the earlier candidate
+        return candidates[int(numpy.argmax(visits))]
+
+
+class WorkerShutdown(GameObserver):
+    """
+    Shuts down the worker processes of a MonteCarloPlayer once the game it is playing is over.
+    """
+
+    def __init__(self, player):
+        self.player = player
+
+    def close(self, game):
+        self.player.close()
+
+
+
+# Plays out the rest of the current turn for a player after a choice has been made for a decision
+def continue_turn(game, player, decision, choice):
+    territories = game.all_territories
+    kind = decision[0]
+    if kind == CLAIM:
+        game.apply_move(Claim(player, territories[choice], 1))
+        finish_initial_army_placement(game)
+        return
+    if kind == INITIAL_REINFORCEMENTS:
+        for i, num_armies in choice:
+            game.apply_move(Reinforce(territories[i], num_armies))
+        # Players after this one reinforce as computer players would
+        for other_player in game.players[game.players.index(player) + 1:]:
+            place_initial_reinforcements(game, other_player)
+        return
+    if kind == ATTACK_ROUTE:
+        route = route_territories(game, choice)
+        reinforcements = decision[1]
+        if reinforcements > 0:
+            game.apply_move(Reinforce(route[0] if route else player.lowest_army_count(), reinforcements))
+        attack_from_route(game, player, route)
+    elif kind == CONTINUE_BATTLE:
+        if choice:
+            fight_battle(game, player, territories[decision[1]], territories[decision[2]])
+        attack_from_route(game, player, next_attack_route(game, player))
+    elif kind == ARMIES_TO_MOVE:
+        game.apply_move(ConquestMove(territories[decision[1]], territories[decision[2]], choice))
+        attack_from_route(game, player, next_attack_route(game, player))
+    if kind == FORTIFY_ROUTE:
+        fortify_from_route(game, route_territories(game, choice))
+    else:
+        fortify_from_route(game, player.choose_fortify_route() if game.get_territories_to_fortify(player) else None)
+
+
+# Share of the game held by a player, from 0 once eliminated to 1 once every other player is
+def evaluate(game, player):
+    if player not in game.players:
+        return 0.0
+    if len(game.players) == 1:
+        return 1.0
+    controlled_armies = sum(territory.occupying_armies for territory in player.controlled_territories)
+    all_armies = int(numpy.frombuffer(game.board.armies, dtype=numpy.int32).sum())
+    return (len(player.controlled_territories) / len(game.all_territories) + controlled_armies / all_armies) / 2
+
+
+def attack_from_route(game, player, attack_route):
+    while attack_route and len(game.players) > 1:
+        fight_battle(game, player, *attack_route)
+        attack_route = next_attack_route(game, player)
+
+
+# Attacks until the defending territory falls, the attacker runs out of armies or chooses to stop
+def fight_battle(game, player, attacking_territory, defending_territory):
+    while True:
+        attacking_count = min(3, attacking_territory.occupying_armies - 1)
+        defending_count = min(2, defending_territory.occupying_armies)
+        game.apply_move(AttackStep(attacking_territory, defending_territory, attacking_count, defending_count))
+        if defending_territory.occupying_player == player:
+            move_limit = attacking_territory.occupying_armies - 1
+            if move_limit > 0 and len(game.players) > 1:
+                num_armies = player.armies_to_move(attacking_territory, move_limit)
+                game.apply_move(ConquestMove(attacking_territory, defending_territory, num_armies))
+            return
+        if attacking_territory.occupying_armies == 1 or not player.continue_battle(
+           attacking_territory, defending_territory):
+            return
+
+
+def finish_initial_army_placement(game):
+    territories = game.all_territories
+    num_claimed = sum(1 for territory in territories if territory.occupying_player)
+    unclaimed_territories = [territory for territory in territories if not territory.occupying_player]
+    while unclaimed_territories:
+        player = game.players[num_claimed % len(game.players)]
+        claimed_territory = player.claim_territory(unclaimed_territories)
+        game.apply_move(Claim(player, claimed_territory, 1))
+        unclaimed_territories.remove(claimed_territory)
+        num_claimed += 1
+    for player in game.players:
+        place_initial_reinforcements(game, player)
+
+
+def fortify_from_route(game, fortify_route):
+    if fortify_route:
+        game.apply_move(Fortify(fortify_route[0], fortify_route[1], fortify_route[0].occupying_armies // 2))
+
+
+def next_attack_route(game, player):
+    territories_for_attack = game.get_territories_for_attack(player)
+    return player.choose_attack_route(territories_for_attack, 0) if territories_for_attack else None
+
+
+def place_initial_reinforcements(game, player):
+    if player.army_count > 0:
+        for territory, num_armies in player.initial_reinforcements():
+            game.apply_move(Reinforce(territory, num_armies))
+
+
+# Plays a turn as GameOfRisk.turn does for a computer player
+def play_turn(game, player):
+    reinforcements = game.apply_move(CollectReinforcements(player))
+    territories_for_attack = game.get_territories_for_attack(player)
+    attack_route = player.choose_attack_route(territories_for_attack, reinforcements)
+    continue_turn(game, player, (ATTACK_ROUTE, reinforcements), route_indices(attack_route))
+
+
+def route_indices(route):
+    return (route[0].index, route[1].index) if route else None
+
+
+def route_territories(game, route):
+    return (game.all_territories[route[0]], game.all_territories[route[1]]) if route else None
+
+
+# Samples candidates with UCB1 until the deadline, returning the visits and total score of each candidate
+def run_rollouts(game, player_id, decision, candidates, deadline, rollout_turns):
+    player = game.board.players[player_id]
+    visits = numpy.zeros(len(candidates))
+    totals = numpy.zeros(len(candidates))
+    num_rollouts = 0
+    # Moves already made stay made, so rollouts can start partway through a sequence of moves
+    undo_depth = len(game.undo_stack)
+    while perf_counter() < deadline:
+        if num_rollouts < len(candidates):
+            choice = num_rollouts
+        else:
+            means = totals / visits
+            choice = int(numpy.argmax(means + MonteCarloPlayer.EXPLORATION * numpy.sqrt(log(num_rollouts) / visits)))
+        continue_turn(game, player, decision, candidates[choice])
+        if decision[0] in (CLAIM, INITIAL_REINFORCEMENTS):
+            current_player = game.players[-1]
+        else:
+            current_player = player
+        for _ in range(rollout_turns):
+            if len(game.players) == 1:
+                break
+            current_player = game.players[(game.players.index(current_player) + 1) % len(game.players)]
+            play_turn(game, current_player)
+        visits[choice] += 1
+        totals[choice] += evaluate(game, player)
+        num_rollouts += 1
+        while len(game.undo_stack) > undo_depth:
+            game.undo_move()
+    return visits, totals
+
+
+def search_worker(snapshot, player_id, decision, candidates, time_budget, rollout_turns):
+    deadline = perf_counter() + time_budget
+    worker_simulation.restore(snapshot)
+    return run_rollouts(worker_simulation, player_id, decision, candidates, deadline, rollout_turns)
+
+
+def start_worker(simulation):
+    global worker_simulation
+    worker_simulation = simulation
+
+
+# Keeps the first occurrence of each candidate, up to candidate_max of them
+def unique_candidates(candidates, candidate_max):
+    return list(dict.fromkeys(candidates))[:candidate_max]
@@ -0,0 +1,28 @@
+from collections import namedtuple
+
+# Moves that GameOfRisk.apply_move makes and GameOfRisk.undo_move takes back, for players that search ahead.
+# An attack step with no armies_defeated rolls the dice, and collecting reinforcements draws a card.
+AttackStep = namedtuple(
+    'AttackStep',
+    ['attacking_territory', 'defending_territory', 'attacking_count', 'defending_count', 'armies_defeated'],
+    defaults=[None],
+)
+Claim = namedtuple('Claim', ['player', 'territory', 'num_armies'])
+CollectReinforcements = namedtuple('CollectReinforcements', ['player'])
+ConquestMove = namedtuple('ConquestMove', ['from_territory', 'to_territory', 'num_armies'])
+Fortify = namedtuple('Fortify', ['from_territory', 'to_territory', 'num_armies'])
+Reinforce = namedtuple('Reinforce', ['territory', 'num_armies'])
+
+# Everything that changes while a game is played. Territories and players are stored by index, so a snapshot can
+# be pickled and restored into any game loaded from the same map. Per-player fields are indexed by player id.
+GameSnapshot = namedtuple('GameSnapshot', [
+    'owners',
+    'armies',
+    'player_ids',
+    'eliminated_player_ids',
+    'controlled_territories',
+    'army_counts',
+    'cards',
+    'deck',
+    'armies_for_card_trade',
+])
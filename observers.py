@@ -0,0 +1,27 @@
+from time import sleep
+
+
+class GameObserver:
+    # Receives narration of the game, paused if the message should linger for the reader
+    def announce(self, message, pause):
+        pass
+
+    # Receives the game whenever the state of the board should be shown
+    def refresh(self, game):
+        pass
+
+    # Receives the game once a winner has been declared
+    def close(self, game):
+        pass
+
+
+class ConsoleObserver(GameObserver):
+    PAUSE_SECONDS = 1.0
+
+    def __init__(self, pause_seconds=PAUSE_SECONDS):
+        self.pause_seconds = pause_seconds
+
+    def announce(self, message, pause):
+        print(message)
+        if pause and self.pause_seconds > 0:
+            sleep(self.pause_seconds)
@@ -1,15 +1,42 @@
+import numpy
+
+from battle import battle_odds
+from frontier import ControlledTerritories, Frontier
+
+
 class Player:
+    __slots__ = ('name', 'id', 'game', 'frontier', '_controlled_territories', 'cards', 'army_count', 'is_human')
+
     def __init__(self, name):
         self.name = name
-        self.controlled_territories = []
+        # Index of the player in the owner array of the board and the game played in, assigned when it is loaded
+        self.id = None
+        self.game = None
+        self.frontier = Frontier(self)
+        self._controlled_territories = ControlledTerritories(self)
         self.cards = []
         self.army_count = 0
 
     def __str__(self):
         return self.name
 
+    @property
+    def controlled_territories(self):
+        return self._controlled_territories
+
+    # Assigning a list replaces the controlled territories and recounts the frontier
+    @controlled_territories.setter
+    def controlled_territories(self, territories):
+        self._controlled_territories.clear()
+        self._controlled_territories.extend(territories)
+
 
 class ComputerPlayer(Player):
+    # Lowest odds of conquering a territory for an attack to be launched or continued
+    CONQUEST_PROBABILITY_MIN = 0.5
+
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__(name)
         self.is_human = False
@@ -21,40 +48,59 @@ class ComputerPlayer(Player):
                 return move_limit // 2
         return move_limit
 
+    # Odds are found for every attack from a neighbor of the territories in territory_list at once, over the edges
+    # leaving them, and the first attack with the best odds is chosen
     def choose_attack_route(self, territory_list, reinforcements):
-        attack_route = None
-        largest_difference = 0
-        # Check for territory with smallest army count relative to attacker
-        for territory in territory_list:
-            for neighbor in territory.neighbors:
-                if neighbor.occupying_player == self:
-                    army_difference = neighbor.occupying_armies + reinforcements - territory.occupying_armies
-                    if army_difference >= 0 and (not attack_route or army_difference > largest_difference):
-                        attack_route = (neighbor, territory)
-                        largest_difference = army_difference
-        return attack_route
+        if not territory_list:
+            return None
+        board = territory_list[0].board
+        indices = territory_indices(territory_list)
+        sources, neighbors = board.neighbor_edges(indices)
+        owners = numpy.frombuffer(board.owners, dtype=numpy.int32)
+        armies = numpy.frombuffer(board.armies, dtype=numpy.int32)
+        attacking_counts = armies[neighbors].astype(numpy.int64) + reinforcements
+        # Attacking territory must be able to leave an army behind
+        attacks = numpy.flatnonzero((owners[neighbors] == self.id) & (attacking_counts > 1))
+        if not len(attacks):
+            return None
+        probabilities = battle_odds.conquest_probabilities(attacking_counts[attacks],
+                                                           armies[indices[sources[attacks]]])
+        best = numpy.argmax(probabilities)
+        if probabilities[best] < self.CONQUEST_PROBABILITY_MIN:
+            return None
+        edge = attacks[best]
+        return board.territories[neighbors[edge]], board.territories[indices[sources[edge]]]
 
     def choose_fortify_route(self):
-        fortify_route = None
-        largest_disparity = 0
-        # Prioritize territories with largest enemy army count differentials to receive fortifications
-        territories_highest_differentials = sorted(
-            self.controlled_territories,
-            key=self.army_count_differential,
-            reverse=True,
+        if not self.controlled_territories:
+            return None
+        board = self.controlled_territories[0].board
+        indices = territory_indices(self.controlled_territories)
+        differentials = numpy.zeros(len(board), dtype=numpy.int64)
+        differentials[indices] = self.army_count_differentials(board, indices)
+        # Prioritize territories with largest enemy army count differentials to receive fortifications, keeping
+        # territories with equal differentials in the order they were taken
+        ranked = indices[numpy.argsort(-differentials[indices], kind='stable')]
+        ranks = numpy.zeros(len(board), dtype=numpy.int64)
+        ranks[ranked] = numpy.arange(len(ranked))
+        # Prioritize territories with smallest enemy army count differentials to provide fortifications, taking the
+        # first route with the largest disparity in rank from the lowest ranked territory up
+        receivers = ranked[::-1]
+        sources, neighbors = board.neighbor_edges(receivers)
+        owners = numpy.frombuffer(board.owners, dtype=numpy.int32)
+        routes = numpy.flatnonzero((owners[neighbors] == self.id) & (differentials[neighbors] > 0))
+        if not len(routes):
+            return None
+        disparities = ranks[receivers[sources[routes]]] - ranks[neighbors[routes]]
+        edge = routes[numpy.argmax(disparities)]
+        return board.territories[receivers[sources[edge]]], board.territories[neighbors[edge]]
+
+    def continue_battle(self, attacking_territory, defending_territory):
+        probability = battle_odds.conquest_probability(
+            attacking_territory.occupying_armies,
+            defending_territory.occupying_armies,
         )
-        # Prioritize territories with smallest enemy army count differentials to provide fortifications
-        i = len(territories_highest_differentials) - 1
-        while i >= 0:
-            for neighbor in territories_highest_differentials[i].neighbors:
-                if neighbor.occupying_player == self:
-                    current_disparity = i - territories_highest_differentials.index(neighbor)
-                    if ((not fortify_route or current_disparity > largest_disparity) and
-                       self.army_count_differential(neighbor) > 0):
-                        fortify_route = (territories_highest_differentials[i], neighbor)
-                        largest_disparity = current_disparity
-            i -= 1
-        return fortify_route
+        return probability >= self.CONQUEST_PROBABILITY_MIN
 
     def claim_territory(self, available_territories):
         # Territories have already been claimed
@@ -65,13 +111,17 @@ class ComputerPlayer(Player):
                 return self.lowest_neighbor_count(empty_neighbors)
         return self.lowest_neighbor_count(available_territories)
 
+    # Territories in territory_list with a neighbor held by anyone else, marked over the edges leaving them at once
     def enemy_adjacent_territories(self, territory_list):
-        adjacent_to_enemy = []
-        for territory in territory_list:
-            for neighbor in territory.neighbors:
-                if neighbor.occupying_player != self and territory not in adjacent_to_enemy:
-                    adjacent_to_enemy.append(territory)
-        return adjacent_to_enemy
+        if not territory_list:
+            return []
+        board = territory_list[0].board
+        indices = territory_indices(territory_list)
+        sources, neighbors = board.neighbor_edges(indices)
+        owners = numpy.frombuffer(board.owners, dtype=numpy.int32)
+        adjacent_to_enemy = numpy.zeros(len(indices), dtype=bool)
+        adjacent_to_enemy[sources[owners[neighbors] != self.id]] = True
+        return [board.territories[i] for i in first_occurrences(indices[adjacent_to_enemy]).tolist()]
 
     # Determine territory with fewest armies
     def lowest_army_count(self):
@@ -81,16 +131,24 @@ class ComputerPlayer(Player):
                 fewest_armies = territory
         return fewest_armies
 
-    def reinforce_initial(self):
-        reinforced_territory_names = []
+    # Returns (territory, armies) placements for the remaining armies, in the order territories are first reinforced
+    def initial_reinforcements(self):
+        placements = dict()
         adjacent_to_enemy = self.enemy_adjacent_territories(self.controlled_territories)
         # Distribute an equal number of armies to all territories bordering an enemy
-        while self.army_count > 0:
-            current_territory = adjacent_to_enemy[self.army_count % len(adjacent_to_enemy)]
-            current_territory.occupying_armies += 1
-            self.army_count -= 1
-            if current_territory.name not in reinforced_territory_names:
-                reinforced_territory_names.append(current_territory.name)
+        remaining_armies = self.army_count
+        while remaining_armies > 0:
+            current_territory = adjacent_to_enemy[remaining_armies % len(adjacent_to_enemy)]
+            placements[current_territory] = placements.get(current_territory, 0) + 1
+            remaining_armies -= 1
+        return list(placements.items())
+
+    def reinforce_initial(self):
+        reinforced_territory_names = []
+        for territory, num_armies in self.initial_reinforcements():
+            territory.occupying_armies += num_armies
+            self.army_count -= num_armies
+            reinforced_territory_names.append(territory.name)
         return reinforced_territory_names
 
     @staticmethod
@@ -103,25 +161,50 @@ class ComputerPlayer(Player):
         return differential
 
     @staticmethod
+    # Army count differential of the territories at indices of a board, summed over the edges leaving them at once
+    def army_count_differentials(board, indices):
+        sources, neighbors = board.neighbor_edges(indices)
+        owners = numpy.frombuffer(board.owners, dtype=numpy.int32)
+        armies = numpy.frombuffer(board.armies, dtype=numpy.int32)
+        enemy_armies = numpy.where(owners[neighbors] != owners[indices[sources]], armies[neighbors], 0)
+        return numpy.bincount(sources, weights=enemy_armies, minlength=len(indices)).astype(numpy.int64)
+
+    @staticmethod
+    # Empty neighbors of the territories in territory_list, in the order they are first found
     def get_unoccupied_neighbors(territory_list):
-        unoccupied_neighbors = []
-        for territory in territory_list:
-            for neighbor in territory.neighbors:
-                if neighbor.is_empty() and neighbor not in unoccupied_neighbors:
-                    unoccupied_neighbors.append(neighbor)
-        return unoccupied_neighbors
+        if not territory_list:
+            return []
+        board = territory_list[0].board
+        _, neighbors = board.neighbor_edges(territory_indices(territory_list))
+        armies = numpy.frombuffer(board.armies, dtype=numpy.int32)
+        return [board.territories[i] for i in first_occurrences(neighbors[armies[neighbors] == 0]).tolist()]
 
     @staticmethod
-    # Determine territory with fewest neighboring territories
+    # Determine territory with fewest neighboring territories, the first of them if several are tied
     def lowest_neighbor_count(territory_list):
-        fewest_neighbors = None
-        for territory in territory_list:
-            if not fewest_neighbors or len(territory.neighbors) < len(fewest_neighbors.neighbors):
-                fewest_neighbors = territory
-        return fewest_neighbors
+        if not territory_list:
+            return None
+        board = territory_list[0].board
+        indices = territory_indices(territory_list)
+        offsets = numpy.frombuffer(board.neighbor_offsets, dtype=numpy.int64)
+        return board.territories[indices[numpy.argmin(offsets[indices + 1] - offsets[indices])]]
 
 
 class HumanPlayer(Player):
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__(name)
         self.is_human = True
+
+
+# Indices without repeats, each kept where it first appears
+def first_occurrences(indices):
+    _, first_positions = numpy.unique(indices, return_index=True)
+    return indices[numpy.sort(first_positions)]
+
+
+# Indices of territories into the arrays of their board
+def territory_indices(territory_list):
+    return numpy.fromiter((territory.index for territory in territory_list), dtype=numpy.int64,
+                          count=len(territory_list))
@@ -0,0 +1,298 @@
+from collections import deque
+from hashlib import sha256
+import os
+
+import numpy
+
+from events import ArmiesChanged, OwnerChanged
+from observers import GameObserver
+
+LAYOUT_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'game_of_risk', 'layouts')
+# Layout algorithms
+AUTO_LAYOUT = 'auto'
+CONTINENT_LAYOUT = 'continent'
+KAMADA_KAWAI_LAYOUT = 'kamada_kawai'
+SPRING_LAYOUT = 'spring'
+
+
+class RiskMapRenderer(GameObserver):
+    ALL_WINDOWS = 'all'
+    EDGE_COLOR = '#bdc2c9'
+    EMPTY_NODE_COLOR = '#adb1b8'
+    FONT_SIZE = 5
+    FONT_WEIGHT = 'bold'
+    # Size in inches of figures drawn offscreen, where there is no window to match
+    FIGURE_SIZE = (16, 12)
+    NODE_SIZE = 500
+    # Layout settings
+    CONTINENT_SPREAD = 0.5
+    GOLDEN_ANGLE = numpy.pi * (3 - numpy.sqrt(5))
+    KAMADA_KAWAI_SIZE_MAX = 100
+    LAYOUT_SEED = 0
+    SPRING_ITERATIONS = 30
+    SPRING_SIZE_MAX = 1000
+
+    """
+    The figure persists between frames. Each frame only visits territories that the game journal reported as
+    changed, and only recolors and relabels those whose occupier or army count differs from the last frame, by
+    writing their entries of the node colors and their labels in place. Only the changed colors are converted,
+    but matplotlib still copies the color array and renders the whole canvas for every frame.
+
+    Layouts are cached on disk by a hash of the map topology and the layout algorithm, so a map is only positioned
+    once. The automatic layout uses kamada_kawai for small maps, spring with a fixed iteration budget for medium
+    maps, and places territories around continent centers for large maps, which takes linear time.
+
+    A renderer that is not interactive opens no window and draws each frame offscreen with the Agg canvas, such as
+    for benchmarks or for exporting frames.
+
+    matplotlib, networkx and tkinter are only imported by the methods that use them, the first time the map is
+    positioned or drawn, so headless games and the processes that play them never load them.
+    """
+
+    def __init__(self, game, layout_algorithm=AUTO_LAYOUT, layout_cache_directory=LAYOUT_CACHE_DIRECTORY,
+                 interactive=True):
+        self.title = game.title
+        self.player_colors = game.player_colors
+        self.risk_map = None
+        self.node_colors = []
+        self.node_indices = dict()
+        self.labels = dict()
+        self.layout = None
+        # Occupier and army count of each territory as last drawn, to redraw only what has changed
+        self.drawn_states = dict()
+        # Territories changed since the last frame, as reported by the game journal, or None to check them all
+        self.changed_territories = None
+        game.journal.subscribe(self.mark_changed, (ArmiesChanged, OwnerChanged))
+        # Figure and the artists within it are kept between frames and updated in place
+        self.figure = None
+        self.node_artist = None
+        self.label_artists = dict()
+        self.layout_algorithm = layout_algorithm
+        self.layout_cache_directory = layout_cache_directory
+        self.interactive = interactive
+        # Window is only opened and map only positioned once the map is first drawn
+        self.root = None
+        self.window_dimensions = None
+
+    def choose_layout_algorithm(self, num_territories):
+        if self.layout_algorithm != AUTO_LAYOUT:
+            return self.layout_algorithm
+        if num_territories <= self.KAMADA_KAWAI_SIZE_MAX:
+            return KAMADA_KAWAI_LAYOUT
+        if num_territories <= self.SPRING_SIZE_MAX:
+            return SPRING_LAYOUT
+        return CONTINENT_LAYOUT
+
+    def close(self, game):
+        # Spin down visualization
+        if self.figure and self.interactive:
+            from matplotlib import pyplot
+            pyplot.close(self.ALL_WINDOWS)
+        self.figure = None
+        if self.root:
+            self.root.update_idletasks()
+            self.root.destroy()
+            self.root = None
+
+    def draw_risk_map(self, all_territories):
+        if self.interactive and not self.root:
+            self.open_window()
+        if self.layout is None:
+            self.position_risk_map(all_territories)
+        changed_names = self.update_risk_map(all_territories)
+        # Figure is created again if it has never been drawn or its window was closed
+        if not self.figure or (self.interactive and not self.figure_window_open()):
+            self.open_figure()
+        elif changed_names:
+            from matplotlib.colors import to_rgba
+            face_colors = self.node_artist.get_facecolor()
+            for name in changed_names:
+                index = self.node_indices[name]
+                face_colors[index] = to_rgba(self.node_colors[index])
+                self.label_artists[name].set_text(self.labels[name])
+            # Colors already converted to RGBA are taken as they are, without parsing every color again
+            self.node_artist.set_facecolor(face_colors)
+            if self.interactive:
+                self.figure.canvas.draw_idle()
+        if self.interactive:
+            self.figure.canvas.flush_events()
+            self.root.update()
+        else:
+            self.figure.canvas.draw()
+
+    def compute_layout(self, all_territories, algorithm):
+        import networkx
+        if algorithm == KAMADA_KAWAI_LAYOUT:
+            # Position nodes using a cost function based on path length
+            return networkx.kamada_kawai_layout(self.risk_map)
+        if algorithm == SPRING_LAYOUT:
+            return networkx.spring_layout(self.risk_map, iterations=self.SPRING_ITERATIONS, seed=self.LAYOUT_SEED)
+        if algorithm == CONTINENT_LAYOUT:
+            return self.continent_layout(all_territories)
+        raise Exception('{} is not a supported layout algorithm'.format(algorithm))
+
+    # Spreads continents out with a spring layout, then fills each continent in breadth-first order along a
+    # sunflower spiral around its center so that neighboring territories stay close together
+    def continent_layout(self, all_territories):
+        import networkx
+        continents = dict()
+        for territory in all_territories:
+            continents.setdefault(territory.continent, []).append(territory)
+        continent_map = networkx.Graph()
+        continent_map.add_nodes_from(continents)
+        for territory in all_territories:
+            for neighbor in territory.neighbors:
+                if neighbor.continent != territory.continent:
+                    continent_map.add_edge(territory.continent, neighbor.continent)
+        if len(continents) > 1:
+            centers = networkx.spring_layout(continent_map, iterations=self.SPRING_ITERATIONS, seed=self.LAYOUT_SEED)
+        else:
+            centers = {continent: numpy.zeros(2) for continent in continents}
+        layout = dict()
+        for continent, members in continents.items():
+            radius = self.CONTINENT_SPREAD * numpy.sqrt(len(members) / len(all_territories))
+            steps = numpy.arange(len(members))
+            distances = radius * numpy.sqrt((steps + 0.5) / len(members))
+            angles = steps * self.GOLDEN_ANGLE
+            positions = centers[continent] + numpy.stack((distances * numpy.cos(angles),
+                                                          distances * numpy.sin(angles)), axis=1)
+            for territory, position in zip(self.breadth_first_order(members), positions):
+                layout[territory.name] = position
+        return layout
+
+    def figure_window_open(self):
+        from matplotlib import pyplot
+        return pyplot.fignum_exists(self.figure.number)
+
+    def get_window_dimensions(self):
+        # Match window dimensions to aspect ratio of computer
+        return self.root.winfo_screenmmwidth() / 30, self.root.winfo_screenmmheight() / 40
+
+    def mark_changed(self, events):
+        if self.changed_territories is not None:
+            for event in events:
+                self.changed_territories[event.territory] = None
+
+    def open_figure(self):
+        import networkx
+        if self.interactive:
+            from matplotlib import pyplot
+            self.root.update_idletasks()
+            self.figure = pyplot.figure(num=self.title, figsize=self.window_dimensions)
+        else:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            self.figure = Figure(figsize=self.FIGURE_SIZE)
+            FigureCanvasAgg(self.figure)
+        axes = self.figure.gca()
+        networkx.draw_networkx_edges(self.risk_map, pos=self.layout, edge_color=self.EDGE_COLOR, ax=axes)
+        self.node_artist = networkx.draw_networkx_nodes(
+            self.risk_map,
+            pos=self.layout,
+            node_size=self.NODE_SIZE,
+            node_color=self.node_colors,
+            ax=axes,
+        )
+        self.label_artists = networkx.draw_networkx_labels(
+            self.risk_map,
+            pos=self.layout,
+            labels=self.labels,
+            font_size=self.FONT_SIZE,
+            font_weight=self.FONT_WEIGHT,
+            ax=axes,
+        )
+        axes.set_axis_off()
+        if self.interactive:
+            pyplot.show(block=False)
+
+    def open_window(self):
+        from tkinter import Tk
+        self.root = Tk()
+        self.root.withdraw()
+        self.window_dimensions = self.get_window_dimensions()
+
+    def layout_cache_path(self, all_territories, algorithm):
+        topology_hash = sha256(algorithm.encode('utf-8'))
+        for territory in all_territories:
+            topology_hash.update('{}|{}|{}\n'.format(
+                territory.name,
+                territory.continent,
+                '|'.join([n.name for n in territory.neighbors]),
+            ).encode('utf-8'))
+        return os.path.join(self.layout_cache_directory, topology_hash.hexdigest() + '.npy')
+
+    def position_risk_map(self, all_territories):
+        import networkx
+        self.risk_map = networkx.Graph()
+        for territory in all_territories:
+            # Include territory in map
+            self.risk_map.add_node(territory.name)
+            # Initiate with empty color
+            self.node_colors.append(self.EMPTY_NODE_COLOR)
+            # Label territory with name, army count, and occupying player
+            self.labels[territory.name] = '{}\n0 armies\n'.format(territory.name)
+            for neighbor in territory.neighbors:
+                self.risk_map.add_edge(territory.name, neighbor.name)
+        self.node_indices = {name: i for i, name in enumerate(self.risk_map.nodes)}
+        algorithm = self.choose_layout_algorithm(len(all_territories))
+        cache_path = None
+        if self.layout_cache_directory:
+            cache_path = self.layout_cache_path(all_territories, algorithm)
+            if os.path.exists(cache_path):
+                positions = numpy.load(cache_path)
+                self.layout = {territory.name: positions[i] for i, territory in enumerate(all_territories)}
+                return
+        self.layout = self.compute_layout(all_territories, algorithm)
+        if cache_path:
+            os.makedirs(self.layout_cache_directory, exist_ok=True)
+            # Saved under a temporary name and renamed so concurrent games never read a partial file
+            temporary_path = '{}.{}.tmp.npy'.format(cache_path[:-len('.npy')], os.getpid())
+            numpy.save(temporary_path, numpy.array([self.layout[t.name] for t in all_territories]))
+            os.replace(temporary_path, cache_path)
+
+    def refresh(self, game):
+        self.draw_risk_map(game.all_territories)
+
+    # Brings colors and labels up to date, returning the names of territories that changed since the last frame
+    def update_risk_map(self, all_territories):
+        changed_names = []
+        territories = all_territories if self.changed_territories is None else list(self.changed_territories)
+        self.changed_territories = dict()
+        for territory in territories:
+            occupier = '' if not territory.occupying_player else territory.occupying_player.name
+            state = (occupier, territory.occupying_armies)
+            if self.drawn_states.get(territory.name) == state:
+                continue
+            self.drawn_states[territory.name] = state
+            changed_names.append(territory.name)
+            # Change color to reflect occupation
+            node_color = self.player_colors[occupier] if occupier else self.EMPTY_NODE_COLOR
+            self.node_colors[self.node_indices[territory.name]] = node_color
+            army_tag = 'army' if territory.occupying_armies == 1 else 'armies'
+            # Label territory with name, army count, and occupying player
+            self.labels[territory.name] = '{}\n{} {}\n{}'.format(
+                territory.name,
+                territory.occupying_armies,
+                army_tag,
+                occupier,
+            )
+        return changed_names
+
+    @staticmethod
+    def breadth_first_order(members):
+        member_names = {territory.name for territory in members}
+        visited = set()
+        ordered = []
+        for start in members:
+            if start.name in visited:
+                continue
+            visited.add(start.name)
+            queue = deque([start])
+            while queue:
+                territory = queue.popleft()
+                ordered.append(territory)
+                for neighbor in territory.neighbors:
+                    if neighbor.name in member_names and neighbor.name not in visited:
+                        visited.add(neighbor.name)
+                        queue.append(neighbor)
+        return ordered
@@ -0,0 +1,297 @@
+from argparse import ArgumentParser
+import asyncio
+import json
+import os
+from tempfile import TemporaryDirectory
+
+from async_input import AsyncInputProvider
+from events import ArmiesChanged, OwnerChanged
+from game_of_risk import GameOfRisk
+from observers import GameObserver
+
+HOST = '127.0.0.1'
+PORT = 8765
+# Longest line a client can send, which bounds the size of maps
+LINE_SIZE_MAX = 1 << 20
+# Bytes waiting to be sent to a client before it is disconnected as too slow to keep up
+OUTPUT_BUFFER_MAX = 1 << 18
+# Answers a player can send ahead of the requests they answer
+ANSWER_QUEUE_MAX = 16
+SESSION_MAX = 10000
+TERRITORY_LIMIT = 1000
+# Seconds a game waits to be joined, or waits on a player for an answer, before it is abandoned
+IDLE_SECONDS = 600
+# Turns a game can last before it ends without a winner
+MAX_TURNS = 1000
+
+
+class Connection:
+    __slots__ = ('writer', 'session', 'player_name')
+
+    """
+    A connected client, which watches at most one session and can sit in for one of its human players.
+    Messages are written without waiting, and a client that lets more than OUTPUT_BUFFER_MAX bytes pile up
+    is disconnected, so slow clients cannot hold memory.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.session = None
+        self.player_name = None
+
+    def close(self):
+        if not self.writer.is_closing():
+            self.writer.close()
+
+    def send(self, message):
+        if self.writer.is_closing():
+            return
+        self.writer.write(json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n')
+        if self.writer.transport.get_write_buffer_size() > OUTPUT_BUFFER_MAX:
+            self.close()
+
+
+class Session(GameObserver, AsyncInputProvider):
+    """
+    One game hosted by the server. The game starts once every human player has a connection sitting in for
+    them, then narration, state updates and requests for decisions are sent to the connections watching it, and
+    answers from each player's connection are queued until the game asks for them. Games never joined, left
+    waiting on a player for IDLE_SECONDS or left with nobody watching are abandoned, and games end without a winner
+    after MAX_TURNS turns.
+    """
+
+    def __init__(self, server, session_id, game):
+        self.server = server
+        self.id = session_id
+        self.game = game
+        self.seats = {player.name: None for player in game.players if player.is_human}
+        self.watchers = set()
+        self.answers = {name: asyncio.Queue(ANSWER_QUEUE_MAX) for name in self.seats}
+        self.task = None
+        self.winner = None
+        self.expiry = asyncio.get_running_loop().call_later(IDLE_SECONDS, self.end, 'nobody joined in time')
+        game.add_observer(self)
+        game.journal.subscribe(self.send_changes, (ArmiesChanged, OwnerChanged))
+
+    def announce(self, message, pause):
+        self.broadcast({'type': 'message', 'text': message})
+
+    def answer(self, player_name, text):
+        self.answers[player_name].put_nowait(text)
+
+    def broadcast(self, message):
+        for connection in list(self.watchers):
+            connection.send(message)
+
+    def close(self, game):
+        if len(game.players) == 1:
+            self.winner = game.players[0].name
+
+    # Stops the game, if it is running, and lets every connection watching it go
+    def end(self, reason):
+        if self.task and not self.task.done() and self.task is not asyncio.current_task():
+            self.task.cancel()
+        self.expiry.cancel()
+        self.broadcast({'type': 'finished', 'game': self.id, 'winner': self.winner, 'reason': reason})
+        for connection in self.watchers:
+            connection.session = None
+            connection.player_name = None
+        self.watchers.clear()
+        self.server.sessions.pop(self.id, None)
+
+    def join(self, connection, player_name):
+        if connection.player_name is not None:
+            raise Exception('this connection is already playing as {}'.format(connection.player_name))
+        if player_name not in self.seats:
+            raise Exception('{} is not a human player in game {}'.format(player_name, self.id))
+        if self.seats[player_name] is not None:
+            raise Exception('{} has already been joined'.format(player_name))
+        self.seats[player_name] = connection
+        connection.player_name = player_name
+        self.watch(connection)
+        if all(self.seats.values()):
+            self.expiry.cancel()
+            self.task = asyncio.ensure_future(self.play())
+
+    # Lets the session know a connection went away, which abandons the game if it was sitting in for a player or
+    # was the last one watching
+    def leave(self, connection):
+        self.watchers.discard(connection)
+        if connection.player_name is not None:
+            self.end('{} left the game'.format(connection.player_name))
+        elif not self.watchers:
+            self.end('everyone left the game')
+
+    async def play(self):
+        try:
+            await self.game.play_async(self, MAX_TURNS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.end(str(e))
+            return
+        self.end('game over' if self.winner else 'no winner')
+
+    async def read(self, player, query):
+        # Changes are sent before every request, so players decide on the current state of the map
+        self.game.journal.flush()
+        self.seats[player.name].send({'type': 'request', 'query': query})
+        try:
+            return await asyncio.wait_for(self.answers[player.name].get(), IDLE_SECONDS)
+        except asyncio.TimeoutError:
+            raise Exception('{} did not answer in time'.format(player.name))
+
+    def send_changes(self, events):
+        territories = {event.territory.index: event.territory for event in events}
+        self.broadcast({
+            'type': 'update',
+            'territories': [territory_state(territory) for territory in territories.values()],
+        })
+
+    def watch(self, connection):
+        connection.session = self
+        self.watchers.add(connection)
+        connection.send({
+            'type': 'state',
+            'game': self.id,
+            'title': self.game.title,
+            'players': [player.name for player in self.game.board.players],
+            'waiting_for': [name for name, seat in self.seats.items() if seat is None],
+            'continents': [territory.continent for territory in self.game.all_territories],
+            'names': [territory.name for territory in self.game.all_territories],
+            'territories': [territory_state(territory) for territory in self.game.all_territories],
+        })
+
+    async def write(self, player, message):
+        self.seats[player.name].send({'type': 'message', 'text': message})
+
+
+class RiskServer:
+    """
+    Hosts many games at once for clients connected over TCP. Clients and server exchange one JSON object per
+    line, each with a type:
+
+    create    {"map": text of a game data file, "seed": optional} starts a session and watches it
+    join      {"game": id, "player": name of a human player} sits in for a player, starting the game once all
+              of its human players have joined
+    watch     {"game": id} receives a session's narration and updates without playing
+    answer    {"text": number} answers the last request sent to the player the connection sits in for
+
+    The server sends state (the whole map, on watching), update (owner and armies of changed territories),
+    message (narration), request (a question for the player, answered with answer), error and finished.
+    Games are headless and run on the server's event loop between the decisions of their players.
+    """
+
+    def __init__(self, session_max=SESSION_MAX, territory_limit=TERRITORY_LIMIT):
+        self.session_max = session_max
+        self.territory_limit = territory_limit
+        self.sessions = dict()
+        # Task handling each connection, so they can be waited on to finish when the server closes
+        self.connections = dict()
+        self.next_session_id = 0
+        self.server = None
+
+    async def close(self):
+        for session in list(self.sessions.values()):
+            session.end('server shut down')
+        if self.server:
+            self.server.close()
+        for connection in self.connections:
+            connection.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+        if self.server:
+            await self.server.wait_closed()
+
+    def create_session(self, connection, message):
+        if len(self.sessions) >= self.session_max:
+            raise Exception('the server is hosting as many games as it can')
+        with TemporaryDirectory() as directory:
+            map_path = os.path.join(directory, 'map.txt')
+            with open(map_path, 'w') as f:
+                f.write(message['map'])
+            game = GameOfRisk(map_path, headless=True, territory_limit=self.territory_limit, seed=message.get('seed'))
+        self.next_session_id += 1
+        session = Session(self, self.next_session_id, game)
+        self.sessions[session.id] = session
+        session.watch(connection)
+        # Games between computer players alone start right away
+        if not session.seats:
+            session.expiry.cancel()
+            session.task = asyncio.ensure_future(session.play())
+
+    # Session a message names, which the connection can only enter if it is in no other session
+    def find_session(self, connection, message):
+        session = self.sessions.get(message.get('game'))
+        if session is None:
+            raise Exception('there is no game {}'.format(message.get('game')))
+        if connection.session not in (None, session):
+            raise Exception('this connection is already in game {}'.format(connection.session.id))
+        return session
+
+    async def handle_connection(self, reader, writer):
+        connection = Connection(writer)
+        self.connections[connection] = asyncio.current_task()
+        try:
+            while not writer.is_closing():
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    connection.send({'type': 'error', 'message': 'line is longer than {} bytes'.format(LINE_SIZE_MAX)})
+                    break
+                if not line:
+                    break
+                try:
+                    self.handle_message(connection, json.loads(line))
+                except Exception as e:
+                    connection.send({'type': 'error', 'message': str(e)})
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.pop(connection, None)
+            if connection.session is not None:
+                connection.session.leave(connection)
+            connection.close()
+
+    def handle_message(self, connection, message):
+        message_type = message.get('type')
+        if message_type == 'create':
+            if connection.session is not None:
+                raise Exception('this connection is already in game {}'.format(connection.session.id))
+            self.create_session(connection, message)
+        elif message_type == 'join':
+            self.find_session(connection, message).join(connection, message.get('player'))
+        elif message_type == 'watch':
+            self.find_session(connection, message).watch(connection)
+        elif message_type == 'answer':
+            if connection.player_name is None:
+                raise Exception('this connection is not playing in a game')
+            try:
+                connection.session.answer(connection.player_name, str(message.get('text')))
+            except asyncio.QueueFull:
+                raise Exception('too many answers are waiting')
+        else:
+            raise Exception('{} is not a supported message type'.format(message_type))
+
+    async def start(self, host=HOST, port=PORT):
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=LINE_SIZE_MAX)
+        return self.server.sockets[0].getsockname()[1]
+
+
+# Owner and army count of a territory, with its index into the names of the state message
+def territory_state(territory):
+    occupier = territory.occupying_player.name if territory.occupying_player else None
+    return [territory.index, occupier, territory.occupying_armies]
+
+
+async def serve(host, port):
+    server = RiskServer()
+    await server.start(host, port)
+    await server.server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Host games of Risk for clients connecting over TCP.')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    arguments = parser.parse_args()
+    asyncio.run(serve(arguments.host, arguments.port))
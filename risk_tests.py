@@ -1,6 +1,318 @@
+import asyncio
+from functools import partial
+import json
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
 from unittest import mock, TestCase
 
+import numpy
+from PIL import Image
+
+from action_log import BATTLE, CLAIM, DRAW, load_action_log, PLACE, REINFORCE, TURN
+from async_input import AsyncInputProvider, INVALID_NUMBER_MESSAGE, NumberRequest, QueueInputProvider
+from battle import BattleOdds, loss_probabilities, net_armies_defeated, resolve_battles
+from benchmarks import compare, deal_territories, run_benchmarks
+from events import ArmiesChanged, ArmiesMoved, BattleResolved, OwnerChanged, PlayerEliminated
+from frame_export import export_frames, frame_boundaries, write_animation
 from game_of_risk import GameOfRisk
+from instrumentation import ATTACK_PHASE, FORTIFY_PHASE, Instrumentation, REINFORCE_PHASE, SETUP_PHASE
+from map_compiler import compiled_map_path, load_compiled_map, write_compiled_map
+from map_generator import CLUSTERED_TOPOLOGY, generate_territories, GRID_TOPOLOGY, map_lines, RANDOM_GEOMETRIC_TOPOLOGY
+from map_generator import SCALE_FREE_TOPOLOGY, TOPOLOGIES, write_map
+from monte_carlo import ATTACK_ROUTE, MonteCarloPlayer, route_indices, run_rollouts
+from moves import AttackStep, CollectReinforcements, ConquestMove, Reinforce
+from risk_server import RiskServer
+from risk_map import CONTINENT_LAYOUT, KAMADA_KAWAI_LAYOUT, RiskMapRenderer, SPRING_LAYOUT
+from shared_renderer import ProcessMapRenderer, SharedBoardState
+from tournament import play_game, run_tournament, summarize
+
+
+class ActionLogTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.game_file = 'test_games/world_war_2_all_computer.txt'
+        self.g = GameOfRisk(self.game_file, headless=True, seed=7)
+        self.g.play()
+
+    def test_seeded_games_repeat(self):
+        repeated_game = GameOfRisk(self.game_file, headless=True, seed=7)
+        repeated_game.play()
+        self.assertEqual(repeated_game.action_log.actions, self.g.action_log.actions)
+        self.assertEqual(repeated_game.players[0].name, self.g.players[0].name)
+
+    def test_replay(self):
+        with TemporaryDirectory() as directory:
+            path = '{}/game.json'.format(directory)
+            self.g.action_log.save(path, self.g.title)
+            action_log = load_action_log(path)
+        replayed_game = GameOfRisk(self.game_file, headless=True)
+        with mock.patch('game_of_risk.GameOfRisk.decide_battle') as decide_battle_mock:
+            replayed_game.replay(action_log)
+        decide_battle_mock.assert_not_called()
+        self.assertEqual(replayed_game.snapshot(), self.g.snapshot())
+        self.assertEqual(replayed_game.turns_played, self.g.turns_played)
+        self.assertEqual(replayed_game.action_log.actions, self.g.action_log.actions)
+        self.assertEqual([p.name for p in replayed_game.eliminated_players],
+                         [p.name for p in self.g.eliminated_players])
+
+    def test_compact(self):
+        codes = {action[0] for action in self.g.action_log}
+        self.assertTrue({BATTLE, CLAIM, DRAW, PLACE, REINFORCE, TURN} <= codes)
+        self.assertTrue(all(type(value) is int for action in self.g.action_log for value in action))
+
+
+class ScriptedInputProvider(AsyncInputProvider):
+    # Answers from a script in order, whichever player is asked, yielding to other games before each answer
+    def __init__(self, answers, name='', reads=None):
+        self.answers = list(answers)
+        self.name = name
+        self.reads = reads if reads is not None else []
+        self.messages = []
+
+    async def read(self, player, query):
+        await asyncio.sleep(0)
+        self.reads.append(self.name)
+        return self.answers.pop(0)
+
+    async def write(self, player, message):
+        self.messages.append(message)
+
+
+class AsyncInputTest(TestCase):
+    PLACEMENT_ANSWERS = ['0', '8', '11', '0', '6', '8', '1', '3', '5', '1', '2',
+                         '2', '1', '0', '2', '30', '0', '15', '4', '15', '3', '31']
+
+    def setUp(self):
+        super().setUp()
+        self.print_patch = mock.patch('builtins.print', side_effect=lambda s: None)
+        self.print_patch.start()
+        self.g = GameOfRisk('test_games/revolutionary_war_all_human.txt', headless=True)
+
+    def tearDown(self):
+        super().tearDown()
+        self.print_patch.stop()
+
+    def test_initial_army_placement(self):
+        provider = ScriptedInputProvider(self.PLACEMENT_ANSWERS)
+        asyncio.run(self.g.initial_army_placement_async(provider))
+        self.assertEqual(provider.answers, [])
+        massachusetts = self.g.all_territories[3]
+        self.assertEqual(massachusetts.occupying_player, self.g.players[0])
+        self.assertEqual(massachusetts.occupying_armies, 31)
+        # Territories to choose from are listed before the first claim
+        self.assertIn('[0] ', provider.messages[0])
+
+    def test_invalid_answers_asked_again(self):
+        provider = ScriptedInputProvider(['x', '-1', '12'] + self.PLACEMENT_ANSWERS)
+        asyncio.run(self.g.initial_army_placement_async(provider))
+        self.assertEqual(provider.answers, [])
+        self.assertEqual(provider.messages.count(INVALID_NUMBER_MESSAGE), 3)
+
+    def test_read_required(self):
+        with self.assertRaises(NotImplementedError):
+            asyncio.run(AsyncInputProvider().request_number(NumberRequest(self.g.players[0], 'Number: ', 3)))
+
+    def test_games_interleave(self):
+        reads = []
+        other_game = GameOfRisk('test_games/revolutionary_war_all_human.txt', headless=True)
+
+        async def play_both():
+            await asyncio.gather(
+                self.g.initial_army_placement_async(ScriptedInputProvider(self.PLACEMENT_ANSWERS, 'a', reads)),
+                other_game.initial_army_placement_async(ScriptedInputProvider(self.PLACEMENT_ANSWERS, 'b', reads)),
+            )
+        asyncio.run(play_both())
+        self.assertEqual(reads[:4], ['a', 'b', 'a', 'b'])
+        self.assertEqual([t.occupying_armies for t in self.g.all_territories],
+                         [t.occupying_armies for t in other_game.all_territories])
+
+    @mock.patch('game_of_risk.GameOfRisk.calculate_reinforcements')
+    @mock.patch('game_of_risk.GameOfRisk.decide_battle')
+    def test_answers_queued_for_each_player(self, decide_battle_mock, reinforcements_mock):
+        asyncio.run(self.g.initial_army_placement_async(ScriptedInputProvider(self.PLACEMENT_ANSWERS)))
+        decide_battle_mock.side_effect = [0]
+        reinforcements_mock.return_value = 3
+        america, france = self.g.players[:2]
+        provider = QueueInputProvider()
+        for answer in ['2', '3', '1', '0', '0', '3', '0', '0', '0']:
+            provider.answer(america.name, answer)
+        # France is asked how many armies to defend with during America's turn
+        provider.answer(france.name, '2')
+        asyncio.run(self.g.turn_async(america, provider))
+        self.assertEqual(self.g.all_territories[3].occupying_armies, 33)
+        self.assertEqual(self.g.all_territories[2].occupying_armies, 15)
+        self.assertEqual(len(provider.messages[france.name]), 1)
+
+
+class BattleTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.generator = numpy.random.default_rng(7)
+
+    def test_resolve_battles_losses(self):
+        battles = [(3, 2), (3, 1), (2, 2), (1, 2), (1, 1)] * 1000
+        losses = resolve_battles(battles, self.generator)
+        self.assertEqual(losses.shape, (5000, 2))
+        # Each pair loses exactly one army per compared die
+        self.assertEqual(losses.sum(axis=1).tolist(), [2, 1, 2, 1, 1] * 1000)
+
+    def test_resolve_battles_odds(self):
+        losses = resolve_battles(numpy.tile([3, 2], (100000, 1)), self.generator)
+        outcomes = net_armies_defeated(losses)
+        # Attacker takes out both defenders with probability 2890 / 7776 when rolling 3 dice against 2
+        self.assertAlmostEqual((outcomes == 2).mean(), 2890 / 7776, delta=0.01)
+        self.assertAlmostEqual((outcomes == -2).mean(), 2275 / 7776, delta=0.01)
+
+    def test_resolve_battles_invalid_count(self):
+        with self.assertRaises(Exception):
+            resolve_battles([(4, 2)], self.generator)
+
+
+class BattleOddsTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.odds = BattleOdds(army_limit=64)
+
+    def test_loss_probabilities(self):
+        outcomes = loss_probabilities(3, 2)
+        self.assertAlmostEqual(outcomes[(0, 2)], 2890 / 7776)
+        self.assertAlmostEqual(outcomes[(1, 1)], 2611 / 7776)
+        self.assertAlmostEqual(outcomes[(2, 0)], 2275 / 7776)
+
+    def test_conquest_probability_single_die(self):
+        self.assertAlmostEqual(self.odds.conquest_probability(2, 1), 15 / 36)
+
+    def test_conquest_probability_decided(self):
+        self.assertEqual(self.odds.conquest_probability(5, 0), 1.0)
+        self.assertEqual(self.odds.conquest_probability(1, 5), 0.0)
+
+    def test_conquest_probabilities(self):
+        attacking_counts = numpy.array([2, 5, 1, 200, 130, 3])
+        defending_counts = numpy.array([1, 0, 5, 100, 3, 77])
+        probabilities = self.odds.conquest_probabilities(attacking_counts, defending_counts)
+        self.assertEqual(probabilities.tolist(), [
+            self.odds.conquest_probability(a, d) for a, d in zip(attacking_counts.tolist(), defending_counts.tolist())
+        ])
+
+    def test_conquest_probabilities_decided(self):
+        probabilities = self.odds.conquest_probabilities(numpy.array([5, 1, 0]), numpy.array([0, 3, 0]))
+        self.assertEqual(probabilities.tolist(), [1.0, 0.0, 1.0])
+        self.assertIsNone(self.odds.win_probabilities)
+
+    def test_expected_remaining(self):
+        attackers, defenders = self.odds.expected_remaining(2, 1)
+        self.assertAlmostEqual(attackers, 1 + 15 / 36)
+        self.assertAlmostEqual(defenders, 21 / 36)
+
+    def test_table_bounded(self):
+        probability = self.odds.conquest_probability(200, 100)
+        self.assertEqual(self.odds.size, 64)
+        self.assertAlmostEqual(probability, self.odds.conquest_probability(64, 32))
+
+    def test_table_bounded_keeps_attackers(self):
+        self.assertGreater(self.odds.conquest_probability(2, 1000), 0)
+        self.assertGreater(self.odds.conquest_probabilities(numpy.array([3]), numpy.array([1000]))[0], 0)
+
+
+class BenchmarkTest(TestCase):
+    def test_deal_territories(self):
+        with TemporaryDirectory() as directory:
+            map_path = directory + '/grid.txt'
+            write_map(map_path, GRID_TOPOLOGY, 30)
+            game = GameOfRisk(map_path, headless=True, territory_limit=None)
+            deal_territories(game)
+        self.assertTrue(all(not territory.is_empty() for territory in game.all_territories))
+        self.assertTrue(all(player.controlled_territories for player in game.players))
+
+    def test_results(self):
+        benchmark_names = ['parse', 'turn', 'decide_battle']
+        report = run_benchmarks([20, 40], benchmark_names, min_seconds=0)
+        self.assertEqual(
+            [(result['benchmark'], result['territories']) for result in report['results']],
+            [(name, size) for size in [20, 40] for name in benchmark_names],
+        )
+        self.assertTrue(all(result['median_seconds'] > 0 for result in report['results']))
+
+    def test_size_limits(self):
+        report = run_benchmarks([20, 40], ['parse', 'turn'], size_limits={'turn': 20}, min_seconds=0)
+        self.assertEqual([(r['benchmark'], r['territories']) for r in report['results']],
+                         [('parse', 20), ('turn', 20), ('parse', 40)])
+
+    def test_compare(self):
+        baseline = {'results': [
+            {'benchmark': 'parse', 'territories': 50, 'median_seconds': 1.0},
+            {'benchmark': 'turn', 'territories': 50, 'median_seconds': 1.0},
+        ]}
+        results = [
+            {'benchmark': 'parse', 'territories': 50, 'median_seconds': 1.05},
+            {'benchmark': 'turn', 'territories': 50, 'median_seconds': 1.5},
+            {'benchmark': 'turn', 'territories': 1000, 'median_seconds': 9.0},
+        ]
+        comparison = compare(results, baseline, tolerance=0.1)
+        self.assertEqual([(c['benchmark'], c['regression']) for c in comparison], [('parse', False), ('turn', True)])
+
+
+class BoardTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.g = GameOfRisk('test_games/world_war_2_test.txt', headless=True)
+        self.board = self.g.board
+
+    def test_views_share_arrays(self):
+        roosevelt = self.g.players[0]
+        france = self.g.territory_index['France']
+        self.g.select_territory_initial(roosevelt, france, 3)
+        self.assertEqual(self.board.owners[france.index], roosevelt.id)
+        self.assertEqual(self.board.armies[france.index], 3)
+        self.board.armies[france.index] = 5
+        self.assertEqual(france.occupying_armies, 5)
+        self.assertEqual(france.controllers, [roosevelt])
+
+    def test_adjacency(self):
+        for territory in self.g.all_territories:
+            self.assertEqual(territory.continent, self.board.continent_names[self.board.continent_ids[territory.index]])
+            for neighbor in territory.neighbors:
+                self.assertIn(territory, neighbor.bordering)
+        self.assertIs(self.g.all_territories[0].neighbors[0], self.g.territory_index[
+            self.g.all_territories[0].neighbors[0].name
+        ])
+
+    @mock.patch('game_of_risk.GameOfRisk.determine_card_match')
+    def test_continent_bonus(self, card_match_mock):
+        card_match_mock.return_value = 0
+        g = GameOfRisk('test_games/world_war_2_test.txt', headless=True, continent_bonuses={'Asia': 7, 'Europe': 5})
+        stalin, hirohito = g.players[4], g.players[5]
+        asia = [territory for territory in g.all_territories if territory.continent == 'Asia']
+        for territory in asia:
+            g.select_territory_initial(stalin, territory, 1)
+        self.assertIs(g.board.continent_holder(g.board.continent_index['Asia']), stalin)
+        self.assertEqual(g.calculate_reinforcements(stalin), len(asia) // 3 + 7)
+        g.board.set_continent_bonuses({'Asia': 2})
+        self.assertEqual(g.board.continent_bonus_totals[stalin.id], 2)
+        asia[0].occupying_player = hirohito
+        self.assertIsNone(g.board.continent_holder(asia[0].continent_id))
+        self.assertEqual(g.board.continent_bonus_totals[stalin.id], 0)
+        with self.assertRaises(Exception):
+            g.board.set_continent_bonuses({'Africa': 3})
+
+    def test_totals_kept_up_to_date(self):
+        g = GameOfRisk('test_games/world_war_2_all_computer.txt', headless=True, seed=4,
+                       continent_bonuses={'Asia': 7, 'Europe': 5})
+        g.play(max_turns=20)
+        board = g.board
+        totals = (board.territory_totals[:], board.army_totals[:], [c[:] for c in board.continent_counts],
+                  board.continent_holders[:], board.continent_bonus_totals[:])
+        board.recount_totals()
+        self.assertEqual(totals, (board.territory_totals, board.army_totals, board.continent_counts,
+                                  board.continent_holders, board.continent_bonus_totals))
+        for player in board.players:
+            self.assertEqual(board.territory_totals[player.id], len(player.controlled_territories))
+        clone = g.clone()
+        self.assertEqual(clone.board.army_totals, board.army_totals)
+        self.assertEqual(clone.board.continent_bonus_totals, board.continent_bonus_totals)
 
 
 class ComputerPlayerTest(TestCase):
@@ -65,6 +377,31 @@ class ComputerPlayerTest(TestCase):
         attack_route = self.stalin.choose_attack_route([self.switzerland], 3)
         self.assertEqual(attack_route, (self.switzerland.neighbors[2], self.switzerland))
 
+    def test_choose_attack_route_single_army(self):
+        self.switzerland.occupying_player = self.hirohito
+        self.switzerland.occupying_armies = 1
+        for neighbor in self.switzerland.neighbors:
+            neighbor.occupying_player = self.stalin
+            neighbor.occupying_armies = 1
+        attack_route = self.stalin.choose_attack_route([self.switzerland], 0)
+        self.assertIsNone(attack_route)
+
+    def test_choose_attack_route_equal_odds(self):
+        self.switzerland.occupying_player = self.hirohito
+        self.switzerland.occupying_armies = 1
+        for neighbor in self.switzerland.neighbors:
+            neighbor.occupying_player = self.stalin
+            neighbor.occupying_armies = 4
+        attack_route = self.stalin.choose_attack_route([self.korea, self.switzerland], 0)
+        self.assertEqual(attack_route, (self.switzerland.neighbors[0], self.switzerland))
+
+    def test_continue_battle(self):
+        self.switzerland.occupying_armies = 6
+        self.italy.occupying_armies = 2
+        self.assertTrue(self.stalin.continue_battle(self.switzerland, self.italy))
+        self.italy.occupying_armies = 8
+        self.assertFalse(self.stalin.continue_battle(self.switzerland, self.italy))
+
     def test_choose_fortify_route_no_connection(self):
         self.switzerland.occupying_armies = 1
         self.korea.occupying_player = self.stalin
@@ -186,6 +523,191 @@ class ComputerPlayerTest(TestCase):
         self.assertEqual(fewest_neighbor_territory, self.switzerland)
 
 
+class ControlledTerritoriesTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.g = GameOfRisk('test_games/world_war_2_test.txt', headless=True)
+        self.roosevelt = self.g.players[0]
+        self.roosevelt.controlled_territories = self.g.all_territories[:5]
+
+    def test_order_kept_after_remove(self):
+        self.roosevelt.controlled_territories.remove(self.g.all_territories[1])
+        self.roosevelt.controlled_territories.append(self.g.all_territories[1])
+        self.assertEqual([t.name for t in self.roosevelt.controlled_territories],
+                         ['Great Britain', 'Belgium', 'Netherlands', 'Norway', 'France'])
+        self.assertEqual(self.roosevelt.controlled_territories[-1], self.g.all_territories[1])
+        self.assertEqual(self.roosevelt.controlled_territories.index(self.g.all_territories[3]), 2)
+
+    def test_insert_at_old_position(self):
+        controlled_territories = self.roosevelt.controlled_territories
+        position = controlled_territories.position(self.g.all_territories[2])
+        controlled_territories.remove(self.g.all_territories[2])
+        controlled_territories.append(self.g.all_territories[6])
+        controlled_territories.insert(self.g.all_territories[2], position)
+        self.assertEqual(controlled_territories[:], self.g.all_territories[:5] + [self.g.all_territories[6]])
+        self.assertEqual(controlled_territories.index(self.g.all_territories[6]), 5)
+        self.assertEqual(controlled_territories[2], self.g.all_territories[2])
+
+    def test_membership(self):
+        self.assertIn(self.g.all_territories[4], self.roosevelt.controlled_territories)
+        self.assertNotIn(self.g.all_territories[5], self.roosevelt.controlled_territories)
+        with self.assertRaises(ValueError):
+            self.roosevelt.controlled_territories.remove(self.g.all_territories[5])
+
+
+class EventJournalTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.g = GameOfRisk('test_games/world_war_2_test.txt', headless=True)
+        self.roosevelt = self.g.players[0]
+        self.churchill = self.g.players[1]
+        self.great_britain = self.g.all_territories[0]
+        self.france = self.g.all_territories[1]
+        self.batches = []
+        self.g.journal.subscribe(self.batches.append)
+
+    def test_unsubscribed_types_not_recorded(self):
+        self.g.journal.unsubscribe(self.batches.append)
+        self.g.change_armies(self.france, 2)
+        self.assertEqual(self.g.journal.pending, [])
+
+    def test_events_batched_until_flush(self):
+        self.g.select_territory_initial(self.roosevelt, self.great_britain, 3)
+        self.g.select_territory_initial(self.churchill, self.france, 1)
+        self.assertEqual(self.batches, [])
+        self.g.journal.flush()
+        self.assertEqual(self.batches, [[
+            ArmiesChanged(self.great_britain, 3),
+            OwnerChanged(self.great_britain, None, self.roosevelt),
+            ArmiesChanged(self.france, 1),
+            OwnerChanged(self.france, None, self.churchill),
+        ]])
+
+    @mock.patch('builtins.print')
+    @mock.patch('game_of_risk.GameOfRisk.decide_battle')
+    def test_conquest_events(self, decide_battle_mock, print_mock):
+        decide_battle_mock.return_value = 1
+        self.g.select_territory_initial(self.roosevelt, self.great_britain, 3)
+        self.g.select_territory_initial(self.churchill, self.france, 1)
+        self.g.journal.flush()
+        moves = []
+        self.g.journal.subscribe(moves.append, (ArmiesMoved, PlayerEliminated))
+        self.g.attack_territory(self.great_britain, self.france, 2, 1)
+        self.g.draw_risk_map()
+        self.assertEqual(self.batches[-1], [
+            BattleResolved(self.great_britain, self.france, 1),
+            ArmiesChanged(self.france, -1),
+            ArmiesChanged(self.great_britain, -2),
+            ArmiesChanged(self.france, 2),
+            ArmiesMoved(self.great_britain, self.france, 2),
+            OwnerChanged(self.france, self.churchill, self.roosevelt),
+            PlayerEliminated(self.churchill),
+        ])
+        self.assertEqual(moves, [[ArmiesMoved(self.great_britain, self.france, 2), PlayerEliminated(self.churchill)]])
+
+    def test_flushed_every_turn(self):
+        g = GameOfRisk('test_games/world_war_2_all_computer.txt', headless=True, seed=2)
+        batches = []
+        g.journal.subscribe(batches.append)
+        g.initial_army_placement()
+        g.turn(g.players[0])
+        self.assertEqual(g.journal.pending, [])
+        self.assertTrue(batches)
+
+
+class FrameExportTest(TestCase):
+    def test_frame_boundaries(self):
+        actions = [(CLAIM, 0, 0, 1), (TURN, 0), (REINFORCE, 0, 1), (TURN, 1), (REINFORCE, 1, 1)]
+        self.assertEqual(frame_boundaries(actions), [1, 3, 5])
+        self.assertEqual(frame_boundaries([]), [0])
+
+    def test_export(self):
+        game = GameOfRisk('test_games/world_war_2_all_computer.txt', headless=True, seed=3)
+        game.play(max_turns=3)
+        with TemporaryDirectory() as directory:
+            paths = export_frames('test_games/world_war_2_all_computer.txt', game.action_log, directory, processes=2,
+                                  layout_cache_directory=None)
+            self.assertEqual([os.path.basename(path) for path in paths],
+                             ['frame_00000.png', 'frame_00001.png', 'frame_00002.png', 'frame_00003.png'])
+            write_animation(paths, os.path.join(directory, 'recap.gif'))
+            with Image.open(os.path.join(directory, 'recap.gif')) as animation:
+                self.assertEqual(animation.n_frames, 4)
+
+
+class FrontierTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.g = GameOfRisk('test_games/world_war_2_all_computer.txt', headless=True)
+        self.mismatches = []
+
+    def check_frontiers(self):
+        for player in self.g.players + self.g.eliminated_players:
+            if (self.g.get_territories_for_attack(player) != self.scan_frontier(player, attack=True) or
+               self.g.get_territories_to_fortify(player) != self.scan_frontier(player, attack=False)):
+                self.mismatches.append(player.name)
+
+    # Full scan of every controlled territory, as the frontier is meant to avoid
+    @staticmethod
+    def scan_frontier(player, attack):
+        targets = []
+        for territory in player.controlled_territories:
+            if territory.occupying_armies > 1:
+                for neighbor in territory.neighbors:
+                    if (neighbor.occupying_player != player) == attack and neighbor not in targets:
+                        targets.append(neighbor)
+        return targets
+
+    def test_frontier_matches_scan_during_game(self):
+        with mock.patch.object(self.g, 'draw_risk_map', side_effect=self.check_frontiers):
+            self.g.play()
+        self.check_frontiers()
+        self.assertEqual(self.mismatches, [])
+
+    def test_reassigned_territories(self):
+        self.g.initial_army_placement()
+        player = self.g.players[0]
+        self.assertNotEqual(self.g.get_territories_for_attack(player), [])
+        player.controlled_territories = []
+        self.assertEqual(self.g.get_territories_for_attack(player), [])
+        self.assertEqual(self.g.get_territories_to_fortify(player), [])
+
+
+class HeadlessGameTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.g = GameOfRisk('test_games/world_war_2_all_computer.txt', headless=True)
+
+    def test_no_observers(self):
+        self.assertEqual(self.g.observers, [])
+
+    @mock.patch('observers.sleep')
+    @mock.patch('builtins.print')
+    def test_play_silently(self, print_mock, sleep_mock):
+        self.g.play()
+        self.assertEqual(len(self.g.players), 1)
+        self.assertEqual(len(self.g.eliminated_players), 3)
+        print_mock.assert_not_called()
+        sleep_mock.assert_not_called()
+
+    def test_visualization_not_imported(self):
+        script = '; '.join([
+            'import sys',
+            'from game_of_risk import GameOfRisk',
+            'GameOfRisk("test_games/world_war_2_all_computer.txt", headless=True, seed=0).play()',
+            'print(sorted({"matplotlib", "networkx", "tkinter"} & set(sys.modules)))',
+        ])
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '[]')
+
+    def test_observer_receives_narration(self):
+        observer = mock.Mock()
+        self.g.add_observer(observer)
+        self.g.print_slow('Hello')
+        self.g.draw_risk_map()
+        observer.announce.assert_called_once_with('Hello', True)
+        observer.refresh.assert_called_once_with(self.g)
+
+
 class InputUtilitiesTest(TestCase):
     def setUp(self):
         super().setUp()
@@ -210,6 +732,505 @@ class InputUtilitiesTest(TestCase):
         self.assertEqual(input_num, 4)
 
 
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.instrumentation = Instrumentation()
+        self.g = GameOfRisk('test_games/world_war_2_all_computer.txt', headless=True, seed=4,
+                            instrumentation=self.instrumentation)
+        self.g.play(max_turns=30)
+        self.measurements = self.instrumentation.as_dict()
+
+    def test_phases(self):
+        phases = self.measurements['phases']
+        self.assertEqual(phases[SETUP_PHASE]['count'], 1)
+        self.assertEqual(phases[REINFORCE_PHASE]['count'], self.g.turns_played)
+        self.assertEqual(phases[ATTACK_PHASE]['count'], self.g.turns_played)
+        self.assertLessEqual(phases[FORTIFY_PHASE]['count'], self.g.turns_played)
+        self.assertTrue(all(phase['wall_seconds'] > 0 for phase in phases.values()))
+        self.assertIsNone(self.instrumentation.phase)
+
+    def test_counters(self):
+        battles = [action for action in self.g.action_log if action[0] == BATTLE]
+        counters = self.measurements['counters']
+        self.assertEqual(counters['turns'], self.g.turns_played)
+        self.assertEqual(counters['battles'], len(battles))
+        self.assertEqual(counters['rolls'], sum(action[3] + action[4] for action in battles))
+        self.assertGreater(counters['conquests'], 0)
+
+    def test_decisions(self):
+        decisions = self.measurements['decisions']
+        self.assertEqual(decisions['claim_territory']['count'], len(self.g.all_territories))
+        self.assertEqual(decisions['initial_reinforcements']['count'], 4)
+        self.assertGreaterEqual(decisions['choose_attack_route']['count'], self.g.turns_played)
+        for decision in decisions.values():
+            self.assertEqual(sum(count for _, count in decision['buckets']), decision['count'])
+
+    def test_prometheus_text(self):
+        lines = self.instrumentation.prometheus_text().splitlines()
+        self.assertIn('# TYPE risk_decision_seconds histogram', lines)
+        self.assertIn('risk_turns_total {}'.format(self.g.turns_played), lines)
+        self.assertIn('risk_phases_total{{phase="reinforce"}} {}'.format(self.g.turns_played), lines)
+        self.assertIn('risk_decision_seconds_bucket{{decision="claim_territory",le="+Inf"}} {}'.format(
+            len(self.g.all_territories),
+        ), lines)
+
+    def test_disabled(self):
+        self.assertIsNone(self.g.clone().instrumentation)
+        game = GameOfRisk('test_games/world_war_2_all_computer.txt', headless=True, seed=4)
+        game.play(max_turns=30)
+        self.assertEqual(list(game.action_log), list(self.g.action_log))
+
+
+class MapCompilerTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = TemporaryDirectory()
+        self.compiled_map = GameOfRisk.compile_map('test_games/world_war_2_test.txt', self.cache.name)
+
+    def tearDown(self):
+        super().tearDown()
+        del self.compiled_map
+        self.cache.cleanup()
+
+    def test_compiled_game_matches_text_game(self):
+        compiled_game = GameOfRisk(self.compiled_map, headless=True)
+        text_game = GameOfRisk('test_games/world_war_2_test.txt', headless=True)
+        self.assertEqual(str(compiled_game), str(text_game))
+        self.assertEqual(compiled_game.player_colors, text_game.player_colors)
+        self.assertEqual(compiled_game.one_sided_neighbors, text_game.one_sided_neighbors)
+        self.assertEqual([p.is_human for p in compiled_game.players], [p.is_human for p in text_game.players])
+
+    def test_loaded_lazily(self):
+        board = GameOfRisk(self.compiled_map, headless=True).board
+        self.assertTrue(numpy.shares_memory(numpy.frombuffer(board.neighbor_targets, dtype=numpy.int32),
+                                            self.compiled_map.neighbor_targets))
+        self.assertEqual(board.territories.views.count(None), 35)
+        self.assertEqual(board.territories[-1].name, 'New Guinea')
+        self.assertIs(board.territory_index['New Guinea'], board.territories[34])
+        self.assertEqual(board.names.names.count(None), 0)
+
+    def test_neighbor_indices(self):
+        names = self.compiled_map.territory_names()
+        self.assertEqual(len(self.compiled_map), 35)
+        self.assertEqual([names[i] for i in self.compiled_map.neighbor_indices(0)],
+                         ['France', 'Belgium', 'Netherlands', 'Norway'])
+
+    def test_written_after_elimination(self):
+        game = GameOfRisk('test_games/world_war_2_test.txt', headless=True)
+        game.eliminated_players.append(game.players.pop(0))
+        map_path = '{}/midgame.riskmap'.format(self.cache.name)
+        write_compiled_map(game, map_path)
+        compiled_game = GameOfRisk(load_compiled_map(map_path), headless=True)
+        self.assertEqual([p.name for p in compiled_game.board.players], [p.name for p in game.board.players])
+
+    @mock.patch('game_of_risk.write_compiled_map')
+    def test_cached_by_content(self, write_mock):
+        compiled_map = GameOfRisk.compile_map('test_games/world_war_2_test.txt', self.cache.name)
+        write_mock.assert_not_called()
+        self.assertEqual(compiled_map.path, compiled_map_path('test_games/world_war_2_test.txt', self.cache.name))
+        self.assertNotEqual(compiled_map.path, compiled_map_path('test_games/world_war_2_all_computer.txt',
+                                                                 self.cache.name))
+
+
+class MapGeneratorTest(TestCase):
+    def test_loads(self):
+        for topology in TOPOLOGIES:
+            for num_territories in [2, 7, 300]:
+                with TemporaryDirectory() as directory:
+                    map_path = directory + '/map.txt'
+                    write_map(map_path, topology, num_territories, humans=1, computers=2)
+                    game = GameOfRisk(map_path, headless=True, territory_limit=None, strict_neighbors=True)
+                self.assertEqual(len(game.all_territories), num_territories)
+                self.assertTrue(all(territory.neighbors for territory in game.all_territories))
+                self.assertEqual([player.is_human for player in game.players], [True, False, False])
+
+    def test_grid(self):
+        territories = list(generate_territories(GRID_TOPOLOGY, 30, continent_size=4))
+        # 6 by 6 grid with the last row empty, in continents of 2 by 2
+        self.assertEqual(territories[0], (0, [1, 6]))
+        self.assertEqual(territories[7], (0, [1, 6, 8, 13]))
+        self.assertEqual(territories[8], (1, [2, 7, 9, 14]))
+        self.assertEqual(territories[29], (8, [23, 28]))
+        territories = list(generate_territories(GRID_TOPOLOGY, 30, mean_degree=8))
+        self.assertEqual(len(territories[7][1]), 8)
+
+    def test_mean_degree(self):
+        for topology in [CLUSTERED_TOPOLOGY, RANDOM_GEOMETRIC_TOPOLOGY, SCALE_FREE_TOPOLOGY]:
+            for mean_degree in [4, 8]:
+                degrees = [len(n) for _, n in generate_territories(topology, 5000, mean_degree)]
+                self.assertAlmostEqual(numpy.mean(degrees), mean_degree, delta=mean_degree * 0.15)
+
+    def test_scale_free_hubs(self):
+        degrees = [len(n) for _, n in generate_territories(SCALE_FREE_TOPOLOGY, 5000)]
+        grid_degrees = [len(n) for _, n in generate_territories(RANDOM_GEOMETRIC_TOPOLOGY, 5000)]
+        self.assertGreater(max(degrees), 5 * max(grid_degrees))
+
+    def test_continent_size(self):
+        for topology in TOPOLOGIES:
+            continents = [continent for continent, _ in generate_territories(topology, 10000, continent_size=400)]
+            self.assertAlmostEqual(len(set(continents)), 25, delta=5)
+
+    def test_repeatable(self):
+        for topology in TOPOLOGIES:
+            self.assertEqual(list(map_lines(topology, 500, seed=3)), list(map_lines(topology, 500, seed=3)))
+        self.assertNotEqual(list(map_lines(SCALE_FREE_TOPOLOGY, 500, seed=3)),
+                            list(map_lines(SCALE_FREE_TOPOLOGY, 500, seed=4)))
+
+    def test_streamed(self):
+        lines = map_lines(CLUSTERED_TOPOLOGY, 10 ** 6)
+        self.assertEqual([next(lines) for _ in range(3)][1:], ['0\n', '4|Red|Blue|Green|Yellow\n'])
+        self.assertTrue(next(lines).startswith('T0|C0|T1|'))
+
+    def test_invalid(self):
+        with self.assertRaises(Exception):
+            list(map_lines(GRID_TOPOLOGY, 1))
+        with self.assertRaises(Exception):
+            list(map_lines('ring', 10))
+        with self.assertRaises(Exception):
+            list(map_lines(GRID_TOPOLOGY, 10, humans=3, computers=4))
+
+
+class MapLoaderTest(TestCase):
+    def test_duplicate_neighbors(self):
+        g = GameOfRisk('test_games/revolutionary_war_duplicate_neighbors.txt', headless=True)
+        maine = g.territory_index['Maine']
+        georgia = g.territory_index['Georgia']
+        self.assertEqual([t.name for t in maine.neighbors], ['New Hampshire'])
+        self.assertEqual([t.name for t in georgia.neighbors], ['South Carolina'])
+        self.assertEqual(len(g.all_territories), 14)
+
+    def test_one_sided_neighbors(self):
+        g = GameOfRisk('test_games/world_war_2_test.txt', headless=True)
+        self.assertEqual(sorted(g.one_sided_neighbors), [('Manchuria', 'Japan'), ('Mongolia', 'USSR')])
+
+    def test_strict_neighbors(self):
+        with self.assertRaises(Exception):
+            GameOfRisk('test_games/world_war_2_test.txt', headless=True, strict_neighbors=True)
+
+    def test_territory_limit(self):
+        with self.assertRaises(Exception):
+            GameOfRisk('test_games/world_war_2_test.txt', headless=True, territory_limit=34)
+        g = GameOfRisk('test_games/world_war_2_test.txt', headless=True, territory_limit=35)
+        self.assertEqual(len(g.all_territories), 35)
+
+
+class MonteCarloPlayerTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.game_file = 'test_games/world_war_2_all_computer.txt'
+
+    def play(self, time_budget_ms):
+        g = GameOfRisk(self.game_file, headless=True, seed=3, computer_player_types={
+            'Stalin': partial(MonteCarloPlayer, time_budget_ms=time_budget_ms, rollout_turns=1),
+        })
+        g.play()
+        return g
+
+    def test_no_budget_plays_as_computer_player(self):
+        g = self.play(0)
+        computer_game = GameOfRisk(self.game_file, headless=True, seed=3)
+        computer_game.play()
+        self.assertIsInstance(g.board.players[2], MonteCarloPlayer)
+        self.assertEqual([p.name for p in g.eliminated_players], [p.name for p in computer_game.eliminated_players])
+        self.assertEqual(g.players[0].name, computer_game.players[0].name)
+
+    def test_search_leaves_game_unchanged(self):
+        g = GameOfRisk(self.game_file, headless=True, computer_player_types={
+            'Stalin': partial(MonteCarloPlayer, time_budget_ms=20),
+        })
+        g.initial_army_placement()
+        stalin = g.players[2]
+        snapshot_before = g.snapshot()
+        territories_for_attack = g.get_territories_for_attack(stalin)
+        attack_route = stalin.choose_attack_route(territories_for_attack, 5)
+        self.assertIn(attack_route[1] if attack_route else None, territories_for_attack + [None])
+        self.assertIn(stalin.choose_fortify_route(), [None] + [
+            (t, n) for t in stalin.controlled_territories for n in t.neighbors if n.occupying_player == stalin
+        ])
+        self.assertEqual(g.snapshot(), snapshot_before)
+
+    def test_workers_shut_down(self):
+        g = GameOfRisk(self.game_file, headless=True, seed=3, computer_player_types={
+            'Stalin': partial(MonteCarloPlayer, time_budget_ms=5, processes=2, rollout_turns=1),
+        })
+        g.play(1)
+        self.assertIsNone(g.board.players[2].executor)
+
+    def test_run_rollouts(self):
+        g = GameOfRisk(self.game_file, headless=True)
+        g.initial_army_placement()
+        player = g.players[0]
+        reinforcements = g.apply_move(CollectReinforcements(player))
+        attack_route = player.choose_attack_route(g.get_territories_for_attack(player), reinforcements)
+        candidates = [route_indices(attack_route), None]
+        snapshot_before = g.snapshot()
+        visits, totals = run_rollouts(g, player.id, (ATTACK_ROUTE, reinforcements), candidates,
+                                      perf_counter() + 0.05, 2)
+        self.assertTrue(all(visits > 0))
+        self.assertTrue(all((totals >= 0) & (totals <= visits)))
+        self.assertEqual(g.snapshot(), snapshot_before)
+
+    def test_play_game(self):
+        g = self.play(1)
+        self.assertEqual(len(g.players), 1)
+
+
+class MovesTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.g = GameOfRisk('test_games/world_war_2_all_computer.txt', headless=True)
+        self.g.initial_army_placement()
+        self.roosevelt = self.g.players[0]
+
+    def state(self):
+        return self.g.snapshot(), [
+            (self.g.get_territories_for_attack(p), self.g.get_territories_to_fortify(p)) for p in self.g.board.players
+        ]
+
+    def attack_until_conquest(self):
+        attacking_territory = max(self.roosevelt.controlled_territories, key=lambda t: t.occupying_armies)
+        defending_territory = self.g.get_territories_for_attack(self.roosevelt)[0]
+        if defending_territory not in attacking_territory.neighbors:
+            defending_territory = [n for n in attacking_territory.neighbors if n.occupying_player != self.roosevelt][0]
+        self.g.apply_move(Reinforce(attacking_territory, 20))
+        while defending_territory.occupying_player != self.roosevelt:
+            self.g.apply_move(AttackStep(attacking_territory, defending_territory, 3, 1, 1))
+        return attacking_territory, defending_territory
+
+    def test_undo_conquest(self):
+        state_before = self.state()
+        actions_before = list(self.g.action_log.actions)
+        attacking_territory, defending_territory = self.attack_until_conquest()
+        self.g.apply_move(ConquestMove(attacking_territory, defending_territory, 5))
+        self.assertEqual(defending_territory.occupying_armies, 8)
+        while self.g.undo_stack:
+            self.g.undo_move()
+        self.assertEqual(self.state(), state_before)
+        self.assertEqual(self.g.action_log.actions, actions_before)
+
+    def test_undo_card_trade(self):
+        self.roosevelt.cards = [2, 2]
+        deck_before = list(self.g.card_deck.cards)
+        with mock.patch.object(self.g.card_deck, 'draw', return_value=2):
+            self.assertEqual(self.g.apply_move(CollectReinforcements(self.roosevelt)), 3 + self.g.INITIAL_CARD_TRADE)
+        self.assertEqual(self.g.armies_for_card_trade, self.g.INITIAL_CARD_TRADE + self.g.CARD_TRADE_INCREMENT)
+        self.g.undo_move()
+        self.assertEqual(self.roosevelt.cards, [2, 2])
+        self.assertEqual(self.g.card_deck.cards, deck_before)
+        self.assertEqual(self.g.armies_for_card_trade, self.g.INITIAL_CARD_TRADE)
+
+    def test_undo_elimination(self):
+        stalin = self.g.players[2]
+        stalin.controlled_territories = stalin.controlled_territories[:1]
+        defending_territory = stalin.controlled_territories[0]
+        attacking_territory = defending_territory.neighbors[0]
+        attacking_player = attacking_territory.occupying_player
+        attacking_territory.occupying_player = self.roosevelt
+        self.roosevelt.controlled_territories.append(attacking_territory)
+        attacking_player.controlled_territories.remove(attacking_territory)
+        state_before = self.state()
+        self.g.apply_move(Reinforce(attacking_territory, 50))
+        while stalin in self.g.players:
+            self.g.apply_move(AttackStep(attacking_territory, defending_territory, 3, 1, 1))
+        self.assertEqual(self.g.eliminated_players, [stalin])
+        while self.g.undo_stack:
+            self.g.undo_move()
+        self.assertEqual(self.state(), state_before)
+        self.assertEqual(self.g.eliminated_players, [])
+
+    def test_restore_snapshot(self):
+        state_before = self.state()
+        for player in list(self.g.players):
+            self.g.turn(player)
+        self.assertNotEqual(self.state(), state_before)
+        self.g.restore(state_before[0])
+        self.assertEqual(self.state(), state_before)
+
+    def test_clone(self):
+        clone = self.g.clone()
+        self.assertEqual(clone.snapshot(), self.g.snapshot())
+        self.assertEqual([p.name for p in clone.players], [p.name for p in self.g.players])
+        snapshot_before = self.g.snapshot()
+        for player in list(clone.players):
+            clone.turn(player)
+        self.assertNotEqual(clone.snapshot(), snapshot_before)
+        self.assertEqual(self.g.snapshot(), snapshot_before)
+
+
+class RiskMapRendererTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = TemporaryDirectory()
+        self.g = GameOfRisk('test_games/world_war_2_test.txt', headless=True)
+
+    def tearDown(self):
+        super().tearDown()
+        self.cache.cleanup()
+
+    def test_choose_layout_algorithm(self):
+        renderer = RiskMapRenderer(self.g)
+        self.assertEqual(renderer.choose_layout_algorithm(35), KAMADA_KAWAI_LAYOUT)
+        self.assertEqual(renderer.choose_layout_algorithm(500), SPRING_LAYOUT)
+        self.assertEqual(renderer.choose_layout_algorithm(100000), CONTINENT_LAYOUT)
+
+    def test_continent_layout(self):
+        renderer = RiskMapRenderer(self.g, layout_algorithm=CONTINENT_LAYOUT, layout_cache_directory=None)
+        renderer.position_risk_map(self.g.all_territories)
+        self.assertEqual(set(renderer.layout), {t.name for t in self.g.all_territories})
+        positions = numpy.array(list(renderer.layout.values()))
+        self.assertEqual(len(numpy.unique(positions, axis=0)), 35)
+
+    @mock.patch('matplotlib.pyplot.show')
+    @mock.patch('tkinter.Tk')
+    def test_incremental_redraw(self, tk_mock, show_mock):
+        from matplotlib.colors import to_rgba
+        tk_mock.return_value.winfo_screenmmwidth.return_value = 300
+        tk_mock.return_value.winfo_screenmmheight.return_value = 200
+        renderer = RiskMapRenderer(self.g, layout_algorithm=SPRING_LAYOUT, layout_cache_directory=None)
+        renderer.draw_risk_map(self.g.all_territories)
+        figure = renderer.figure
+        france = self.g.all_territories[1]
+        self.g.select_territory_initial(self.g.players[0], france, 3)
+        self.g.journal.flush()
+        self.assertEqual(list(renderer.changed_territories), [france])
+        with mock.patch.object(renderer.label_artists['Great Britain'], 'set_text') as unchanged_mock:
+            renderer.draw_risk_map(self.g.all_territories)
+            unchanged_mock.assert_not_called()
+        self.assertIs(renderer.figure, figure)
+        self.assertEqual(renderer.label_artists['France'].get_text(), 'France\n3 armies\nRoosevelt')
+        self.assertEqual(tuple(renderer.node_artist.get_facecolor()[renderer.node_indices['France']]),
+                         to_rgba(self.g.player_colors['Roosevelt']))
+        self.assertEqual(renderer.update_risk_map(self.g.all_territories), [])
+        renderer.close(self.g)
+
+    def test_layout_cached(self):
+        renderer = RiskMapRenderer(self.g, layout_algorithm=SPRING_LAYOUT, layout_cache_directory=self.cache.name)
+        renderer.position_risk_map(self.g.all_territories)
+        cached_renderer = RiskMapRenderer(self.g, layout_algorithm=SPRING_LAYOUT,
+                                          layout_cache_directory=self.cache.name)
+        with mock.patch.object(cached_renderer, 'compute_layout') as compute_mock:
+            cached_renderer.position_risk_map(self.g.all_territories)
+            compute_mock.assert_not_called()
+        for name, position in renderer.layout.items():
+            self.assertTrue(numpy.allclose(cached_renderer.layout[name], position))
+
+
+class RiskServerTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        with open('test_games/revolutionary_war_all_human.txt', 'r') as f:
+            lines = f.read().split('\n')
+        # America is played by a client, France and Great Britain by the server
+        self.human_map = '\n'.join(['Revolutionary War', '1|America', '2|France|Great Britain'] + lines[3:])
+        with open('test_games/world_war_2_all_computer.txt', 'r') as f:
+            self.computer_map = f.read()
+
+    def run_with_server(self, client, **server_options):
+        async def run():
+            server = RiskServer(**server_options)
+            port = await server.start(port=0)
+            try:
+                return await asyncio.wait_for(client(server, port), 30)
+            finally:
+                await server.close()
+        return asyncio.run(run())
+
+    @staticmethod
+    async def connect(port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        def send(**message):
+            writer.write((json.dumps(message) + '\n').encode('utf-8'))
+
+        async def receive(message_type=None):
+            while True:
+                message = json.loads(await reader.readline())
+                if message_type is None or message['type'] == message_type:
+                    return message
+        return send, receive, writer
+
+    def test_computer_game(self):
+        async def client(server, port):
+            send, receive, _ = await self.connect(port)
+            send(type='create', map=self.computer_map, seed=3)
+            messages = [await receive()]
+            while messages[-1]['type'] != 'finished':
+                messages.append(await receive())
+            return messages
+        messages = self.run_with_server(client)
+        self.assertEqual(messages[0]['type'], 'state')
+        self.assertEqual(len(messages[0]['names']), len(messages[0]['territories']))
+        self.assertIn('update', {message['type'] for message in messages})
+        self.assertEqual(messages[-1]['reason'], 'game over')
+        self.assertIn(messages[-1]['winner'], messages[0]['players'])
+
+    def test_unwatched_game_ended(self):
+        async def client(server, port):
+            send, receive, writer = await self.connect(port)
+            send(type='create', map=self.computer_map, seed=3)
+            await receive('update')
+            session = next(iter(server.sessions.values()))
+            writer.close()
+            while server.sessions:
+                await asyncio.sleep(0.01)
+            return session
+        session = self.run_with_server(client)
+        self.assertIsNone(session.winner)
+        self.assertTrue(session.task.cancelled())
+
+    def test_answers_routed_to_game(self):
+        async def client(server, port):
+            send, receive, _ = await self.connect(port)
+            send(type='create', map=self.human_map, seed=3)
+            state = await receive('state')
+            self.assertEqual(state['waiting_for'], ['America'])
+            player_send, player_receive, player_writer = await self.connect(port)
+            player_send(type='join', game=state['game'], player='America')
+            await player_receive('state')
+            request = await player_receive('request')
+            self.assertIn('Select the number of the territory to claim', request['query'])
+            player_send(type='answer', text='99')
+            await player_receive('request')
+            player_send(type='answer', text='0')
+            update = await receive('update')
+            claimed = [territory for territory in update['territories'] if territory[1] == 'America']
+            self.assertEqual(claimed, [[0, 'America', 1]])
+            await player_receive('request')
+            # Game is abandoned when a player leaves
+            player_writer.close()
+            return await receive('finished')
+        finished = self.run_with_server(client)
+        self.assertEqual(finished['reason'], 'America left the game')
+
+    def test_errors(self):
+        async def client(server, port):
+            send, receive, _ = await self.connect(port)
+            errors = []
+            for message in [dict(type='join', game=5, player='America'), dict(type='answer', text='1'),
+                            dict(type='dance'), dict(type='create', map='Nothing')]:
+                send(**message)
+                errors.append((await receive('error'))['message'])
+            send(type='create', map=self.human_map)
+            state = await receive('state')
+            send(type='join', game=state['game'], player='France')
+            errors.append((await receive('error'))['message'])
+            other_send, other_receive, _ = await self.connect(port)
+            other_send(type='create', map=self.human_map)
+            errors.append((await other_receive('error'))['message'])
+            return errors
+        errors = self.run_with_server(client, session_max=1)
+        self.assertEqual(errors[:3], [
+            'there is no game 5',
+            'this connection is not playing in a game',
+            'dance is not a supported message type',
+        ])
+        self.assertEqual(errors[4:], [
+            'France is not a human player in game 1',
+            'the server is hosting as many games as it can',
+        ])
+
+
 class RevolutionaryWarAllHumanTest(TestCase):
     def setUp(self):
         super().setUp()
@@ -252,26 +1273,24 @@ class RevolutionaryWarAllHumanTest(TestCase):
         self.assertEqual(self.virginia.occupying_armies, 32)
 
     @mock.patch('game_of_risk.GameOfRisk.calculate_reinforcements')
-    @mock.patch('game_of_risk.GameOfRisk.roll_dice')
+    @mock.patch('game_of_risk.GameOfRisk.decide_battle')
     @mock.patch('builtins.input')
-    def test_turn_single_attack_no_fortify(self, input_mock, roll_dice_mock, reinforcements_mock):
+    def test_turn_single_attack_no_fortify(self, input_mock, decide_battle_mock, reinforcements_mock):
         input_mock.side_effect = ['2', '3', '1', '0', '0', '3', '2', '0', '0', '0']
-        roll_dice_mock.side_effect = [[5, 3, 1], [5, 2]]
+        decide_battle_mock.side_effect = [0]
         reinforcements_mock.return_value = 3
         self.g.turn(self.america)
         self.assertEqual(self.massachusetts.occupying_armies, 33)
         self.assertEqual(self.new_york.occupying_armies, 15)
 
     @mock.patch('game_of_risk.GameOfRisk.calculate_reinforcements')
-    @mock.patch('game_of_risk.GameOfRisk.roll_dice')
+    @mock.patch('game_of_risk.GameOfRisk.decide_battle')
     @mock.patch('builtins.input')
-    def test_turn_full_attack_with_fortify(self, input_mock, roll_dice_mock, reinforcements_mock):
+    def test_turn_full_attack_with_fortify(self, input_mock, decide_battle_mock, reinforcements_mock):
         input_mock.side_effect = ['3', '3', '1', '0', '0', '3', '2', '1', '3', '2', '1', '3', '2',
                                   '1', '3', '2', '1', '3', '2', '1', '3', '2', '1', '3', '2', '1',
                                   '3', '2', '10', '0', '1', '0', '0', '2']
-        roll_dice_mock.side_effect = [[6, 5, 4], [1, 2], [6, 5, 4], [1, 2], [6, 5, 4], [1, 2],
-                                      [6, 5, 4], [1, 2], [6, 5, 4], [1, 2], [6, 5, 4], [1, 2],
-                                      [6, 5, 4], [1, 2], [6, 5, 4], [1, 2]]
+        decide_battle_mock.side_effect = [2] * 8
         reinforcements_mock.return_value = 3
         self.g.turn(self.great_britain)
         self.assertEqual(self.virginia.occupying_armies, 20)
@@ -280,11 +1299,11 @@ class RevolutionaryWarAllHumanTest(TestCase):
 
     @mock.patch('game_of_risk.GameOfRisk.print_battle_report')
     @mock.patch('game_of_risk.GameOfRisk.calculate_reinforcements')
-    @mock.patch('game_of_risk.GameOfRisk.roll_dice')
+    @mock.patch('game_of_risk.GameOfRisk.decide_battle')
     @mock.patch('builtins.input')
-    def test_turn_victory(self, input_mock, roll_dice_mock, reinforcements_mock, battle_report_mock):
+    def test_turn_victory(self, input_mock, decide_battle_mock, reinforcements_mock, battle_report_mock):
         input_mock.side_effect = ['0', '3', '1', '0', '0', '1', '1']
-        roll_dice_mock.side_effect = [[3], [1]]
+        decide_battle_mock.side_effect = [1]
         reinforcements_mock.return_value = 3
         self.g.players.remove(self.great_britain)
         self.g.eliminated_players.append(self.great_britain)
@@ -304,6 +1323,80 @@ class RevolutionaryWarAllHumanTest(TestCase):
         battle_report_mock.assert_not_called()
 
 
+class SharedRendererTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.game = GameOfRisk('test_games/world_war_2_all_computer.txt', headless=True)
+        deal_territories(self.game)
+
+    def test_read_published_state(self):
+        shared_state = SharedBoardState(len(self.game.all_territories))
+        attached_state = SharedBoardState(len(self.game.all_territories), name=shared_state.memory.name)
+        try:
+            owners = numpy.frombuffer(self.game.board.owners, dtype=numpy.int32)
+            armies = numpy.frombuffer(self.game.board.armies, dtype=numpy.int32)
+            shared_state.publish(owners, armies)
+            read_owners = numpy.zeros_like(owners)
+            read_armies = numpy.zeros_like(armies)
+            self.assertEqual(attached_state.read(read_owners, read_armies), 2)
+            self.assertEqual(read_owners.tolist(), owners.tolist())
+            self.assertEqual(read_armies.tolist(), armies.tolist())
+        finally:
+            attached_state.close()
+            shared_state.close()
+            shared_state.unlink()
+
+    def test_renderer_process(self):
+        renderer = ProcessMapRenderer(frame_rate=100, interactive=False)
+        self.game.add_observer(renderer)
+        for territory in self.game.all_territories:
+            territory.occupying_armies += 1
+            renderer.refresh(self.game)
+        process = renderer.process
+        renderer.close(self.game)
+        self.assertEqual(process.exitcode, 0)
+        self.assertIsNone(renderer.shared_state)
+
+
+class TournamentTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.game_file = 'test_games/world_war_2_all_computer.txt'
+
+    def test_seats_rotated(self):
+        results = run_tournament(self.game_file, 4, processes=1)
+        self.assertEqual([result.seat_order[0] for result in results], ['Roosevelt', 'Churchill', 'Stalin', 'Hirohito'])
+        self.assertEqual(len({result.seed for result in results}), 4)
+
+    def test_repeatable(self):
+        results = run_tournament(self.game_file, 2, processes=1, seed=5)
+        repeated_results = run_tournament(self.game_file, 2, processes=2, seed=5)
+        self.assertEqual([r._replace(seconds=0) for r in results], [r._replace(seconds=0) for r in repeated_results])
+
+    def test_summarize(self):
+        summary = summarize(run_tournament(self.game_file, 4, processes=1))
+        self.assertEqual(summary['games'], 4)
+        self.assertEqual(sum(p['wins'] for p in summary['players'].values()) + summary['unfinished'], 4)
+        for statistics in summary['players'].values():
+            self.assertEqual(statistics['games'], 4)
+            self.assertEqual(sum(statistics['wins_by_seat']), statistics['wins'])
+
+    def test_summarize_no_games(self):
+        summary = summarize(run_tournament(self.game_file, 0, processes=1))
+        self.assertEqual(summary['games'], 0)
+        self.assertEqual(summary['players'], {})
+        self.assertIsNone(summary['turns'])
+
+    def test_turn_limit(self):
+        result = play_game(self.game_file, 0, 0, max_turns=2)
+        self.assertEqual(result.turns, 2)
+        self.assertIsNone(result.winner)
+
+    def test_human_players_rejected(self):
+        with self.assertRaises(Exception):
+            play_game('test_games/world_war_2_test.txt', 0, 0)
+
+
 class WorldWar2Test(TestCase):
     def setUp(self):
         super().setUp()
@@ -333,6 +1426,14 @@ class WorldWar2Test(TestCase):
         self.france.occupying_player = france_player
         self.france.occupying_armies = france_count
 
+    # Makes every die rolled by the next block of battles come up as given
+    def fix_dice(self, attack_rolls, defend_rolls):
+        self.g.generator = mock.Mock()
+        self.g.generator.integers.side_effect = [
+            numpy.tile(attack_rolls + [1] * (3 - len(attack_rolls)), (GameOfRisk.BATTLE_BLOCK, 1)),
+            numpy.tile(defend_rolls + [1] * (2 - len(defend_rolls)), (GameOfRisk.BATTLE_BLOCK, 1)),
+        ]
+
     def test_constructor(self):
         correct = 'World War II\nPlaying: Roosevelt, Churchill, Hitler, Mussolini, Stalin, ' \
                   'Hirohito\nEliminated: \nTerritories:\nGreat Britain, Europe --> France, ' \
@@ -421,33 +1522,28 @@ class WorldWar2Test(TestCase):
         reinforcements = self.g.calculate_reinforcements(self.roosevelt)
         self.assertEqual(reinforcements, 6)
 
-    @mock.patch('game_of_risk.GameOfRisk.roll_dice')
-    def test_decide_battle_tie(self, roll_dice_mock):
-        roll_dice_mock.return_value = [5, 4]
+    def test_decide_battle_tie(self):
+        self.fix_dice([5, 4], [5, 4])
         armies_defeated = self.g.decide_battle(2, 2)
         self.assertEqual(armies_defeated, -2)
 
-    @mock.patch('game_of_risk.GameOfRisk.roll_dice')
-    def test_decide_battle_attack_win_2(self, roll_dice_mock):
-        roll_dice_mock.side_effect = [[6, 5, 4], [3, 2]]
+    def test_decide_battle_attack_win_2(self):
+        self.fix_dice([6, 5, 4], [3, 2])
         armies_defeated = self.g.decide_battle(3, 2)
         self.assertEqual(armies_defeated, 2)
 
-    @mock.patch('game_of_risk.GameOfRisk.roll_dice')
-    def test_decide_battle_attack_win_1(self, roll_dice_mock):
-        roll_dice_mock.side_effect = [[6, 5, 4], [2]]
+    def test_decide_battle_attack_win_1(self):
+        self.fix_dice([6, 5, 4], [2])
         armies_defeated = self.g.decide_battle(3, 1)
         self.assertEqual(armies_defeated, 1)
 
-    @mock.patch('game_of_risk.GameOfRisk.roll_dice')
-    def test_decide_battle_defense_win_2(self, roll_dice_mock):
-        roll_dice_mock.side_effect = [[2, 1], [3, 2]]
+    def test_decide_battle_defense_win_2(self):
+        self.fix_dice([2, 1], [3, 2])
         armies_defeated = self.g.decide_battle(2, 2)
         self.assertEqual(armies_defeated, -2)
 
-    @mock.patch('game_of_risk.GameOfRisk.roll_dice')
-    def test_decide_battle_defense_win_1(self, roll_dice_mock):
-        roll_dice_mock.side_effect = [[1], [3, 2]]
+    def test_decide_battle_defense_win_1(self):
+        self.fix_dice([1], [3, 2])
         armies_defeated = self.g.decide_battle(1, 2)
         self.assertEqual(armies_defeated, -1)
 
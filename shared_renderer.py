@@ -0,0 +1,153 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+from tempfile import TemporaryDirectory
+import time
+
+import numpy
+
+from map_compiler import load_compiled_map, write_compiled_map
+from observers import GameObserver
+
+FRAME_RATE = 10
+# Seconds to wait for the renderer process to draw its last frame and exit once the game is over
+CLOSE_TIMEOUT = 10
+
+
+class SharedBoardState:
+    """
+    Owners and army counts of every territory in shared memory, laid out as a sequence number followed by the
+    owner array and the army array, all of which can be read by another process without copying the board.
+    The sequence number is odd while a new state is being written, so a reader that sees it odd or changed
+    after copying the arrays copies them again, and never sees half of one state and half of another.
+    """
+
+    def __init__(self, num_territories, name=None):
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=8 + 8 * num_territories)
+        self.sequence = numpy.ndarray(1, dtype=numpy.int64, buffer=self.memory.buf)
+        self.owners = numpy.ndarray(num_territories, dtype=numpy.int32, buffer=self.memory.buf, offset=8)
+        self.armies = numpy.ndarray(num_territories, dtype=numpy.int32, buffer=self.memory.buf,
+                                    offset=8 + 4 * num_territories)
+
+    def close(self):
+        # Views into the shared memory have to be let go before it can be closed
+        self.sequence = self.owners = self.armies = None
+        self.memory.close()
+
+    def publish(self, owners, armies):
+        self.sequence[0] += 1
+        self.owners[:] = owners
+        self.armies[:] = armies
+        self.sequence[0] += 1
+
+    # Copies the latest complete state into owners and armies, returning its sequence number
+    def read(self, owners, armies):
+        while True:
+            sequence = int(self.sequence[0])
+            if sequence % 2 == 1:
+                time.sleep(0)
+                continue
+            owners[:] = self.owners
+            armies[:] = self.armies
+            if int(self.sequence[0]) == sequence:
+                return sequence
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+class ProcessMapRenderer(GameObserver):
+    """
+    Draws the map in a separate process, so the game never waits on matplotlib. Each refresh only copies the
+    owner and army arrays of the board into shared memory, and the renderer process draws whatever state is
+    latest at up to frame_rate frames per second, skipping any states published in between. The renderer
+    process loads the map from a compiled copy written when the game is first drawn and draws it with a
+    RiskMapRenderer, in a window or offscreen when interactive is False.
+    """
+
+    def __init__(self, frame_rate=FRAME_RATE, interactive=True, **renderer_options):
+        self.frame_seconds = 1 / frame_rate
+        self.interactive = interactive
+        self.renderer_options = renderer_options
+        self.shared_state = None
+        self.process = None
+        self.stop_event = None
+        self.directory = None
+
+    def close(self, game):
+        if self.process is None:
+            return
+        self.publish(game)
+        self.stop_event.set()
+        self.process.join(CLOSE_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+        self.shared_state.close()
+        self.shared_state.unlink()
+        self.shared_state = None
+        self.directory.cleanup()
+
+    def publish(self, game):
+        self.shared_state.publish(
+            numpy.frombuffer(game.board.owners, dtype=numpy.int32),
+            numpy.frombuffer(game.board.armies, dtype=numpy.int32),
+        )
+
+    def refresh(self, game):
+        if self.process is None:
+            self.start(game)
+        self.publish(game)
+
+    def start(self, game):
+        self.directory = TemporaryDirectory()
+        map_path = os.path.join(self.directory.name, 'map.riskmap')
+        write_compiled_map(game, map_path)
+        self.shared_state = SharedBoardState(len(game.all_territories))
+        # Spawned rather than forked, since graphical libraries do not survive being forked
+        context = multiprocessing.get_context('spawn')
+        self.stop_event = context.Event()
+        self.process = context.Process(
+            target=run_renderer,
+            args=(map_path, self.shared_state.memory.name, self.stop_event, self.frame_seconds, self.interactive,
+                  self.renderer_options),
+            daemon=True,
+        )
+        self.process.start()
+
+
+# Body of the renderer process, which redraws territories that changed since the last frame until the game
+# is over, then draws the final state
+def run_renderer(map_path, memory_name, stop_event, frame_seconds, interactive, renderer_options):
+    from game_of_risk import GameOfRisk
+    from risk_map import RiskMapRenderer
+    game = GameOfRisk(load_compiled_map(map_path), headless=True, territory_limit=None)
+    renderer = RiskMapRenderer(game, interactive=interactive, **renderer_options)
+    shared_state = SharedBoardState(len(game.all_territories), name=memory_name)
+    owners = numpy.frombuffer(game.board.owners, dtype=numpy.int32)
+    armies = numpy.frombuffer(game.board.armies, dtype=numpy.int32)
+    latest_owners = owners.copy()
+    latest_armies = armies.copy()
+    drawn_sequence = 0
+    try:
+        while True:
+            frame_start = time.perf_counter()
+            game_over = stop_event.is_set()
+            sequence = shared_state.read(latest_owners, latest_armies)
+            if sequence != drawn_sequence:
+                changed = numpy.flatnonzero((latest_owners != owners) | (latest_armies != armies))
+                owners[:] = latest_owners
+                armies[:] = latest_armies
+                if renderer.changed_territories is not None:
+                    renderer.changed_territories = {game.all_territories[i]: None for i in changed.tolist()}
+                renderer.draw_risk_map(game.all_territories)
+                drawn_sequence = sequence
+            elif renderer.root:
+                renderer.root.update()
+            if game_over:
+                break
+            time.sleep(max(frame_seconds - (time.perf_counter() - frame_start), 0))
+    finally:
+        renderer.close(game)
+        shared_state.close()
@@ -0,0 +1,119 @@
+from argparse import ArgumentParser
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import json
+from statistics import mean, median
+from time import perf_counter
+
+import numpy
+
+from game_of_risk import GameOfRisk
+from monte_carlo import MonteCarloPlayer
+
+MAX_TURNS = 1000
+
+# Outcome of one game, with no winner when the game reached the turn limit
+GameResult = namedtuple('GameResult', ['seed', 'seat_order', 'winner', 'turns', 'elimination_order', 'seconds'])
+
+
+# Plays one headless game between computer players, with turn order rotated by rotation seats
+def play_game(game_file, seed, rotation, computer_player_types=None, max_turns=MAX_TURNS):
+    game = GameOfRisk(game_file, headless=True, territory_limit=None, computer_player_types=computer_player_types,
+                      seed=seed)
+    if any(player.is_human for player in game.players):
+        raise Exception('tournaments can only be played between computer players')
+    rotation %= len(game.players)
+    game.players = game.players[rotation:] + game.players[:rotation]
+    seat_order = [player.name for player in game.players]
+    start = perf_counter()
+    game.play(max_turns)
+    seconds = perf_counter() - start
+    return GameResult(
+        seed=seed,
+        seat_order=seat_order,
+        winner=game.players[0].name if len(game.players) == 1 else None,
+        turns=game.turns_played,
+        elimination_order=[player.name for player in game.eliminated_players],
+        seconds=seconds,
+    )
+
+
+# Plays num_games games on a pool of processes, each with its own seed drawn from seed and with the seats rotated
+# by one from the game before, so every player starts from every seat equally often
+def run_tournament(game_file, num_games, computer_player_types=None, processes=None, seed=0, max_turns=MAX_TURNS):
+    seeds = [int(s.generate_state(1)[0]) for s in numpy.random.SeedSequence(seed).spawn(num_games)]
+    if processes == 1:
+        return [play_game(game_file, seeds[i], i, computer_player_types, max_turns) for i in range(num_games)]
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [
+            executor.submit(play_game, game_file, seeds[i], i, computer_player_types, max_turns)
+            for i in range(num_games)
+        ]
+        return [future.result() for future in futures]
+
+
+# Aggregates results into win rates, finishing places, game lengths and elimination order for each player
+def summarize(results):
+    player_names = sorted({name for result in results for name in result.seat_order})
+    num_seats = len(player_names)
+    players = {
+        name: {
+            'games': 0,
+            'wins': 0,
+            'wins_by_seat': [0] * num_seats,
+            'eliminated_by_order': [0] * (num_seats - 1),
+            'places': [],
+        }
+        for name in player_names
+    }
+    for result in results:
+        for seat, name in enumerate(result.seat_order):
+            players[name]['games'] += 1
+            if name == result.winner:
+                players[name]['wins'] += 1
+                players[name]['wins_by_seat'][seat] += 1
+        # Players eliminated last finish closest to the winner
+        for order, name in enumerate(result.elimination_order):
+            players[name]['eliminated_by_order'][order] += 1
+            players[name]['places'].append(len(result.seat_order) - order)
+        if result.winner:
+            players[result.winner]['places'].append(1)
+    for statistics in players.values():
+        statistics['win_rate'] = statistics['wins'] / statistics['games']
+        places = statistics.pop('places')
+        statistics['mean_place'] = mean(places) if places else None
+    turns = [result.turns for result in results]
+    # No game lengths to report when no games were played
+    turn_statistics = None
+    if turns:
+        turn_statistics = {'mean': mean(turns), 'median': median(turns), 'min': min(turns), 'max': max(turns)}
+    return {
+        'games': len(results),
+        'unfinished': sum(1 for result in results if result.winner is None),
+        'players': players,
+        'turns': turn_statistics,
+        'seconds': sum(result.seconds for result in results),
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Play computer players against each other and report how each fared.')
+    parser.add_argument('game_file')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-turns', type=int, default=MAX_TURNS)
+    parser.add_argument('--search', action='append', default=[], metavar='PLAYER',
+                        help='computer player to replace with a MonteCarloPlayer, can be given more than once')
+    parser.add_argument('--time-budget-ms', type=int, default=MonteCarloPlayer.TIME_BUDGET_MS)
+    arguments = parser.parse_args()
+    search_player = partial(MonteCarloPlayer, time_budget_ms=arguments.time_budget_ms)
+    print(json.dumps(summarize(run_tournament(
+        arguments.game_file,
+        arguments.games,
+        computer_player_types={name: search_player for name in arguments.search},
+        processes=arguments.processes,
+        seed=arguments.seed,
+        max_turns=arguments.max_turns,
+    )), indent=2))